@@ -1,24 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy import delete
 from sqlalchemy.orm import Session
 from . import database, models, schemas
 from typing import List, Optional
-from .core.crew_stub import CrewAgent
+from .runtime import runtime_agents
+from .security import RequestContext, agent_context, get_user_from_auth
+from .memory import conversation_memory
+from .persistence import message_writer
+from .shared_state import shared_state
 
 router = APIRouter(tags=['agents'])
 
-# in-memory agent runtime instances (per process)
-runtime_agents = {}
-
-def get_user_from_auth(authorization: Optional[str], db: Session):
-    from .utils import decode_access_token
-    if not authorization:
-        return None
-    token = authorization.split(' ',1)[1] if authorization.lower().startswith('bearer ') else authorization
-    email = decode_access_token(token)
-    if not email:
-        return None
-    return db.query(models.User).filter(models.User.email == email).first()
-
 @router.post('/create', response_model=schemas.AgentOut)
 def create_agent(config: schemas.AgentCreate, authorization: Optional[str] = Header(None), db: Session = Depends(database.get_db)):
     user = get_user_from_auth(authorization, db)
@@ -43,23 +35,13 @@ def create_agent(config: schemas.AgentCreate, authorization: Optional[str] = Hea
         top_k=config.top_k,
         api_key=(config.api_key or '').strip() or None,
         provider=(config.provider or 'openai').lower(),
+        coalesce_requests=config.coalesce_requests,
         owner_id=user.id
     )
     db.add(agent); db.commit(); db.refresh(agent)
 
     # create runtime instance
-    runtime_agents[agent.id] = CrewAgent(
-        agent.name,
-        role=agent.role,
-        goal=agent.goal,
-        model=agent.model_name,
-        temperature=agent.temperature or 0.7,
-        max_tokens=agent.max_tokens or 1024,
-        top_p=agent.top_p,
-        top_k=agent.top_k,
-        api_key=agent.api_key,
-        provider=agent.provider
-    )
+    runtime_agents.get_or_create(agent)
     return agent
 
 @router.get('/list', response_model=List[schemas.AgentOut])
@@ -70,14 +52,16 @@ def list_agents(authorization: Optional[str] = Header(None), db: Session = Depen
     return db.query(models.Agent).filter(models.Agent.owner_id == user.id).all()
 
 @router.delete('/{agent_id}')
-def delete_agent(agent_id: int, authorization: Optional[str] = Header(None), db: Session = Depends(database.get_db)):
-    user = get_user_from_auth(authorization, db)
-    if not user:
-        raise HTTPException(status_code=401, detail='Invalid token')
-    agent = db.query(models.Agent).filter(models.Agent.id == agent_id, models.Agent.owner_id == user.id).first()
-    if not agent:
-        raise HTTPException(status_code=404, detail='Agent not found')
+def delete_agent(context: RequestContext = Depends(agent_context), db: Session = Depends(database.get_db)):
+    agent_id = context.agent.id
     # remove runtime instance if exists
-    runtime_agents.pop(agent.id, None)
-    db.delete(agent); db.commit()
+    runtime_agents.discard(agent_id)
+    conversation_memory.discard(agent_id)
+    shared_state.publish('agent.discard', {'agent_id': agent_id})
+    # queued messages must land before their agent's chats are deleted
+    message_writer.flush()
+    # Bulk deletes: neither the agent nor its chats need loading
+    db.execute(delete(models.ChatMessage).where(models.ChatMessage.agent_id == agent_id))
+    db.execute(delete(models.Agent).where(models.Agent.id == agent_id, models.Agent.owner_id == context.user.id))
+    db.commit()
     return {'message':'deleted'}
@@ -1,4 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from . import schemas, models, utils, database
 from fastapi.security import OAuth2PasswordRequestForm
@@ -6,20 +8,52 @@ from fastapi import Body
 
 router = APIRouter(tags=['auth'])
 
+def _find_user(db: Session, email: str, username: str = None):
+    query = db.query(models.User)
+    if username is None:
+        user = query.filter(models.User.email == email).first()
+    else:
+        user = query.filter((models.User.email == email)|(models.User.username == username)).first()
+    # Hand the pooled connection back; the session otherwise keeps it while bcrypt runs
+    db.close()
+    return user
+
+def _create_user(db: Session, user: schemas.UserCreate, hashed: str):
+    u = models.User(username=user.username, email=user.email, password=hashed)
+    db.add(u)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Registered by another request while this one was hashing
+        db.rollback()
+        return None
+    db.refresh(u)
+    return u
+
+async def _password_job(job):
+    try:
+        return await job
+    except utils.PasswordHashBusyError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={'Retry-After': '1'})
+
+# Database work runs in the threadpool and bcrypt on its own pool, so a burst
+# of logins cannot starve the threads that chat requests use. No connection is
+# held while a password is hashed or checked.
 @router.post('/register', response_model=schemas.UserOut)
-def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    existing = db.query(models.User).filter((models.User.email == user.email)|(models.User.username == user.username)).first()
+async def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+    existing = await run_in_threadpool(_find_user, db, user.email, user.username)
     if existing:
         raise HTTPException(status_code=400, detail='User already exists')
-    hashed = utils.hash_password(user.password)
-    u = models.User(username=user.username, email=user.email, password=hashed)
-    db.add(u); db.commit(); db.refresh(u)
-    return u
+    hashed = await _password_job(utils.ahash_password(user.password))
+    created = await run_in_threadpool(_create_user, db, user, hashed)
+    if created is None:
+        raise HTTPException(status_code=400, detail='User already exists')
+    return created
 
 @router.post('/login', response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not utils.verify_password(form_data.password, user.password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+    user = await run_in_threadpool(_find_user, db, form_data.username)
+    if not user or not await _password_job(utils.averify_password(form_data.password, user.password)):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid credentials')
     token = utils.create_access_token(user.email)
     return {'access_token': token, 'token_type': 'bearer'}
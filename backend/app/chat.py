@@ -1,160 +1,274 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Header
+from fastapi import APIRouter, Depends, HTTPException, Body, Header, Query
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
 from . import database, models, schemas
-from .agents import runtime_agents
-from typing import List
-from .core.crew_stub import CrewAgent
-import json
-import time
+from .runtime import runtime_agents
+from .security import RequestContext, agent_context, get_user_from_auth
+from .memory import conversation_memory
+from .persistence import message_writer
+from typing import List, Optional
+from .sse import done_payload, encode_event, encode_payload
+from .streaming import coalesce
+from .stream_sessions import parse_last_event_id, stream_sessions
+from .core.metrics import chat_stage_seconds
+from .core.scheduler import ProviderBusyError
+import asyncio
+import math
+import os
 
 router = APIRouter(tags=['chat'])
 
-def get_user_from_auth(authorization: str, db: Session):
-    from .utils import decode_access_token
-    if not authorization:
-        return None
-    token = authorization.split(' ',1)[1] if authorization.lower().startswith('bearer ') else authorization
-    email = decode_access_token(token)
-    if not email:
-        return None
-    return db.query(models.User).filter(models.User.email == email).first()
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '1000'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '16'))
 
-@router.post('/{agent_id}/send', response_model=dict)
-def send_message(agent_id: int, payload: schemas.ChatMessageCreate, authorization: str = Header(None), db: Session = Depends(database.get_db)):
-    user = get_user_from_auth(authorization, db)
-    if not user:
-        raise HTTPException(status_code=401, detail='Invalid token')
-    agent = db.query(models.Agent).filter(models.Agent.id == agent_id, models.Agent.owner_id == user.id).first()
-    if not agent:
-        raise HTTPException(status_code=404, detail='Agent not found')
-
-    # ensure runtime instance
-    runtime = runtime_agents.get(agent.id)
-    if not runtime:
-        runtime = CrewAgent(
-            agent.name,
-            role=agent.role,
-            goal=agent.goal,
-            model=agent.model_name,
-            temperature=agent.temperature or 0.7,
-            max_tokens=agent.max_tokens or 1024,
-            top_p=agent.top_p,
-            top_k=agent.top_k,
-            api_key=agent.api_key,
-            provider=agent.provider
-        )
-        runtime_agents[agent.id] = runtime
-    else:
-        # Update runtime instance with latest agent settings
-        runtime.api_key = agent.api_key
-        runtime.provider = agent.provider
-        runtime.temperature = agent.temperature or 0.7
-        runtime.max_tokens = agent.max_tokens or 1024
-        runtime.top_p = agent.top_p
-        runtime.top_k = agent.top_k
-        runtime.model = agent.model_name
-        runtime.role = agent.role
-        runtime.goal = agent.goal
+def _prepare_turn(agent_id: int, payload: schemas.ChatMessageCreate, authorization: str, db: Session):
+    """Authenticate, resolve the runtime agent and store the user message (runs in the threadpool)."""
+    # token, user and owned agent in one query
+    with chat_stage_seconds.time('auth'):
+        user, agent = agent_context(agent_id, authorization, db)
+    with chat_stage_seconds.time('agent_load'):
+        # runtime instance, rebuilt only when the agent's settings changed
+        runtime = runtime_agents.get_or_create(agent)
 
     api_key = (payload.api_key or agent.api_key or '').strip()
-    if not api_key:
+    if not api_key and runtime.requires_api_key:
         raise HTTPException(status_code=400, detail='No API key configured for this agent. Add one when creating the agent or provide api_key with this request.')
 
+    # earlier turns sent along with the prompt, read before this message is stored
+    with chat_stage_seconds.time('context'):
+        history = conversation_memory.context(agent.id, runtime, payload.message, db)
+
     # save user message
-    user_msg = models.ChatMessage(agent_id=agent.id, sender='user', message=payload.message)
-    db.add(user_msg); db.commit(); db.refresh(user_msg)
+    user_msg_id = _save_message(agent.id, 'user', payload.message)
+    # Hand the pooled connection back; the session otherwise keeps it for the whole provider call
+    db.close()
+    return user.id, agent.id, runtime, api_key, history, user_msg_id
 
-    # get response from agent
-    try:
-        response_text = runtime.think(payload.message, api_key)
-    except RuntimeError as exc:
-        raise HTTPException(status_code=502, detail=str(exc))
+def _save_message(agent_id: int, sender: str, message: str) -> int:
+    # Written behind by the message writer; the id is known right away
+    with chat_stage_seconds.time('persist'):
+        msg_id = message_writer.enqueue(agent_id, sender, message)
+        conversation_memory.append(agent_id, sender, message)
+    return msg_id
 
-    bot_msg = models.ChatMessage(agent_id=agent.id, sender='agent', message=response_text)
-    db.add(bot_msg); db.commit(); db.refresh(bot_msg)
+def _save_messages(messages: list) -> list:
+    """_save_message for many (agent_id, sender, message) tuples at once."""
+    with chat_stage_seconds.time('persist'):
+        ids = message_writer.enqueue_many(messages)
+        for agent_id, sender, message in messages:
+            conversation_memory.append(agent_id, sender, message)
+    return ids
 
-    return {'response': response_text, 'user_message_id': user_msg.id, 'bot_message_id': bot_msg.id}
+def _prepare_batch(payload: schemas.BatchChatRequest, authorization: str, db: Session) -> list:
+    """Authenticate once, load every agent of the batch in one query and store the user messages.
 
-@router.post('/{agent_id}/send-stream')
-def send_message_stream(agent_id: int, payload: schemas.ChatMessageCreate, authorization: str = Header(None), db: Session = Depends(database.get_db)):
+    Returns one entry per item: (runtime, api_key, user_msg_id) or an error message.
+    """
     user = get_user_from_auth(authorization, db)
     if not user:
         raise HTTPException(status_code=401, detail='Invalid token')
-    agent = db.query(models.Agent).filter(models.Agent.id == agent_id, models.Agent.owner_id == user.id).first()
-    if not agent:
-        raise HTTPException(status_code=404, detail='Agent not found')
-
-    # ensure runtime instance
-    runtime = runtime_agents.get(agent.id)
-    if not runtime:
-        runtime = CrewAgent(
-            agent.name,
-            role=agent.role,
-            goal=agent.goal,
-            model=agent.model_name,
-            temperature=agent.temperature or 0.7,
-            max_tokens=agent.max_tokens or 1024,
-            top_p=agent.top_p,
-            top_k=agent.top_k,
-            api_key=agent.api_key,
-            provider=agent.provider
-        )
-        runtime_agents[agent.id] = runtime
-    else:
-        # Update runtime instance with latest agent settings
-        runtime.api_key = agent.api_key
-        runtime.provider = agent.provider
-        runtime.temperature = agent.temperature or 0.7
-        runtime.max_tokens = agent.max_tokens or 1024
-        runtime.top_p = agent.top_p
-        runtime.top_k = agent.top_k
-        runtime.model = agent.model_name
-        runtime.role = agent.role
-        runtime.goal = agent.goal
+    agent_ids = {item.agent_id for item in payload.items}
+    agents = {
+        agent.id: agent
+        for agent in db.query(models.Agent).filter(models.Agent.id.in_(agent_ids), models.Agent.owner_id == user.id).all()
+    }
 
-    api_key = (payload.api_key or agent.api_key or '').strip()
-    if not api_key:
-        raise HTTPException(status_code=400, detail='No API key configured for this agent. Add one when creating the agent or provide api_key with this request.')
+    prepared = []
+    to_save = []
+    for item in payload.items:
+        agent = agents.get(item.agent_id)
+        if agent is None:
+            prepared.append('Agent not found')
+            continue
+        runtime = runtime_agents.get_or_create(agent)
+        api_key = (item.api_key or agent.api_key or '').strip()
+        if not api_key and runtime.requires_api_key:
+            prepared.append('No API key configured for this agent.')
+            continue
+        prepared.append((runtime, api_key))
+        to_save.append((agent.id, 'user', item.message))
 
-    # save user message
-    user_msg = models.ChatMessage(agent_id=agent.id, sender='user', message=payload.message)
-    db.add(user_msg); db.commit(); db.refresh(user_msg)
+    # Batch prompts are independent, so they are sent without conversation history
+    user_msg_ids = iter(_save_messages(to_save))
+    db.close()
+    return [entry if isinstance(entry, str) else entry + (next(user_msg_ids),) for entry in prepared]
 
-    def generate():
+@router.post('/batch', response_model=schemas.BatchChatResponse)
+async def send_batch(payload: schemas.BatchChatRequest, authorization: str = Header(None), db: Session = Depends(database.get_db)):
+    """Run many (agent_id, message) pairs concurrently; results are tagged with the item index."""
+    if not payload.items:
+        raise HTTPException(status_code=400, detail='Batch has no items')
+    if len(payload.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f'Batch is limited to {BATCH_MAX_ITEMS} items')
+    prepared = await run_in_threadpool(_prepare_batch, payload, authorization, db)
+    concurrency = max(1, min(payload.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index: int, item: schemas.BatchChatItem, entry) -> dict:
+        result = {'index': index, 'agent_id': item.agent_id}
+        if isinstance(entry, str):
+            result['error'] = entry
+            return result
+        runtime, api_key, user_msg_id = entry
+        result['user_message_id'] = user_msg_id
+        try:
+            async with semaphore:
+                result['response'] = await runtime.athink(item.message, api_key)
+        except RuntimeError as exc:
+            result['error'] = str(exc)
+        return result
+
+    async def save_replies(results: list):
+        replies = [result for result in results if result.get('response') is not None]
+        ids = await run_in_threadpool(_save_messages, [(result['agent_id'], 'agent', result['response']) for result in replies])
+        for result, bot_msg_id in zip(replies, ids):
+            result['bot_message_id'] = bot_msg_id
+
+    tasks = [asyncio.create_task(run(index, item, entry)) for index, (item, entry) in enumerate(zip(payload.items, prepared))]
+
+    if payload.stream:
+        async def generate():
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    result = await next_done
+                    await save_replies([result])
+                    yield encode_event({'type': 'result', **result})
+                yield encode_event({'type': 'done', 'count': len(tasks)})
+            finally:
+                # Client went away: stop the provider calls that are still running
+                for task in tasks:
+                    task.cancel()
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    # All replies are stored with one bulk insert
+    await save_replies(results)
+    return {'results': results}
+
+@router.post('/{agent_id}/send', response_model=dict)
+async def send_message(agent_id: int, payload: schemas.ChatMessageCreate, authorization: str = Header(None), db: Session = Depends(database.get_db)):
+    # DB work stays in the threadpool; the provider round trip runs on the event loop
+    _, agent_id, runtime, api_key, history, user_msg_id = await run_in_threadpool(_prepare_turn, agent_id, payload, authorization, db)
+
+    # get response from agent
+    try:
+        response_text = await runtime.athink(payload.message, api_key, history)
+    except ProviderBusyError as exc:
+        # Backpressure from the provider scheduler; tell the client when to retry
+        raise HTTPException(status_code=503, detail=str(exc), headers={'Retry-After': str(math.ceil(exc.retry_after or 1))})
+    except RuntimeError as exc:
+        raise HTTPException(status_code=502, detail=str(exc))
+
+    bot_msg_id = await run_in_threadpool(_save_message, agent_id, 'agent', response_text)
+
+    return {'response': response_text, 'user_message_id': user_msg_id, 'bot_message_id': bot_msg_id}
+
+@router.post('/{agent_id}/send-stream')
+async def send_message_stream(agent_id: int, payload: schemas.ChatMessageCreate, authorization: str = Header(None), db: Session = Depends(database.get_db)):
+    user_id, agent_id, runtime, api_key, history, user_msg_id = await run_in_threadpool(_prepare_turn, agent_id, payload, authorization, db)
+
+    async def generate(session):
+        # Runs to completion in the background, whether or not a client is still reading
         try:
-            full_response = ''
             # Send initial message with user message ID
-            yield f"data: {json.dumps({'type': 'start', 'user_message_id': user_msg.id})}\n\n"
-            
-            # Stream response from agent
-            for chunk in runtime.think_stream(payload.message, api_key):
-                full_response += chunk
-                yield f"data: {json.dumps({'type': 'chunk', 'content': chunk})}\n\n"
-                time.sleep(0.1)  # Add 0.2 second delay between chunks
-            
+            session.emit({'type': 'start', 'user_message_id': user_msg_id, 'stream_id': session.stream_id})
+
+            # Stream response from agent; the session keeps the chunks
+            async for chunk in coalesce(runtime.athink_stream(payload.message, api_key, history)):
+                session.emit({'type': 'chunk', 'content': chunk})
+
             # Save complete response to database
-            bot_msg = models.ChatMessage(agent_id=agent.id, sender='agent', message=full_response)
-            db.add(bot_msg); db.commit(); db.refresh(bot_msg)
-            
+            full_response = ''.join(session.reply)
+            bot_msg_id = await run_in_threadpool(_save_message, agent_id, 'agent', full_response)
+
             # Send final message with bot message ID
-            yield f"data: {json.dumps({'type': 'done', 'bot_message_id': bot_msg.id, 'full_response': full_response})}\n\n"
+            session.emit(done_payload(bot_msg_id, full_response))
         except RuntimeError as exc:
-            error_data = json.dumps({'type': 'error', 'message': str(exc)})
-            yield f"data: {error_data}\n\n"
+            session.emit({'type': 'error', 'message': str(exc)})
         except Exception as exc:
-            error_data = json.dumps({'type': 'error', 'message': f'Unexpected error: {str(exc)}'})
-            yield f"data: {error_data}\n\n"
+            session.emit({'type': 'error', 'message': f'Unexpected error: {str(exc)}'})
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    session = stream_sessions.start(agent_id, user_id, generate)
+    return StreamingResponse(_replay(session), media_type="text/event-stream")
 
-@router.get('/{agent_id}/history', response_model=List[schemas.ChatMessageOut])
-def history(agent_id: int, authorization: str = Header(None), db: Session = Depends(database.get_db)):
-    user = get_user_from_auth(authorization, db)
+@router.get('/{agent_id}/stream/{stream_id}')
+async def resume_stream(
+    agent_id: int,
+    stream_id: str,
+    last_event_id: Optional[str] = Header(None),
+    authorization: str = Header(None),
+    db: Session = Depends(database.get_db)
+):
+    """Reconnect to a reply stream, resuming after the Last-Event-ID the client received."""
+    user = await run_in_threadpool(get_user_from_auth, authorization, db)
+    # Not needed while the stream is replayed
+    await run_in_threadpool(db.close)
     if not user:
         raise HTTPException(status_code=401, detail='Invalid token')
-    agent = db.query(models.Agent).filter(models.Agent.id == agent_id, models.Agent.owner_id == user.id).first()
-    if not agent:
-        raise HTTPException(status_code=404, detail='Agent not found')
-    msgs = db.query(models.ChatMessage).filter(models.ChatMessage.agent_id == agent.id).order_by(models.ChatMessage.created_at.asc()).all()
-    return msgs
+    session = stream_sessions.get(stream_id)
+    if session is None or session.agent_id != agent_id or session.owner_id != user.id:
+        raise HTTPException(status_code=404, detail='Stream not found or expired')
+    last_stream_id, last_seq = parse_last_event_id(last_event_id)
+    if last_stream_id not in (None, stream_id):
+        raise HTTPException(status_code=400, detail='Last-Event-ID belongs to another stream')
+    return StreamingResponse(_replay(session, last_seq), media_type="text/event-stream")
+
+async def _replay(session, last_seq: Optional[int] = None):
+    async for seq, event in session.follow(last_seq):
+        yield encode_payload(event, f'{session.stream_id}:{seq}')
+
+@router.get('/{agent_id}/history', response_model=schemas.ChatHistoryPage)
+def history(
+    agent_id: int,
+    before_id: Optional[int] = Query(None),
+    after_id: Optional[int] = Query(None),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    context: RequestContext = Depends(agent_context),
+    db: Session = Depends(database.get_db)
+):
+    """Page through an agent's messages in the order they were written.
+
+    Without a cursor the newest page is returned. before_id walks towards older
+    messages and after_id towards newer ones; both take the id of a message
+    and next_cursor continues in the same direction, null once there is
+    nothing left. Messages are always returned oldest first.
+    """
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail='Use either before_id or after_id, not both')
+    agent = context.agent
+
+    # Make messages still queued by the writer visible to this read
+    message_writer.flush()
+    query = db.query(models.ChatMessage).filter(models.ChatMessage.agent_id == agent.id)
+    if after_id is not None:
+        msgs = query.filter(_position() > _cursor(after_id)).order_by(*_OLDEST_FIRST).limit(limit + 1).all()
+        has_more = len(msgs) > limit
+        msgs = msgs[:limit]
+        next_cursor = msgs[-1].id if has_more else None
+    else:
+        if before_id is not None:
+            query = query.filter(_position() < _cursor(before_id))
+        msgs = query.order_by(*_NEWEST_FIRST).limit(limit + 1).all()
+        has_more = len(msgs) > limit
+        msgs = msgs[:limit][::-1]
+        next_cursor = msgs[0].id if has_more else None
+    return {'messages': msgs, 'next_cursor': next_cursor}
+
+# Message ids are allocated in blocks per worker, so creation order is (created_at, id)
+_OLDEST_FIRST = (models.ChatMessage.created_at.asc(), models.ChatMessage.id.asc())
+_NEWEST_FIRST = (models.ChatMessage.created_at.desc(), models.ChatMessage.id.desc())
+
+def _position():
+    return tuple_(models.ChatMessage.created_at, models.ChatMessage.id)
+
+def _cursor(message_id: int):
+    created_at = select(models.ChatMessage.created_at).where(models.ChatMessage.id == message_id).scalar_subquery()
+    return tuple_(created_at, message_id)
@@ -0,0 +1,163 @@
+# Crew execution: a DAG of agent tasks run on top of CrewAgent.
+# A task's prompt can use the outputs of the tasks it depends on. Tasks
+# whose dependencies are done start right away, so independent branches run
+# concurrently, up to a concurrency cap per crew run. When a task fails, the
+# tasks that depend on it are skipped and the rest of the crew carries on.
+import asyncio
+import os
+import re
+from collections import deque
+from typing import Optional
+
+# Tasks of one crew run that may call their agent at the same time
+CREW_MAX_CONCURRENCY = int(os.environ.get('CREW_MAX_CONCURRENCY', '8'))
+
+# {{task_id}} in a prompt is replaced by the output of that task
+_PLACEHOLDER = re.compile(r'\{\{\s*([A-Za-z0-9_.-]+)\s*\}\}')
+
+
+class CrewError(RuntimeError):
+    """The crew definition is not a valid DAG of tasks."""
+
+
+class CrewTask:
+    def __init__(self, task_id: str, agent, prompt: str, depends_on=(), api_key: Optional[str] = None):
+        self.task_id = task_id
+        self.agent = agent
+        self.prompt = prompt
+        self.depends_on = tuple(dict.fromkeys(depends_on))
+        self.api_key = api_key
+
+    def render(self, outputs: dict) -> str:
+        """The prompt with its dependencies' outputs filled in.
+
+        Outputs of dependencies the prompt does not reference are appended,
+        so a task always sees what came before it.
+        """
+        referenced = set()
+
+        def substitute(match):
+            task_id = match.group(1)
+            if task_id not in self.depends_on:
+                return match.group(0)
+            referenced.add(task_id)
+            return outputs[task_id]
+
+        prompt = _PLACEHOLDER.sub(substitute, self.prompt)
+        extra = [f'Output of "{task_id}":\n{outputs[task_id]}' for task_id in self.depends_on if task_id not in referenced]
+        return '\n\n'.join([prompt] + extra) if extra else prompt
+
+
+class Crew:
+    def __init__(self, tasks: list, max_concurrency: int = CREW_MAX_CONCURRENCY):
+        self.tasks = {}
+        for task in tasks:
+            if task.task_id in self.tasks:
+                raise CrewError(f'Duplicate task id "{task.task_id}"')
+            self.tasks[task.task_id] = task
+        self.max_concurrency = max(1, max_concurrency)
+        self.dependents = {task_id: [] for task_id in self.tasks}
+        for task in tasks:
+            for dependency in task.depends_on:
+                if dependency not in self.tasks:
+                    raise CrewError(f'Task "{task.task_id}" depends on unknown task "{dependency}"')
+                if dependency == task.task_id:
+                    raise CrewError(f'Task "{task.task_id}" depends on itself')
+                self.dependents[dependency].append(task.task_id)
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> list:
+        pending = {task_id: len(task.depends_on) for task_id, task in self.tasks.items()}
+        ready = deque(task_id for task_id, count in pending.items() if count == 0)
+        order = []
+        while ready:
+            task_id = ready.popleft()
+            order.append(task_id)
+            for dependent in self.dependents[task_id]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) < len(self.tasks):
+            cycle = sorted(task_id for task_id in self.tasks if task_id not in order)
+            raise CrewError(f'Tasks {", ".join(cycle)} form a dependency cycle')
+        return order
+
+    async def run(self, stream: bool = False):
+        """Run the crew, yielding its events as dicts.
+
+        Each task reports 'task_start', then 'task_done' with its output or
+        'task_error'; with stream=True its 'task_chunk' events come in
+        between. Dependents of a failed task get 'task_skipped'.
+        """
+        events = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        outputs = {}
+        waiting = {task_id: set(task.depends_on) for task_id, task in self.tasks.items()}
+        running = {}
+
+        def launch_ready():
+            for task_id in [task_id for task_id in self.order if task_id in waiting and not waiting[task_id]]:
+                del waiting[task_id]
+                running[task_id] = asyncio.create_task(self._run_task(self.tasks[task_id], outputs, semaphore, events, stream))
+
+        launch_ready()
+        try:
+            while running:
+                event = await events.get()
+                task_id = event['task_id']
+                if event['type'] == 'task_done':
+                    del running[task_id]
+                    outputs[task_id] = event['output']
+                    for dependent in self.dependents[task_id]:
+                        if dependent in waiting:
+                            waiting[dependent].discard(task_id)
+                elif event['type'] == 'task_error':
+                    del running[task_id]
+                yield event
+                if event['type'] == 'task_error':
+                    for skipped in self._skip_dependents(task_id, waiting):
+                        yield {'type': 'task_skipped', 'task_id': skipped, 'reason': f'Depends on failed task "{task_id}"'}
+                launch_ready()
+        finally:
+            # The consumer went away: stop the agent calls still running
+            for task in running.values():
+                task.cancel()
+
+    async def execute(self) -> dict:
+        """Run the crew to the end; task_id -> its final event."""
+        results = {}
+        async for event in self.run():
+            if event['type'] != 'task_start':
+                results[event['task_id']] = event
+        return results
+
+    def _skip_dependents(self, task_id: str, waiting: dict) -> list:
+        skipped = []
+        queue = deque(self.dependents[task_id])
+        while queue:
+            dependent = queue.popleft()
+            if dependent in waiting:
+                del waiting[dependent]
+                skipped.append(dependent)
+                queue.extend(self.dependents[dependent])
+        return skipped
+
+    @staticmethod
+    async def _run_task(task: CrewTask, outputs: dict, semaphore: asyncio.Semaphore, events: asyncio.Queue, stream: bool):
+        try:
+            async with semaphore:
+                events.put_nowait({'type': 'task_start', 'task_id': task.task_id})
+                prompt = task.render(outputs)
+                if stream:
+                    parts = []
+                    async for chunk in task.agent.athink_stream(prompt, task.api_key):
+                        parts.append(chunk)
+                        events.put_nowait({'type': 'task_chunk', 'task_id': task.task_id, 'content': chunk})
+                    output = ''.join(parts)
+                else:
+                    output = await task.agent.athink(prompt, task.api_key)
+            events.put_nowait({'type': 'task_done', 'task_id': task.task_id, 'output': output})
+        except RuntimeError as exc:
+            events.put_nowait({'type': 'task_error', 'task_id': task.task_id, 'message': str(exc)})
+        except Exception as exc:
+            events.put_nowait({'type': 'task_error', 'task_id': task.task_id, 'message': f'Unexpected error: {exc}'})
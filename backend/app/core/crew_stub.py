@@ -1,11 +1,55 @@
 # This is a lightweight CrewAI-compatible adapter stub.
 # Replace with real CrewAI integration by adjusting the Agent class.
+import logging
+import os
 import time
 from typing import Optional
 
-OPENAI_CHAT_COMPLETIONS_URL = 'https://api.openai.com/v1/chat/completions'
+from . import fake_provider
+from .metrics import (
+    provider_chunk_gap_seconds,
+    provider_connect_seconds,
+    provider_errors_total,
+    provider_request_seconds,
+    provider_stream_seconds,
+    provider_ttft_seconds,
+    model_label,
+    provider_label,
+    record_tokens
+)
+from .response_cache import response_cache
+from .scheduler import ProviderError, parse_retry_after, provider_scheduler
+from .single_flight import single_flight
+from .sse_parser import aiter_sse_data, iter_sse_data, loads as sse_loads
+from .transport import get_async_client, get_httpx_module, get_requests_module, get_session, request_timeout
+
+# Overridable to reach an OpenAI-compatible proxy or a local stand-in (scripts/fake_openai_server.py)
+OPENAI_CHAT_COMPLETIONS_URL = os.environ.get('OPENAI_CHAT_COMPLETIONS_URL', 'https://api.openai.com/v1/chat/completions')
 FIREWORKS_CHAT_COMPLETIONS_URL = 'https://api.fireworks.ai/inference/v1/chat/completions'
 GEMINI_GENERATE_URL_TEMPLATE = 'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent'
+GEMINI_STREAM_URL_TEMPLATE = 'https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent'
+
+# Gemini finish reasons that end a stream normally; anything else means the reply was withheld
+GEMINI_OK_FINISH_REASONS = ('STOP', 'MAX_TOKENS', 'FINISH_REASON_UNSPECIFIED')
+
+# Follow-up prompts sent when a reply is cut off by the token limit
+CONTINUATION_PROMPTS = (
+    'Please continue and complete your previous response.',
+    'Please finish your response.'
+)
+TRUNCATED_FINISH_REASONS = ('length', 'MAX_TOKENS')
+CONTINUATION_MAX_HOPS = int(os.environ.get('CONTINUATION_MAX_HOPS', '2'))
+# Total max_tokens shared by all continuation hops of one reply
+CONTINUATION_TOKEN_BUDGET = int(os.environ.get('CONTINUATION_TOKEN_BUDGET', '750'))
+CONTINUATION_MIN_TOKENS = 50
+
+# Providers that run locally and need no API key
+KEYLESS_PROVIDERS = ('fake',)
+
+# Returned by _parse_openai_stream_event when the provider signals the end of the stream
+STREAM_DONE = object()
+
+logger = logging.getLogger(__name__)
 
 
 class CrewAgent:
@@ -20,7 +64,9 @@ class CrewAgent:
         top_p: Optional[float] = 1.0,
         top_k: Optional[int] = 50,
         api_key: Optional[str] = None,
-        provider: str = 'openai'
+        provider: str = 'openai',
+        coalesce_requests: Optional[bool] = None,
+        owner_id: Optional[int] = None
     ):
         self.name = name
         self.role = role
@@ -32,388 +78,612 @@ class CrewAgent:
         self.top_k = top_k
         self.api_key = api_key
         self.provider = (provider or 'openai').lower()
+        # Share one upstream call among identical concurrent calls; None means only at temperature 0
+        self.coalesce_requests = coalesce_requests
+        # User the agent belongs to; cached replies are never shared across owners
+        self.owner_id = owner_id
+
+    @property
+    def requires_api_key(self) -> bool:
+        return self.provider not in KEYLESS_PROVIDERS
 
-    def think(self, prompt: str, api_key: Optional[str] = None) -> str:
+    def think(self, prompt: str, api_key: Optional[str] = None, history: Optional[list] = None) -> str:
+        """Answer a prompt; history holds earlier turns as {'role', 'content'} dicts, oldest first."""
         api_key = (api_key or self.api_key or '').strip()
-        if not api_key:
+        if not api_key and self.requires_api_key:
             # Simple deterministic stub response used when no API key is provided.
-            time.sleep(0.2)
-            return f"[{self.name} - {self.model} | temp={self.temperature}] Echo: {prompt[:100]}"
+            return self._echo(prompt)
+
+        scope = response_cache.scope(self, api_key, history)
+        cached = response_cache.get(scope, prompt)
+        if cached is not None:
+            return cached
+        flight = single_flight.key(self, prompt, api_key, history)
+        content = single_flight.do(flight, lambda: self._complete(prompt, api_key, history))
+        response_cache.put(scope, prompt, content)
+        return content
+
+    def think_stream(self, prompt: str, api_key: Optional[str] = None, history: Optional[list] = None):
+        """Generator that yields response chunks as they arrive."""
+        api_key = (api_key or self.api_key or '').strip()
+        if not api_key and self.requires_api_key:
+            # Simple deterministic stub response used when no API key is provided.
+            yield self._echo(prompt)
+            return
+
+        scope = response_cache.scope(self, api_key, history)
+        cached = response_cache.get(scope, prompt)
+        if cached is not None:
+            yield cached
+            return
+        flight = single_flight.key(self, prompt, api_key, history)
+        chunks = []
+        for chunk in single_flight.stream(flight, lambda: self._complete_stream(prompt, api_key, history)):
+            chunks.append(chunk)
+            yield chunk
+        response_cache.put(scope, prompt, ''.join(chunks))
+
+    async def athink(self, prompt: str, api_key: Optional[str] = None, history: Optional[list] = None) -> str:
+        """Async counterpart of think() that never blocks the event loop."""
+        api_key = (api_key or self.api_key or '').strip()
+        if not api_key and self.requires_api_key:
+            return self._echo(prompt)
+
+        scope = response_cache.scope(self, api_key, history)
+        cached = response_cache.get(scope, prompt)
+        if cached is not None:
+            return cached
+        flight = single_flight.key(self, prompt, api_key, history)
+        content = await single_flight.ado(flight, lambda: self._acomplete(prompt, api_key, history))
+        response_cache.put(scope, prompt, content)
+        return content
+
+    async def athink_stream(self, prompt: str, api_key: Optional[str] = None, history: Optional[list] = None):
+        """Async generator that yields response chunks as they arrive."""
+        api_key = (api_key or self.api_key or '').strip()
+        if not api_key and self.requires_api_key:
+            yield self._echo(prompt)
+            return
+
+        scope = response_cache.scope(self, api_key, history)
+        cached = response_cache.get(scope, prompt)
+        if cached is not None:
+            yield cached
+            return
+        flight = single_flight.key(self, prompt, api_key, history)
+        chunks = []
+        async for chunk in single_flight.astream(flight, lambda: self._acomplete_stream(prompt, api_key, history)):
+            chunks.append(chunk)
+            yield chunk
+        response_cache.put(scope, prompt, ''.join(chunks))
+
+    def _complete(self, prompt: str, api_key: str, history: Optional[list] = None) -> str:
+        content, finish_reason = self._request(prompt, api_key, history)
+
+        # If the reply was cut off by the token limit, ask the model to continue it
+        for hop, max_tokens, follow_up in self._continuation_hops():
+            if finish_reason not in TRUNCATED_FINISH_REASONS:
+                break
+            started = time.perf_counter()
+            try:
+                more, finish_reason = self._request(prompt, api_key, history, (content, follow_up, max_tokens))
+            except RuntimeError as exc:
+                logger.warning('Continuation hop %d for agent %s failed: %s', hop + 1, self.name, exc)
+                break
+            self._log_continuation(hop, max_tokens, started, finish_reason)
+            content = content + _continuation_separator(content, more) + more
+
+        return content
+
+    def _complete_stream(self, prompt: str, api_key: str, history: Optional[list] = None):
+        result = {}
+        parts = []
+        for chunk in self._request_stream(prompt, api_key, history, None, result):
+            parts.append(chunk)
+            yield chunk
+
+        for hop, max_tokens, follow_up in self._continuation_hops():
+            if result.get('finish_reason') not in TRUNCATED_FINISH_REASONS:
+                break
+            previous = ''.join(parts)
+            continuation = (previous, follow_up, max_tokens)
+            result = {}
+            started = time.perf_counter()
+            try:
+                for chunk in self._request_stream(prompt, api_key, history, continuation, result):
+                    if previous is not None:
+                        chunk = _continuation_separator(previous, chunk) + chunk
+                        previous = None
+                    parts.append(chunk)
+                    yield chunk
+            except RuntimeError as exc:
+                logger.warning('Continuation hop %d for agent %s failed: %s', hop + 1, self.name, exc)
+                break
+            self._log_continuation(hop, max_tokens, started, result.get('finish_reason'))
+
+    async def _acomplete(self, prompt: str, api_key: str, history: Optional[list] = None) -> str:
+        content, finish_reason = await self._arequest(prompt, api_key, history)
+
+        for hop, max_tokens, follow_up in self._continuation_hops():
+            if finish_reason not in TRUNCATED_FINISH_REASONS:
+                break
+            started = time.perf_counter()
+            try:
+                more, finish_reason = await self._arequest(prompt, api_key, history, (content, follow_up, max_tokens))
+            except RuntimeError as exc:
+                logger.warning('Continuation hop %d for agent %s failed: %s', hop + 1, self.name, exc)
+                break
+            self._log_continuation(hop, max_tokens, started, finish_reason)
+            content = content + _continuation_separator(content, more) + more
+
+        return content
+
+    async def _acomplete_stream(self, prompt: str, api_key: str, history: Optional[list] = None):
+        result = {}
+        parts = []
+        async for chunk in self._arequest_stream(prompt, api_key, history, None, result):
+            parts.append(chunk)
+            yield chunk
+
+        for hop, max_tokens, follow_up in self._continuation_hops():
+            if result.get('finish_reason') not in TRUNCATED_FINISH_REASONS:
+                break
+            previous = ''.join(parts)
+            continuation = (previous, follow_up, max_tokens)
+            result = {}
+            started = time.perf_counter()
+            try:
+                async for chunk in self._arequest_stream(prompt, api_key, history, continuation, result):
+                    if previous is not None:
+                        chunk = _continuation_separator(previous, chunk) + chunk
+                        previous = None
+                    parts.append(chunk)
+                    yield chunk
+            except RuntimeError as exc:
+                logger.warning('Continuation hop %d for agent %s failed: %s', hop + 1, self.name, exc)
+                break
+            self._log_continuation(hop, max_tokens, started, result.get('finish_reason'))
+
+    # Every provider call goes through the scheduler: concurrency and rate
+    # limits per provider and API key, and retries of 429s and server errors.
+    def _request(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
+        labels = self._metric_labels()
+        started = time.perf_counter()
+        try:
+            content, finish_reason, usage = provider_scheduler.call(self.provider, api_key, lambda: self._send(prompt, api_key, history, continuation))
+        except RuntimeError:
+            provider_errors_total.inc(*labels)
+            raise
+        provider_request_seconds.observe(time.perf_counter() - started, *labels)
+        self._record_tokens(prompt, history, continuation, len(content), usage)
+        return content, finish_reason
+
+    def _request_stream(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
+        labels = self._metric_labels()
+        started = last = time.perf_counter()
+        chars_out = 0
+        try:
+            for chunk in provider_scheduler.stream(self.provider, api_key, lambda: self._send_stream(prompt, api_key, history, continuation, result)):
+                last = self._observe_chunk(labels, started, last)
+                chars_out += len(chunk)
+                yield chunk
+        except RuntimeError:
+            provider_errors_total.inc(*labels)
+            raise
+        provider_stream_seconds.observe(time.perf_counter() - started, *labels)
+        self._record_tokens(prompt, history, continuation, chars_out)
+
+    async def _arequest(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
+        labels = self._metric_labels()
+        started = time.perf_counter()
+        try:
+            content, finish_reason, usage = await provider_scheduler.acall(self.provider, api_key, lambda: self._asend(prompt, api_key, history, continuation))
+        except RuntimeError:
+            provider_errors_total.inc(*labels)
+            raise
+        provider_request_seconds.observe(time.perf_counter() - started, *labels)
+        self._record_tokens(prompt, history, continuation, len(content), usage)
+        return content, finish_reason
+
+    async def _arequest_stream(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
+        labels = self._metric_labels()
+        started = last = time.perf_counter()
+        chars_out = 0
+        try:
+            async for chunk in provider_scheduler.astream(self.provider, api_key, lambda: self._asend_stream(prompt, api_key, history, continuation, result)):
+                last = self._observe_chunk(labels, started, last)
+                chars_out += len(chunk)
+                yield chunk
+        except RuntimeError:
+            provider_errors_total.inc(*labels)
+            raise
+        provider_stream_seconds.observe(time.perf_counter() - started, *labels)
+        self._record_tokens(prompt, history, continuation, chars_out)
 
+    def _send(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
         provider = (self.provider or 'openai').lower()
         if provider == 'openai':
-            return self._call_openai(prompt, api_key, OPENAI_CHAT_COMPLETIONS_URL)
+            return self._call_openai(prompt, api_key, OPENAI_CHAT_COMPLETIONS_URL, history, continuation)
         if provider == 'fireworks':
-            return self._call_openai(prompt, api_key, FIREWORKS_CHAT_COMPLETIONS_URL)
+            return self._call_openai(prompt, api_key, FIREWORKS_CHAT_COMPLETIONS_URL, history, continuation)
         if provider == 'gemini':
-            return self._call_gemini(prompt, api_key)
+            return self._call_gemini(prompt, api_key, history, continuation)
+        if provider == 'fake':
+            return fake_provider.complete(self, prompt, history, continuation) + (None,)
 
         raise RuntimeError(f'Unsupported provider "{provider}". Please choose OpenAI, Fireworks, or Gemini.')
 
-    def think_stream(self, prompt: str, api_key: Optional[str] = None):
-        """Generator that yields response chunks as they arrive."""
-        api_key = (api_key or self.api_key or '').strip()
-        if not api_key:
-            # Simple deterministic stub response used when no API key is provided.
-            time.sleep(0.2)
-            yield f"[{self.name} - {self.model} | temp={self.temperature}] Echo: {prompt[:100]}"
-            return
+    def _send_stream(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
+        provider = (self.provider or 'openai').lower()
+        if provider == 'openai':
+            return self._call_openai_stream(prompt, api_key, OPENAI_CHAT_COMPLETIONS_URL, history, continuation, result)
+        if provider == 'fireworks':
+            return self._call_openai_stream(prompt, api_key, FIREWORKS_CHAT_COMPLETIONS_URL, history, continuation, result)
+        if provider == 'gemini':
+            return self._call_gemini_stream(prompt, api_key, history, continuation, result)
+        if provider == 'fake':
+            return fake_provider.stream(self, prompt, history, continuation, result)
+
+        raise RuntimeError(f'Unsupported provider "{provider}". Please choose OpenAI, Fireworks, or Gemini.')
 
+    async def _asend(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
         provider = (self.provider or 'openai').lower()
         if provider == 'openai':
-            yield from self._call_openai_stream(prompt, api_key, OPENAI_CHAT_COMPLETIONS_URL)
-        elif provider == 'fireworks':
-            yield from self._call_openai_stream(prompt, api_key, FIREWORKS_CHAT_COMPLETIONS_URL)
-        elif provider == 'gemini':
-            yield from self._call_gemini_stream(prompt, api_key)
-        else:
-            raise RuntimeError(f'Unsupported provider "{provider}". Please choose OpenAI, Fireworks, or Gemini.')
+            return await self._acall_openai(prompt, api_key, OPENAI_CHAT_COMPLETIONS_URL, history, continuation)
+        if provider == 'fireworks':
+            return await self._acall_openai(prompt, api_key, FIREWORKS_CHAT_COMPLETIONS_URL, history, continuation)
+        if provider == 'gemini':
+            return await self._acall_gemini(prompt, api_key, history, continuation)
+        if provider == 'fake':
+            return await fake_provider.acomplete(self, prompt, history, continuation) + (None,)
 
-    def _call_openai(self, prompt: str, api_key: str, base_url: str) -> str:
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
-        # Ensure max_tokens is always set and valid
-        max_tokens = self.max_tokens if self.max_tokens and self.max_tokens > 0 else 1024
-        payload = {
-            'model': self._normalize_model_name(),
-            'messages': [
-                {'role': 'system', 'content': self._build_system_prompt()},
-                {'role': 'user', 'content': prompt}
-            ],
-            'temperature': self.temperature,
-            'max_tokens': max_tokens
-        }
-        if self.top_p is not None:
-            payload['top_p'] = self.top_p
-        if self.top_k is not None:
-            payload['top_k'] = self.top_k
+        raise RuntimeError(f'Unsupported provider "{provider}". Please choose OpenAI, Fireworks, or Gemini.')
+
+    def _asend_stream(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
+        provider = (self.provider or 'openai').lower()
+        if provider == 'openai':
+            return self._acall_openai_stream(prompt, api_key, OPENAI_CHAT_COMPLETIONS_URL, history, continuation, result)
+        if provider == 'fireworks':
+            return self._acall_openai_stream(prompt, api_key, FIREWORKS_CHAT_COMPLETIONS_URL, history, continuation, result)
+        if provider == 'gemini':
+            return self._acall_gemini_stream(prompt, api_key, history, continuation, result)
+        if provider == 'fake':
+            return fake_provider.astream(self, prompt, history, continuation, result)
+
+        raise RuntimeError(f'Unsupported provider "{provider}". Please choose OpenAI, Fireworks, or Gemini.')
+
+    def _call_openai(self, prompt: str, api_key: str, base_url: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
+        headers = self._openai_headers(api_key)
+        payload = self._openai_payload(prompt, history, continuation=continuation)
 
         requests_client = self._get_requests_client()
+        session = get_session(self.provider)
 
         try:
-            response = requests_client.post(
+            response = session.post(
                 base_url,
                 headers=headers,
                 json=payload,
-                timeout=60
+                timeout=request_timeout()
             )
         except requests_client.RequestException as exc:  # type: ignore[attr-defined]
             raise RuntimeError(f'Network error while contacting the model API: {exc}') from exc
 
         if response.status_code >= 400:
-            detail = self._extract_error_message(response)
-            raise RuntimeError(f'Model API error ({response.status_code}): {detail}')
+            raise self._api_error(response)
+
+        return self._parse_openai_response(response.json())
+
+    async def _acall_openai(self, prompt: str, api_key: str, base_url: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
+        headers = self._openai_headers(api_key)
+        payload = self._openai_payload(prompt, history, continuation=continuation)
+
+        httpx = get_httpx_module()
+        client = get_async_client(self.provider)
 
-        data = response.json()
         try:
-            choice = data['choices'][0]
-            content = choice['message']['content'].strip()
-            finish_reason = choice.get('finish_reason', '')
-            
-            # If response was cut off due to length, try to complete it
-            if finish_reason == 'length':
-                # Make a follow-up request to complete the response
-                completion_payload = payload.copy()
-                completion_payload['messages'].append({
-                    'role': 'assistant',
-                    'content': content
-                })
-                completion_payload['messages'].append({
-                    'role': 'user',
-                    'content': 'Please continue and complete your previous response.'
-                })
-                # Use a smaller token budget for completion (20% of original, min 50, max 500)
-                completion_tokens = max(50, min(500, int(max_tokens * 0.2)))
-                completion_payload['max_tokens'] = completion_tokens
-                
-                try:
-                    completion_response = requests_client.post(
-                        base_url,
-                        headers=headers,
-                        json=completion_payload,
-                        timeout=60
-                    )
-                    if completion_response.status_code == 200:
-                        completion_data = completion_response.json()
-                        if 'choices' in completion_data and len(completion_data['choices']) > 0:
-                            completion_choice = completion_data['choices'][0]
-                            additional_content = completion_choice['message']['content'].strip()
-                            content = content + ' ' + additional_content
-                            
-                            # If completion was also cut off, try one more time (but with smaller budget)
-                            if completion_choice.get('finish_reason') == 'length' and completion_tokens > 50:
-                                final_completion_payload = completion_payload.copy()
-                                final_completion_payload['messages'].append({
-                                    'role': 'assistant',
-                                    'content': additional_content
-                                })
-                                final_completion_payload['messages'].append({
-                                    'role': 'user',
-                                    'content': 'Please finish your response.'
-                                })
-                                final_completion_tokens = max(50, int(completion_tokens * 0.5))
-                                final_completion_payload['max_tokens'] = final_completion_tokens
-                                
-                                try:
-                                    final_response = requests_client.post(
-                                        base_url,
-                                        headers=headers,
-                                        json=final_completion_payload,
-                                        timeout=60
-                                    )
-                                    if final_response.status_code == 200:
-                                        final_data = final_response.json()
-                                        if 'choices' in final_data and len(final_data['choices']) > 0:
-                                            final_content = final_data['choices'][0]['message']['content'].strip()
-                                            content = content + ' ' + final_content
-                                except Exception:
-                                    pass
-                except Exception:
-                    # If completion fails, return the original content
-                    pass
-            
-            return content
-        except (KeyError, IndexError, TypeError):
-            raise RuntimeError('Received an unexpected response format from the model API.')
+            response = await client.post(base_url, headers=headers, json=payload)
+        except httpx.HTTPError as exc:
+            raise RuntimeError(f'Network error while contacting the model API: {exc}') from exc
+
+        if response.status_code >= 400:
+            raise self._api_error(response)
 
-    def _call_openai_stream(self, prompt: str, api_key: str, base_url: str):
+        return self._parse_openai_response(response.json())
+
+    def _call_openai_stream(self, prompt: str, api_key: str, base_url: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
         """Stream response from OpenAI/Fireworks API."""
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
-        # Ensure max_tokens is always set and valid
-        max_tokens = self.max_tokens if self.max_tokens and self.max_tokens > 0 else 1024
-        payload = {
-            'model': self._normalize_model_name(),
-            'messages': [
-                {'role': 'system', 'content': self._build_system_prompt()},
-                {'role': 'user', 'content': prompt}
-            ],
-            'temperature': self.temperature,
-            'max_tokens': max_tokens,
-            'stream': True
-        }
-        if self.top_p is not None:
-            payload['top_p'] = self.top_p
-        if self.top_k is not None:
-            payload['top_k'] = self.top_k
+        headers = self._openai_headers(api_key)
+        payload = self._openai_payload(prompt, history, stream=True, continuation=continuation)
+        result = {} if result is None else result
 
         requests_client = self._get_requests_client()
+        session = get_session(self.provider)
 
         try:
-            response = requests_client.post(
+            started = time.perf_counter()
+            response = session.post(
                 base_url,
                 headers=headers,
                 json=payload,
                 stream=True,
-                timeout=60
+                timeout=request_timeout()
             )
+            provider_connect_seconds.observe(time.perf_counter() - started, *self._metric_labels())
         except requests_client.RequestException as exc:  # type: ignore[attr-defined]
             raise RuntimeError(f'Network error while contacting the model API: {exc}') from exc
 
         if response.status_code >= 400:
-            detail = self._extract_error_message(response)
-            raise RuntimeError(f'Model API error ({response.status_code}): {detail}')
+            raise self._api_error(response)
 
-        full_content = ''
         try:
-            for line in response.iter_lines():
-                if not line:
+            # chunk_size=None: bytes are handed over as they arrive
+            for data in iter_sse_data(response.iter_content(chunk_size=None)):
+                event = self._parse_openai_stream_event(data)
+                if event is STREAM_DONE:
+                    break
+                if event is None:
                     continue
-                line = line.decode('utf-8')
-                if line.startswith('data: '):
-                    data_str = line[6:]  # Remove 'data: ' prefix
-                    if data_str == '[DONE]':
-                        break
-                    try:
-                        import json
-                        data = json.loads(data_str)
-                        if 'choices' in data and len(data['choices']) > 0:
-                            delta = data['choices'][0].get('delta', {})
-                            content = delta.get('content', '')
-                            if content:
-                                full_content += content
-                                yield content
-                    except (json.JSONDecodeError, KeyError):
-                        continue
+                content, finish_reason = event
+                if finish_reason:
+                    result['finish_reason'] = finish_reason
+                if content:
+                    yield content
+        except RuntimeError:
+            raise
         except Exception as exc:
             raise RuntimeError(f'Error processing stream: {exc}') from exc
+        finally:
+            # Release the pooled connection even when we stop reading early
+            response.close()
 
-    def _call_gemini(self, prompt: str, api_key: str) -> str:
-        model_name = self._normalize_model_name()
-        url = GEMINI_GENERATE_URL_TEMPLATE.format(model=model_name)
-        # Ensure max_tokens is always set and valid
-        max_tokens = self.max_tokens if self.max_tokens and self.max_tokens > 0 else 1024
-        payload = {
-            'contents': [
-                {
-                    'role': 'user',
-                    'parts': [{'text': prompt}]
-                }
-            ],
-            'generationConfig': {
-                'temperature': self.temperature,
-                'maxOutputTokens': max_tokens
-            }
-        }
-        if self.top_p is not None:
-            payload['generationConfig']['top_p'] = self.top_p
-        if self.top_k is not None:
-            payload['generationConfig']['top_k'] = self.top_k
+    async def _acall_openai_stream(self, prompt: str, api_key: str, base_url: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
+        headers = self._openai_headers(api_key)
+        payload = self._openai_payload(prompt, history, stream=True, continuation=continuation)
+        result = {} if result is None else result
+
+        httpx = get_httpx_module()
+        client = get_async_client(self.provider)
+
+        try:
+            request = client.build_request('POST', base_url, headers=headers, json=payload)
+            started = time.perf_counter()
+            response = await client.send(request, stream=True)
+            provider_connect_seconds.observe(time.perf_counter() - started, *self._metric_labels())
+        except httpx.HTTPError as exc:
+            raise RuntimeError(f'Network error while contacting the model API: {exc}') from exc
+
+        try:
+            if response.status_code >= 400:
+                await response.aread()
+                raise self._api_error(response)
+
+            try:
+                async for data in aiter_sse_data(response.aiter_bytes()):
+                    event = self._parse_openai_stream_event(data)
+                    if event is STREAM_DONE:
+                        break
+                    if event is None:
+                        continue
+                    content, finish_reason = event
+                    if finish_reason:
+                        result['finish_reason'] = finish_reason
+                    if content:
+                        yield content
+            except RuntimeError:
+                raise
+            except Exception as exc:
+                raise RuntimeError(f'Error processing stream: {exc}') from exc
+        finally:
+            await response.aclose()
+
+    def _call_gemini(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
+        url = GEMINI_GENERATE_URL_TEMPLATE.format(model=self._normalize_model_name())
+        payload = self._gemini_payload(prompt, history, continuation)
 
         requests_client = self._get_requests_client()
+        session = get_session(self.provider)
 
         try:
-            response = requests_client.post(
+            response = session.post(
                 url,
                 params={'key': api_key},
                 json=payload,
-                timeout=60
+                timeout=request_timeout()
             )
         except requests_client.RequestException as exc:  # type: ignore[attr-defined]
             raise RuntimeError(f'Network error while contacting the Gemini API: {exc}') from exc
 
         if response.status_code >= 400:
-            detail = self._extract_error_message(response)
-            raise RuntimeError(f'Model API error ({response.status_code}): {detail}')
+            raise self._api_error(response)
+
+        return self._parse_gemini_response(response.json())
+
+    async def _acall_gemini(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
+        url = GEMINI_GENERATE_URL_TEMPLATE.format(model=self._normalize_model_name())
+        payload = self._gemini_payload(prompt, history, continuation)
+
+        httpx = get_httpx_module()
+        client = get_async_client(self.provider)
 
-        data = response.json()
         try:
-            candidates = data['candidates']
-            first_candidate = candidates[0]
-            parts = first_candidate['content']['parts']
-            content = parts[0]['text'].strip()
-            finish_reason = first_candidate.get('finishReason', '')
-            
-            # If response was cut off, try to complete it
-            if finish_reason == 'MAX_TOKENS':
-                # Make a follow-up request to complete the response
-                completion_payload = payload.copy()
-                completion_payload['contents'].append({
-                    'role': 'model',
-                    'parts': [{'text': content}]
-                })
-                completion_payload['contents'].append({
-                    'role': 'user',
-                    'parts': [{'text': 'Please continue and complete your previous response.'}]
-                })
-                # Use a smaller token budget for completion (20% of original, min 50, max 500)
-                completion_tokens = max(50, min(500, int(max_tokens * 0.2)))
-                completion_payload['generationConfig']['maxOutputTokens'] = completion_tokens
-                
-                try:
-                    completion_response = requests_client.post(
-                        url,
-                        params={'key': api_key},
-                        json=completion_payload,
-                        timeout=60
-                    )
-                    if completion_response.status_code == 200:
-                        completion_data = completion_response.json()
-                        if 'candidates' in completion_data and len(completion_data['candidates']) > 0:
-                            completion_candidate = completion_data['candidates'][0]
-                            additional_parts = completion_candidate['content']['parts']
-                            if additional_parts and len(additional_parts) > 0:
-                                additional_content = additional_parts[0]['text'].strip()
-                                content = content + ' ' + additional_content
-                                
-                                # If completion was also cut off, try one more time (but with smaller budget)
-                                if completion_candidate.get('finishReason') == 'MAX_TOKENS' and completion_tokens > 50:
-                                    final_completion_payload = completion_payload.copy()
-                                    final_completion_payload['contents'].append({
-                                        'role': 'model',
-                                        'parts': [{'text': additional_content}]
-                                    })
-                                    final_completion_payload['contents'].append({
-                                        'role': 'user',
-                                        'parts': [{'text': 'Please finish your response.'}]
-                                    })
-                                    final_completion_tokens = max(50, int(completion_tokens * 0.5))
-                                    final_completion_payload['generationConfig']['maxOutputTokens'] = final_completion_tokens
-                                    
-                                    try:
-                                        final_response = requests_client.post(
-                                            url,
-                                            params={'key': api_key},
-                                            json=final_completion_payload,
-                                            timeout=60
-                                        )
-                                        if final_response.status_code == 200:
-                                            final_data = final_response.json()
-                                            if 'candidates' in final_data and len(final_data['candidates']) > 0:
-                                                final_parts = final_data['candidates'][0]['content']['parts']
-                                                if final_parts and len(final_parts) > 0:
-                                                    final_content = final_parts[0]['text'].strip()
-                                                    content = content + ' ' + final_content
-                                    except Exception:
-                                        pass
-                except Exception:
-                    # If completion fails, return the original content
-                    pass
-            
-            return content
-        except (KeyError, IndexError, TypeError):
-            raise RuntimeError('Received an unexpected response format from the Gemini API.')
+            response = await client.post(url, params={'key': api_key}, json=payload)
+        except httpx.HTTPError as exc:
+            raise RuntimeError(f'Network error while contacting the Gemini API: {exc}') from exc
+
+        if response.status_code >= 400:
+            raise self._api_error(response)
 
-    def _call_gemini_stream(self, prompt: str, api_key: str):
+        return self._parse_gemini_response(response.json())
+
+    def _call_gemini_stream(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
         """Stream response from Gemini API."""
-        model_name = self._normalize_model_name()
-        url = GEMINI_GENERATE_URL_TEMPLATE.format(model=model_name)
-        # Ensure max_tokens is always set and valid
-        max_tokens = self.max_tokens if self.max_tokens and self.max_tokens > 0 else 1024
-        payload = {
-            'contents': [
-                {
-                    'role': 'user',
-                    'parts': [{'text': prompt}]
-                }
-            ],
-            'generationConfig': {
-                'temperature': self.temperature,
-                'maxOutputTokens': max_tokens
-            }
-        }
-        if self.top_p is not None:
-            payload['generationConfig']['top_p'] = self.top_p
-        if self.top_k is not None:
-            payload['generationConfig']['top_k'] = self.top_k
+        url = GEMINI_STREAM_URL_TEMPLATE.format(model=self._normalize_model_name())
+        payload = self._gemini_payload(prompt, history, continuation)
+        result = {} if result is None else result
 
         requests_client = self._get_requests_client()
+        session = get_session(self.provider)
 
         try:
-            # Note: Gemini API doesn't support streaming in the same way as OpenAI
-            # We'll simulate streaming by making the request and yielding chunks
-            response = requests_client.post(
+            started = time.perf_counter()
+            response = session.post(
                 url,
-                params={'key': api_key},
+                params={'key': api_key, 'alt': 'sse'},
                 json=payload,
-                timeout=60
+                stream=True,
+                timeout=request_timeout()
             )
+            provider_connect_seconds.observe(time.perf_counter() - started, *self._metric_labels())
         except requests_client.RequestException as exc:  # type: ignore[attr-defined]
             raise RuntimeError(f'Network error while contacting the Gemini API: {exc}') from exc
 
         if response.status_code >= 400:
-            detail = self._extract_error_message(response)
-            raise RuntimeError(f'Model API error ({response.status_code}): {detail}')
+            raise self._api_error(response)
 
-        data = response.json()
         try:
-            candidates = data['candidates']
-            first_candidate = candidates[0]
-            parts = first_candidate['content']['parts']
-            content = parts[0]['text'].strip()
-            
-            # Simulate streaming by yielding chunks (Gemini doesn't support true streaming)
-            chunk_size = 20  # Characters per chunk
-            for i in range(0, len(content), chunk_size):
-                chunk = content[i:i + chunk_size]
-                yield chunk
-                time.sleep(0.01)  # Small delay to simulate streaming
-        except (KeyError, IndexError, TypeError):
-            raise RuntimeError('Received an unexpected response format from the Gemini API.')
+            for data in iter_sse_data(response.iter_content(chunk_size=None)):
+                event = self._parse_gemini_stream_event(data)
+                if event is None:
+                    continue
+                content, finish_reason = event
+                if content:
+                    yield content
+                if finish_reason:
+                    self._check_gemini_finish_reason(finish_reason)
+                    result['finish_reason'] = finish_reason
+                    break
+        except RuntimeError:
+            raise
+        except Exception as exc:
+            raise RuntimeError(f'Error processing stream: {exc}') from exc
+        finally:
+            # Release the pooled connection even when we stop reading early
+            response.close()
+
+    async def _acall_gemini_stream(self, prompt: str, api_key: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
+        url = GEMINI_STREAM_URL_TEMPLATE.format(model=self._normalize_model_name())
+        payload = self._gemini_payload(prompt, history, continuation)
+        result = {} if result is None else result
+
+        httpx = get_httpx_module()
+        client = get_async_client(self.provider)
+
+        try:
+            request = client.build_request('POST', url, params={'key': api_key, 'alt': 'sse'}, json=payload)
+            started = time.perf_counter()
+            response = await client.send(request, stream=True)
+            provider_connect_seconds.observe(time.perf_counter() - started, *self._metric_labels())
+        except httpx.HTTPError as exc:
+            raise RuntimeError(f'Network error while contacting the Gemini API: {exc}') from exc
+
+        try:
+            if response.status_code >= 400:
+                await response.aread()
+                raise self._api_error(response)
+
+            try:
+                async for data in aiter_sse_data(response.aiter_bytes()):
+                    event = self._parse_gemini_stream_event(data)
+                    if event is None:
+                        continue
+                    content, finish_reason = event
+                    if content:
+                        yield content
+                    if finish_reason:
+                        self._check_gemini_finish_reason(finish_reason)
+                        result['finish_reason'] = finish_reason
+                        break
+            except RuntimeError:
+                raise
+            except Exception as exc:
+                raise RuntimeError(f'Error processing stream: {exc}') from exc
+        finally:
+            await response.aclose()
+
+    def _openai_payload(self, prompt: str, history: Optional[list] = None, stream: bool = False, continuation: Optional[tuple] = None) -> dict:
+        payload = {
+            'model': self._normalize_model_name(),
+            'messages': [
+                {'role': 'system', 'content': self._build_system_prompt()},
+                *(history or []),
+                {'role': 'user', 'content': prompt}
+            ],
+            'temperature': self.temperature,
+            'max_tokens': self._max_tokens()
+        }
+        if continuation:
+            # The reply so far is sent once, followed by a single follow-up prompt
+            content, follow_up, max_tokens = continuation
+            payload['messages'].append({'role': 'assistant', 'content': content})
+            payload['messages'].append({'role': 'user', 'content': follow_up})
+            payload['max_tokens'] = max_tokens
+        if stream:
+            payload['stream'] = True
+        if self.top_p is not None:
+            payload['top_p'] = self.top_p
+        if self.top_k is not None:
+            payload['top_k'] = self.top_k
+        return payload
+
+    def _gemini_payload(self, prompt: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> dict:
+        contents = []
+        instructions = []
+        for turn in history or []:
+            if turn['role'] == 'system':
+                instructions.append(turn['content'])
+            elif turn['role'] == 'assistant':
+                # Gemini conversations must open with a user turn
+                if contents:
+                    contents.append({'role': 'model', 'parts': [{'text': turn['content']}]})
+            else:
+                contents.append({'role': 'user', 'parts': [{'text': turn['content']}]})
+        contents.append({
+            'role': 'user',
+            'parts': [{'text': prompt}]
+        })
+        payload = {
+            'contents': contents,
+            'generationConfig': {
+                'temperature': self.temperature,
+                'maxOutputTokens': self._max_tokens()
+            }
+        }
+        if continuation:
+            content, follow_up, max_tokens = continuation
+            contents.append({'role': 'model', 'parts': [{'text': content}]})
+            contents.append({'role': 'user', 'parts': [{'text': follow_up}]})
+            payload['generationConfig']['maxOutputTokens'] = max_tokens
+        if instructions:
+            payload['systemInstruction'] = {'parts': [{'text': text} for text in instructions]}
+        if self.top_p is not None:
+            payload['generationConfig']['top_p'] = self.top_p
+        if self.top_k is not None:
+            payload['generationConfig']['top_k'] = self.top_k
+        return payload
+
+    def _max_tokens(self) -> int:
+        # Ensure max_tokens is always set and valid
+        return self.max_tokens if self.max_tokens and self.max_tokens > 0 else 1024
+
+    def _continuation_hops(self):
+        """Yield (hop, max_tokens, follow_up) for each continuation call allowed by the budget."""
+        # The first hop gets 20% of the original budget (min 50, max 500), later hops half the previous one
+        max_tokens = max(CONTINUATION_MIN_TOKENS, min(500, int(self._max_tokens() * 0.2)))
+        remaining = CONTINUATION_TOKEN_BUDGET
+        for hop in range(CONTINUATION_MAX_HOPS):
+            max_tokens = min(max_tokens, remaining)
+            if max_tokens < CONTINUATION_MIN_TOKENS:
+                return
+            yield hop, max_tokens, CONTINUATION_PROMPTS[min(hop, len(CONTINUATION_PROMPTS) - 1)]
+            remaining -= max_tokens
+            max_tokens = max(CONTINUATION_MIN_TOKENS, max_tokens // 2)
+
+    def _log_continuation(self, hop: int, max_tokens: int, started: float, finish_reason):
+        logger.info(
+            'Continuation hop %d for agent %s (%s): max_tokens=%d, %.1f ms, finish_reason=%s',
+            hop + 1, self.name, self.provider, max_tokens, (time.perf_counter() - started) * 1000, finish_reason
+        )
 
     def _build_system_prompt(self) -> str:
         role = f"Role: {self.role}\n" if self.role else ''
@@ -423,13 +693,116 @@ class CrewAgent:
     def _normalize_model_name(self) -> str:
         return (self.model or '').strip().replace(' ', '-')
 
+    def _echo(self, prompt: str) -> str:
+        return f"[{self.name} - {self.model} | temp={self.temperature}] Echo: {prompt[:100]}"
+
     @staticmethod
-    def _get_requests_client():
+    def _openai_headers(api_key: str) -> dict:
+        return {
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        }
+
+    @staticmethod
+    def _parse_openai_response(data) -> tuple:
+        """(content, finish_reason, usage) of a reply; usage is (tokens_in, tokens_out) or None."""
+        try:
+            choice = data['choices'][0]
+            content, finish_reason = choice['message']['content'].strip(), choice.get('finish_reason', '')
+        except (KeyError, IndexError, TypeError, AttributeError):
+            raise RuntimeError('Received an unexpected response format from the model API.')
+        return content, finish_reason, _usage(data.get('usage'), 'prompt_tokens', 'completion_tokens')
+
+    @staticmethod
+    def _parse_gemini_response(data) -> tuple:
+        """(content, finish_reason, usage) of a reply; usage is (tokens_in, tokens_out) or None."""
         try:
-            import requests  # type: ignore
-        except ImportError as exc:  # pragma: no cover
-            raise RuntimeError('The "requests" package is not available in the backend environment.') from exc
-        return requests
+            candidate = data['candidates'][0]
+            content, finish_reason = candidate['content']['parts'][0]['text'].strip(), candidate.get('finishReason', '')
+        except (KeyError, IndexError, TypeError, AttributeError):
+            raise RuntimeError('Received an unexpected response format from the Gemini API.')
+        return content, finish_reason, _usage(data.get('usageMetadata'), 'promptTokenCount', 'candidatesTokenCount')
+
+    def _parse_openai_stream_event(self, data: bytes):
+        """Return (content, finish_reason) for the data of one SSE event, STREAM_DONE, or None to skip it."""
+        if data == b'[DONE]':
+            return STREAM_DONE
+        event = self._load_stream_event(data)
+        if event is None:
+            return None
+        choices = event.get('choices')
+        if not choices:
+            return None
+        choice = choices[0]
+        return (choice.get('delta') or {}).get('content') or '', choice.get('finish_reason')
+
+    def _parse_gemini_stream_event(self, data: bytes):
+        """Return (text, finish_reason) for the data of one Gemini SSE event, or None to skip it."""
+        event = self._load_stream_event(data)
+        if event is None:
+            return None
+        block_reason = (event.get('promptFeedback') or {}).get('blockReason')
+        if block_reason:
+            raise RuntimeError(f'Gemini blocked the prompt ({block_reason}).')
+        candidates = event.get('candidates') or []
+        if not candidates:
+            return None
+        candidate = candidates[0]
+        parts = (candidate.get('content') or {}).get('parts') or []
+        text = ''.join(part.get('text', '') for part in parts)
+        return text, candidate.get('finishReason', '')
+
+    def _load_stream_event(self, data: bytes) -> Optional[dict]:
+        """The JSON object of a stream event; raises on error events, None to skip it."""
+        try:
+            event = sse_loads(data)
+        except ValueError:
+            logger.warning('Skipping malformed %s stream event: %r', self.provider, data[:200])
+            return None
+        if not isinstance(event, dict):
+            return None
+        if 'error' in event:
+            error = event['error']
+            detail = error.get('message') or error.get('status') if isinstance(error, dict) else str(error)
+            raise RuntimeError(f'Model API error: {detail}')
+        return event
+
+    @staticmethod
+    def _check_gemini_finish_reason(finish_reason: str):
+        if finish_reason not in GEMINI_OK_FINISH_REASONS:
+            raise RuntimeError(f'Gemini stopped the response early ({finish_reason}).')
+
+    @staticmethod
+    def _get_requests_client():
+        return get_requests_module()
+
+    def _metric_labels(self) -> tuple:
+        return provider_label(self.provider), model_label(self._normalize_model_name())
+
+    @staticmethod
+    def _observe_chunk(labels: tuple, started: float, last: float) -> float:
+        now = time.perf_counter()
+        if last == started:
+            provider_ttft_seconds.observe(now - started, *labels)
+        else:
+            provider_chunk_gap_seconds.observe(now - last, *labels)
+        return now
+
+    def _record_tokens(self, prompt: str, history: Optional[list], continuation: Optional[tuple], chars_out: int, usage: Optional[tuple] = None):
+        if usage is None:
+            # Not reported (streams, fake provider): estimate from the characters sent and received
+            chars_in = len(self._build_system_prompt()) + len(prompt or '')
+            chars_in += sum(len(turn.get('content') or '') for turn in history or ())
+            if continuation:
+                chars_in += len(continuation[0]) + len(continuation[1])
+            usage = (chars_in // 4 + 1, chars_out // 4 + 1)
+        record_tokens(*self._metric_labels(), *usage)
+
+    @classmethod
+    def _api_error(cls, response) -> ProviderError:
+        detail = cls._extract_error_message(response)
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        return ProviderError(f'Model API error ({response.status_code}): {detail}', response.status_code, retry_after)
 
     @staticmethod
     def _extract_error_message(response) -> str:
@@ -446,3 +819,18 @@ class CrewAgent:
                 return str(error)
         return response.text or 'Unknown error'
 
+
+def _usage(data, tokens_in: str, tokens_out: str) -> Optional[tuple]:
+    """(tokens_in, tokens_out) from a provider's usage object, None when it has no counts."""
+    if not isinstance(data, dict):
+        return None
+    counts = data.get(tokens_in), data.get(tokens_out)
+    if not all(isinstance(count, int) for count in counts):
+        return None
+    return counts
+
+
+def _continuation_separator(content: str, more: str) -> str:
+    if not content or not more or content[-1].isspace() or more[0].isspace():
+        return ''
+    return ' '
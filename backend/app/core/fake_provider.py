@@ -0,0 +1,106 @@
+# Local stand-in for a model API, selected with provider='fake'.
+# Replies are derived from a hash of the request, so the same conversation
+# always gets the same text, and are paced like a real provider: FAKE_TTFT_MS
+# until the first token, then FAKE_TOKENS_PER_SECOND. A FAKE_ERROR_RATE share
+# of calls fail with a server error, which the scheduler retries like any
+# other. No network and no API key are involved.
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+from .scheduler import ProviderError
+
+FAKE_TTFT_MS = float(os.environ.get('FAKE_TTFT_MS', '200'))
+# 0 sends the whole reply right after the first token delay
+FAKE_TOKENS_PER_SECOND = float(os.environ.get('FAKE_TOKENS_PER_SECOND', '50'))
+FAKE_ERROR_RATE = float(os.environ.get('FAKE_ERROR_RATE', '0'))
+# Reply length in tokens, before the agent's max_tokens cuts it off
+FAKE_REPLY_TOKENS = int(os.environ.get('FAKE_REPLY_TOKENS', '64'))
+# Seeds the sequence of injected errors
+FAKE_SEED = os.environ.get('FAKE_SEED', '0')
+
+_WORDS = (
+    'the', 'agent', 'model', 'reply', 'token', 'stream', 'latency', 'cache',
+    'request', 'context', 'prompt', 'answer', 'result', 'task', 'plan', 'data',
+    'quickly', 'carefully', 'first', 'then', 'finally', 'because', 'and', 'with',
+    'local', 'fake', 'provider', 'test', 'load', 'signal', 'value', 'step'
+)
+
+_errors = random.Random(FAKE_SEED)
+_errors_lock = threading.Lock()
+
+
+def _fail():
+    if FAKE_ERROR_RATE <= 0:
+        return
+    with _errors_lock:
+        failed = _errors.random() < FAKE_ERROR_RATE
+    if failed:
+        raise ProviderError('Model API error (status 500): fake provider error', status_code=500)
+
+
+def _reply(agent, prompt: str, history: Optional[list], continuation: Optional[tuple]) -> tuple:
+    """(tokens, finish_reason) of the deterministic reply to a request."""
+    material = json.dumps([
+        agent._normalize_model_name(),
+        agent._build_system_prompt(),
+        history or [],
+        prompt,
+        continuation[0] if continuation else None
+    ], sort_keys=True, default=str)
+    rng = random.Random(hashlib.sha1(material.encode('utf-8')).digest())
+    # A continuation produces what is left of the full reply
+    wanted = FAKE_REPLY_TOKENS - (len(continuation[0].split()) if continuation else 0)
+    limit = continuation[2] if continuation else agent.max_tokens
+    count = max(0, min(wanted, limit) if limit and limit > 0 else wanted)
+    tokens = [(' ' if index else '') + rng.choice(_WORDS) for index in range(count)]
+    return tokens, 'length' if count < wanted else 'stop'
+
+
+def _generation_seconds(count: int) -> float:
+    return count / FAKE_TOKENS_PER_SECOND if FAKE_TOKENS_PER_SECOND > 0 else 0.0
+
+
+def complete(agent, prompt: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
+    tokens, finish_reason = _reply(agent, prompt, history, continuation)
+    time.sleep(FAKE_TTFT_MS / 1000.0 + _generation_seconds(len(tokens)))
+    _fail()
+    return ''.join(tokens), finish_reason
+
+
+async def acomplete(agent, prompt: str, history: Optional[list] = None, continuation: Optional[tuple] = None) -> tuple:
+    tokens, finish_reason = _reply(agent, prompt, history, continuation)
+    await asyncio.sleep(FAKE_TTFT_MS / 1000.0 + _generation_seconds(len(tokens)))
+    _fail()
+    return ''.join(tokens), finish_reason
+
+
+def stream(agent, prompt: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
+    tokens, finish_reason = _reply(agent, prompt, history, continuation)
+    time.sleep(FAKE_TTFT_MS / 1000.0)
+    _fail()
+    gap = _generation_seconds(1)
+    for index, token in enumerate(tokens):
+        if index and gap:
+            time.sleep(gap)
+        yield token
+    if result is not None:
+        result['finish_reason'] = finish_reason
+
+
+async def astream(agent, prompt: str, history: Optional[list] = None, continuation: Optional[tuple] = None, result: Optional[dict] = None):
+    tokens, finish_reason = _reply(agent, prompt, history, continuation)
+    await asyncio.sleep(FAKE_TTFT_MS / 1000.0)
+    _fail()
+    gap = _generation_seconds(1)
+    for index, token in enumerate(tokens):
+        if index and gap:
+            await asyncio.sleep(gap)
+        yield token
+    if result is not None:
+        result['finish_reason'] = finish_reason
@@ -0,0 +1,214 @@
+# In-process metrics in Prometheus text format.
+# Histograms and counters are plain Python objects updated under a lock per
+# metric: an observation is one bisect and three additions, so they can sit
+# on the chat hot path. Stats dicts of the caches are exported as gauges by
+# collectors that only run when /metrics is scraped.
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no', 'off')
+
+# Model names are free text set per agent; distinct values past this limit
+# are reported as 'other' so the series of the provider metrics stay bounded
+METRICS_MAX_MODELS = int(os.environ.get('METRICS_MAX_MODELS', '50'))
+METRICS_MODEL_LABEL_LENGTH = 64
+METRIC_PROVIDERS = ('openai', 'fireworks', 'gemini', 'fake')
+
+# Seconds, from sub-millisecond cache and auth hits up to long generations
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+_model_labels = set()
+_model_labels_lock = threading.Lock()
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f'{self.name}{_labels(self.labelnames, labelvalues)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labelvalues -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        if not METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(labelvalues, list(series)) for labelvalues, series in self._series.items()]
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labelvalues)} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labelvalues)} {series[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []  # (prefix, documentation, fn returning a stats dict)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, documentation: str, fn, labelname: str = ''):
+        """Export the numeric values of fn() as gauges named <prefix>_<key>.
+
+        With labelname, a value that is itself a dict of stats dicts (e.g. one
+        per provider) is exported as <prefix>_<stat>{<labelname>="<key>"}.
+        """
+        self._collectors.append((prefix, documentation, fn, labelname))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, documentation, fn, labelname in self._collectors:
+            gauges = {}  # name -> [(labels, value)]
+            for key, value in fn().items():
+                if labelname and isinstance(value, dict):
+                    for labelvalue, stats in value.items():
+                        for stat, number in stats.items():
+                            if _is_number(number):
+                                gauges.setdefault(stat, []).append((_labels((labelname,), (labelvalue,)), number))
+                elif _is_number(value):
+                    gauges.setdefault(key, []).append(('', value))
+            for key, samples in gauges.items():
+                name = f'{prefix}_{key}'
+                lines.append(f'# HELP {name} {documentation}: {key}')
+                lines.append(f'# TYPE {name} gauge')
+                lines.extend(f'{name}{labels} {_format_value(value)}' for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Stages of a chat turn: auth, agent_load, context, persist
+chat_stage_seconds = registry.histogram(
+    'chat_stage_seconds', 'Time spent in each stage of a chat request', ('stage',)
+)
+provider_request_seconds = registry.histogram(
+    'provider_request_seconds', 'Duration of non-streaming model API calls', ('provider', 'model')
+)
+provider_connect_seconds = registry.histogram(
+    'provider_connect_seconds', 'Time until the response headers of a streaming model API call arrive', ('provider', 'model')
+)
+provider_ttft_seconds = registry.histogram(
+    'provider_ttft_seconds', 'Time to the first streamed chunk of a reply', ('provider', 'model')
+)
+provider_stream_seconds = registry.histogram(
+    'provider_stream_seconds', 'Duration of a streamed reply', ('provider', 'model')
+)
+provider_chunk_gap_seconds = registry.histogram(
+    'provider_chunk_gap_seconds', 'Time between consecutive chunks of a streamed reply', ('provider', 'model')
+)
+provider_errors_total = registry.counter(
+    'provider_errors_total', 'Model API calls that failed', ('provider', 'model')
+)
+provider_tokens_total = registry.counter(
+    'provider_tokens_total', 'Tokens sent to and received from model APIs (as reported by the provider, else ~4 characters per token)',
+    ('provider', 'model', 'direction')
+)
+message_write_seconds = registry.histogram(
+    'message_write_seconds', 'Duration of a batched chat message insert'
+)
+
+
+def record_tokens(provider: str, model: str, tokens_in: int, tokens_out: int):
+    provider_tokens_total.inc(provider, model, 'in', amount=tokens_in)
+    provider_tokens_total.inc(provider, model, 'out', amount=tokens_out)
+
+
+def provider_label(provider: str) -> str:
+    return provider if provider in METRIC_PROVIDERS else 'other'
+
+
+def model_label(model: str) -> str:
+    """The model label value: the first METRICS_MAX_MODELS names seen, then 'other'."""
+    name = (model or '').strip().lower()[:METRICS_MODEL_LABEL_LENGTH] or 'unknown'
+    if name in _model_labels:
+        return name
+    with _model_labels_lock:
+        if name in _model_labels or len(_model_labels) < METRICS_MAX_MODELS:
+            _model_labels.add(name)
+            return name
+    return 'other'
@@ -0,0 +1,172 @@
+# Response cache in front of CrewAgent provider calls (per process).
+# Exact mode keys on the normalized prompt plus everything else that shapes
+# the reply, including the owner and API key it was produced for; semantic
+# mode also serves near-duplicate prompts, found with hashed n-gram
+# embeddings compared against entries of the same scope.
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+# 'exact', 'semantic' or 'off'
+RESPONSE_CACHE_MODE = os.environ.get('RESPONSE_CACHE_MODE', 'exact').lower()
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '1000'))
+# Replies sampled above this temperature are too varied to reuse
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.environ.get('RESPONSE_CACHE_MAX_TEMPERATURE', '0.3'))
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get('RESPONSE_CACHE_SIMILARITY', '0.9'))
+
+EMBEDDING_DIMENSIONS = 512
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    return ' '.join((prompt or '').split()).casefold()
+
+
+def embed(text: str) -> dict:
+    """Sparse, L2-normalised bag of hashed words and character trigrams."""
+    vector = {}
+    for word in _WORD.findall(text):
+        bucket = zlib.crc32(word.encode('utf-8')) % EMBEDDING_DIMENSIONS
+        vector[bucket] = vector.get(bucket, 0.0) + 1.0
+        padded = f' {word} '
+        for i in range(len(padded) - 2):
+            bucket = zlib.crc32(padded[i:i + 3].encode('utf-8')) % EMBEDDING_DIMENSIONS
+            vector[bucket] = vector.get(bucket, 0.0) + 0.5
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    if norm:
+        for bucket in vector:
+            vector[bucket] /= norm
+    return vector
+
+
+def _cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(bucket, 0.0) for bucket, value in a.items())
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        mode: str = RESPONSE_CACHE_MODE,
+        max_size: int = RESPONSE_CACHE_SIZE,
+        max_temperature: float = RESPONSE_CACHE_MAX_TEMPERATURE,
+        similarity: float = RESPONSE_CACHE_SIMILARITY
+    ):
+        self.mode = mode
+        self.max_size = max_size
+        self.max_temperature = max_temperature
+        self.similarity = similarity
+        self._entries = OrderedDict()  # (scope, prompt) -> (reply, vector)
+        self._scopes = {}  # scope -> set of prompts, for the semantic scan
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.skips = 0
+        self.evictions = 0
+
+    def scope(self, agent, api_key: str, history=None):
+        """Cache scope for an agent call, or None when the call must not be cached.
+
+        Replies are only reused for the same owner calling with the same API key.
+        """
+        if self.mode == 'off' or self.max_size <= 0:
+            return None
+        if agent.temperature is None or agent.temperature > self.max_temperature:
+            with self._lock:
+                self.skips += 1
+            return None
+        material = json.dumps([
+            agent.owner_id,
+            hashlib.sha256((api_key or '').encode('utf-8')).hexdigest(),
+            agent.provider,
+            agent._normalize_model_name(),
+            agent._build_system_prompt(),
+            agent.temperature,
+            agent.max_tokens,
+            agent.top_p,
+            agent.top_k,
+            history or []
+        ], sort_keys=True, default=str)
+        return hashlib.sha1(material.encode('utf-8')).hexdigest()
+
+    def get(self, scope, prompt: str):
+        if scope is None:
+            return None
+        normalized = normalize_prompt(prompt)
+        with self._lock:
+            entry = self._entries.get((scope, normalized))
+            if entry is not None:
+                self._entries.move_to_end((scope, normalized))
+                self.hits += 1
+                return entry[0]
+            candidates = list(self._scopes.get(scope, ())) if self.mode == 'semantic' else []
+
+        if candidates:
+            vector = embed(normalized)
+            best_key, best_score = None, self.similarity
+            with self._lock:
+                for candidate in candidates:
+                    entry = self._entries.get((scope, candidate))
+                    if entry is None or entry[1] is None:
+                        continue
+                    score = _cosine(vector, entry[1])
+                    if score >= best_score:
+                        best_key, best_score = (scope, candidate), score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key][0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, scope, prompt: str, reply: str):
+        if scope is None or not reply:
+            return
+        normalized = normalize_prompt(prompt)
+        vector = embed(normalized) if self.mode == 'semantic' else None
+        key = (scope, normalized)
+        with self._lock:
+            self._entries[key] = (reply, vector)
+            self._entries.move_to_end(key)
+            self._scopes.setdefault(scope, set()).add(normalized)
+            while len(self._entries) > self.max_size:
+                (old_scope, old_prompt), _ = self._entries.popitem(last=False)
+                prompts = self._scopes.get(old_scope)
+                if prompts is not None:
+                    prompts.discard(old_prompt)
+                    if not prompts:
+                        del self._scopes[old_scope]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                'mode': self.mode,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'skips': self.skips,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,426 @@
+# Scheduling of provider calls (per process).
+# Every call to a model API holds a slot of its API key and of its provider.
+# Slots are unbounded by default and may be bounded by a concurrency limit and
+# a token bucket; callers that find no free slot queue for a bounded time.
+# Rate limits and server errors are retried with jittered exponential backoff,
+# honouring Retry-After. A 429 also caps the concurrency of that key at half
+# of what was in flight; successful calls raise the cap again until it is
+# lifted (or back at the configured limit).
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# Concurrent calls per provider and per API key (0 = unlimited until a 429)
+PROVIDER_MAX_CONCURRENCY = int(os.environ.get('PROVIDER_MAX_CONCURRENCY', '0'))
+PROVIDER_KEY_MAX_CONCURRENCY = int(os.environ.get('PROVIDER_KEY_MAX_CONCURRENCY', '0'))
+# Token buckets in requests per second (0 = no rate limit); burst defaults to one second of rate
+PROVIDER_RATE = float(os.environ.get('PROVIDER_RATE', '0'))
+PROVIDER_KEY_RATE = float(os.environ.get('PROVIDER_KEY_RATE', '0'))
+PROVIDER_BURST = float(os.environ.get('PROVIDER_BURST', '0'))
+# Callers allowed to wait for a slot, and for how long (seconds)
+PROVIDER_QUEUE_SIZE = int(os.environ.get('PROVIDER_QUEUE_SIZE', '256'))
+PROVIDER_QUEUE_TIMEOUT = float(os.environ.get('PROVIDER_QUEUE_TIMEOUT', '30'))
+PROVIDER_MAX_RETRIES = int(os.environ.get('PROVIDER_MAX_RETRIES', '3'))
+PROVIDER_BACKOFF_BASE = float(os.environ.get('PROVIDER_BACKOFF_BASE', '0.5'))
+PROVIDER_BACKOFF_MAX = float(os.environ.get('PROVIDER_BACKOFF_MAX', '20'))
+# A Retry-After longer than this fails the call instead of waiting it out
+PROVIDER_RETRY_AFTER_MAX = float(os.environ.get('PROVIDER_RETRY_AFTER_MAX', '60'))
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+MAX_TRACKED_KEYS = 10000
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(RuntimeError):
+    """Error response from a model API."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in RETRYABLE_STATUS_CODES
+
+
+class ProviderBusyError(RuntimeError):
+    """No provider slot became free within the queue limits."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Limiter:
+    def __init__(self, name: str, concurrency: int, rate: float, burst: float, queue_size: int):
+        self.name = name
+        self.max_concurrency = concurrency
+        # Lowered after a 429 and raised again on success; 0 = unlimited
+        self.concurrency = concurrency
+        # Without a configured limit: the cap is lifted once it is back here
+        self.recover_at = 0
+        self.rate = rate
+        self.burst = max(burst or rate, 1.0)
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.waiting = 0
+        self._waiters = deque()  # callables that wake a waiting caller
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: float):
+        woken = threading.Event()
+        wake = woken.set
+        while True:
+            wait = self._try_or_enqueue(deadline, wake)
+            if wait == 0:
+                return
+            try:
+                woken.wait(wait)
+            finally:
+                self._dequeue(wake)
+                woken.clear()
+
+    async def aacquire(self, deadline: float):
+        loop = asyncio.get_running_loop()
+        future = None
+
+        def wake():
+            def set_result():
+                if future is not None and not future.done():
+                    future.set_result(None)
+            try:
+                loop.call_soon_threadsafe(set_result)
+            except RuntimeError:
+                pass  # loop already closed
+
+        while True:
+            future = loop.create_future()
+            wait = self._try_or_enqueue(deadline, wake)
+            if wait == 0:
+                return
+            try:
+                await asyncio.wait([future], timeout=wait)
+            finally:
+                self._dequeue(wake)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            waiters = list(self._waiters)
+        for wake in waiters:
+            wake()
+
+    def throttled(self, retry_after: Optional[float]):
+        # Multiplicative decrease of the concurrency, plus a pause if the server asked for one
+        with self._lock:
+            if self.concurrency > 0:
+                self.concurrency = max(1, self.concurrency // 2)
+            else:
+                # Unlimited so far: start from what was in flight when the server pushed back
+                self.recover_at = max(1, self.in_flight)
+                self.concurrency = max(1, self.in_flight // 2)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def succeeded(self):
+        # Additive increase back towards the configured concurrency
+        if self.concurrency == self.max_concurrency:
+            return
+        with self._lock:
+            if self.max_concurrency > 0:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            elif self.concurrency > 0:
+                self.concurrency += 1
+                if self.concurrency >= self.recover_at:
+                    self.concurrency = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'concurrency': self.concurrency,
+                'max_concurrency': self.max_concurrency
+            }
+
+    def _try_or_enqueue(self, deadline: float, wake) -> float:
+        """0 once a slot is taken, otherwise how long to sleep before trying again."""
+        now = time.monotonic()
+        with self._lock:
+            wait = self._try_acquire(now)
+            if wait == 0:
+                return 0
+            remaining = deadline - now
+            if remaining <= 0 or (wait is not None and wait > remaining):
+                # Fail now rather than queue for a slot that cannot free up in time
+                raise ProviderBusyError(
+                    f'Too many requests in flight to {self.name}; please retry shortly.',
+                    retry_after=max(1.0, wait or 1.0)
+                )
+            if self.waiting >= self.queue_size:
+                raise ProviderBusyError(f'Too many requests queued for {self.name}; please retry shortly.', retry_after=1.0)
+            self.waiting += 1
+            self._waiters.append(wake)
+            return min(wait, remaining) if wait is not None else remaining
+
+    def _dequeue(self, wake):
+        with self._lock:
+            while wake in self._waiters:
+                self._waiters.remove(wake)
+            self.waiting = max(0, self.waiting - 1)
+
+    def _try_acquire(self, now: float):
+        # Returns 0 when a slot was taken, seconds until one may free up, or
+        # None when only a release can free one
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.concurrency > 0 and self.in_flight >= self.concurrency:
+            return None
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        self.in_flight += 1
+        return 0
+
+
+class ProviderScheduler:
+    def __init__(
+        self,
+        concurrency: int = PROVIDER_MAX_CONCURRENCY,
+        key_concurrency: int = PROVIDER_KEY_MAX_CONCURRENCY,
+        rate: float = PROVIDER_RATE,
+        key_rate: float = PROVIDER_KEY_RATE,
+        burst: float = PROVIDER_BURST,
+        queue_size: int = PROVIDER_QUEUE_SIZE,
+        queue_timeout: float = PROVIDER_QUEUE_TIMEOUT,
+        max_retries: int = PROVIDER_MAX_RETRIES
+    ):
+        self.concurrency = concurrency
+        self.key_concurrency = key_concurrency
+        self.rate = rate
+        self.key_rate = key_rate
+        self.burst = burst
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self._providers = {}
+        self._keys = OrderedDict()  # (provider, key hash) -> _Limiter
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.rejected = 0
+
+    def call(self, provider: str, api_key: str, fn):
+        """Run fn() within the limits of provider and api_key, retrying transient errors."""
+        limiters = self._limiters(provider, api_key)
+        attempt = 0
+        while True:
+            self._acquire(limiters)
+            try:
+                result = fn()
+                self._succeeded(limiters)
+                return result
+            except ProviderError as exc:
+                delay = self._retry_delay(limiters, exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._release(limiters)
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(self, provider: str, api_key: str, fn):
+        """Async call(); fn() returns an awaitable."""
+        limiters = self._limiters(provider, api_key)
+        attempt = 0
+        while True:
+            await self._aacquire(limiters)
+            try:
+                result = await fn()
+                self._succeeded(limiters)
+                return result
+            except ProviderError as exc:
+                delay = self._retry_delay(limiters, exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._release(limiters)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stream(self, provider: str, api_key: str, factory):
+        """Yield from factory() holding a slot; retried only until the first chunk."""
+        limiters = self._limiters(provider, api_key)
+        attempt = 0
+        while True:
+            self._acquire(limiters)
+            started = False
+            chunks = factory()
+            try:
+                for chunk in chunks:
+                    started = True
+                    yield chunk
+                self._succeeded(limiters)
+                return
+            except ProviderError as exc:
+                delay = None if started else self._retry_delay(limiters, exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+                self._release(limiters)
+            attempt += 1
+            time.sleep(delay)
+
+    async def astream(self, provider: str, api_key: str, factory):
+        """Async stream(); factory() returns an async iterator."""
+        limiters = self._limiters(provider, api_key)
+        attempt = 0
+        while True:
+            await self._aacquire(limiters)
+            started = False
+            chunks = factory()
+            try:
+                async for chunk in chunks:
+                    started = True
+                    yield chunk
+                self._succeeded(limiters)
+                return
+            except ProviderError as exc:
+                delay = None if started else self._retry_delay(limiters, exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                if hasattr(chunks, 'aclose'):
+                    await chunks.aclose()
+                self._release(limiters)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            providers = dict(self._providers)
+            tracked_keys = len(self._keys)
+        return {
+            'providers': {name: limiter.stats() for name, limiter in providers.items()},
+            'tracked_keys': tracked_keys,
+            'retries': self.retries,
+            'rejected': self.rejected
+        }
+
+    def _limiters(self, provider: str, api_key: str) -> tuple:
+        provider = (provider or 'openai').lower()
+        key = (provider, hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:32])
+        with self._lock:
+            provider_limiter = self._providers.get(provider)
+            if provider_limiter is None:
+                provider_limiter = _Limiter(provider, self.concurrency, self.rate, self.burst, self.queue_size)
+                self._providers[provider] = provider_limiter
+            key_limiter = self._keys.get(key)
+            if key_limiter is None:
+                key_limiter = _Limiter(f'this {provider} API key', self.key_concurrency, self.key_rate, self.burst, self.queue_size)
+                self._keys[key] = key_limiter
+                self._evict_idle_keys()
+            else:
+                self._keys.move_to_end(key)
+        # Key first: waiting on the provider then only holds up this key
+        return key_limiter, provider_limiter
+
+    def _evict_idle_keys(self):
+        for key in list(self._keys):
+            if len(self._keys) <= MAX_TRACKED_KEYS:
+                break
+            limiter = self._keys[key]
+            if limiter.in_flight == 0 and limiter.waiting == 0:
+                del self._keys[key]
+
+    def _acquire(self, limiters: tuple):
+        deadline = time.monotonic() + self.queue_timeout
+        acquired = []
+        try:
+            for limiter in limiters:
+                limiter.acquire(deadline)
+                acquired.append(limiter)
+        except ProviderBusyError:
+            for limiter in acquired:
+                limiter.release()
+            self.rejected += 1
+            raise
+
+    async def _aacquire(self, limiters: tuple):
+        deadline = time.monotonic() + self.queue_timeout
+        acquired = []
+        try:
+            for limiter in limiters:
+                await limiter.aacquire(deadline)
+                acquired.append(limiter)
+        except BaseException as exc:
+            for limiter in acquired:
+                limiter.release()
+            if isinstance(exc, ProviderBusyError):
+                self.rejected += 1
+            raise
+
+    @staticmethod
+    def _release(limiters: tuple):
+        for limiter in limiters:
+            limiter.release()
+
+    @staticmethod
+    def _succeeded(limiters: tuple):
+        for limiter in limiters:
+            limiter.succeeded()
+
+    def _retry_delay(self, limiters: tuple, exc: ProviderError, attempt: int):
+        """Seconds to wait before retrying after exc, or None to give up."""
+        key_limiter, provider_limiter = limiters
+        retry_after = exc.retry_after
+        giving_up = (
+            not exc.retryable
+            or attempt >= self.max_retries
+            or (retry_after is not None and retry_after > PROVIDER_RETRY_AFTER_MAX)
+        )
+        if exc.status_code == 429:
+            key_limiter.throttled(retry_after)
+        elif exc.retryable and retry_after:
+            provider_limiter.throttled(retry_after)
+        if giving_up:
+            return None
+        # Full jitter, but never sooner than the server asked for
+        delay = random.uniform(0, min(PROVIDER_BACKOFF_MAX, PROVIDER_BACKOFF_BASE * (2 ** attempt)))
+        delay = max(delay, retry_after or 0.0)
+        self.retries += 1
+        logger.warning('Provider call failed (%s); retry %d in %.2fs', exc, attempt + 1, delay)
+        return delay
+
+
+provider_scheduler = ProviderScheduler()
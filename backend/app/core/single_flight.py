@@ -0,0 +1,246 @@
+# Single-flight coalescing of identical provider calls (per process).
+# Concurrent calls with the same agent settings, history and prompt share one
+# upstream request: the first caller starts it and the others attach to it.
+# A stream is pumped in the background into a shared buffer, so a caller
+# that joins late replays the chunks received so far and then follows the
+# live tail; the upstream call is abandoned once every caller has left.
+import asyncio
+import hashlib
+import json
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _ThreadStream:
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self.cancelled = False
+        self.changed = threading.Condition()
+
+
+class _AsyncCall:
+    __slots__ = ('task', 'subscribers', 'finished')
+
+    def __init__(self):
+        self.task = None
+        self.subscribers = 0
+        self.finished = False  # the task itself tells; see ado()
+
+
+class _AsyncStream:
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.joined = 0
+
+    def key(self, agent, prompt: str, api_key: str, history=None):
+        """Flight key for an agent call, or None when the agent does not coalesce calls."""
+        enabled = agent.coalesce_requests
+        if enabled is None:
+            # Only replies sampled at temperature 0 are interchangeable by default
+            enabled = agent.temperature == 0
+        if not enabled:
+            return None
+        material = json.dumps([
+            agent.provider,
+            agent._normalize_model_name(),
+            agent._build_system_prompt(),
+            agent.temperature,
+            agent.max_tokens,
+            agent.top_p,
+            agent.top_k,
+            hashlib.sha256((api_key or '').encode('utf-8')).hexdigest(),
+            history or [],
+            prompt
+        ], sort_keys=True, default=str)
+        return hashlib.sha1(material.encode('utf-8')).hexdigest()
+
+    def do(self, key, fn):
+        """Return fn(), sharing one execution among concurrent callers with the same key."""
+        if key is None:
+            return fn()
+        call, leader = self._join(('call', key), _Call)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            self._leave(('call', key), call)
+            call.done.set()
+
+    async def ado(self, key, fn):
+        """Async do(); fn() returns an awaitable."""
+        if key is None:
+            return await fn()
+        loop = asyncio.get_running_loop()
+        flight_key = ('acall', id(loop), key)
+        call, leader = self._join(flight_key, _AsyncCall)
+        if leader:
+            call.task = loop.create_task(fn())
+            call.task.add_done_callback(lambda task: self._leave(flight_key, call))
+        try:
+            # Shielded, so one caller going away does not cancel the others' call
+            return await asyncio.shield(call.task)
+        finally:
+            if self._unsubscribe(flight_key, call) and not call.task.done():
+                call.task.cancel()
+
+    def stream(self, key, factory):
+        """Yield the chunks of factory(), sharing one upstream stream per key."""
+        if key is None:
+            yield from factory()
+            return
+        flight, leader = self._join(('stream', key), _ThreadStream)
+        if leader:
+            threading.Thread(target=self._pump, args=(('stream', key), flight, factory), name='single-flight', daemon=True).start()
+        index = 0
+        try:
+            while True:
+                with flight.changed:
+                    while index >= len(flight.chunks) and not flight.finished:
+                        flight.changed.wait()
+                    chunks = flight.chunks[index:]
+                    finished, error = flight.finished, flight.error
+                for chunk in chunks:
+                    yield chunk
+                index += len(chunks)
+                if finished and index >= len(flight.chunks):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            if self._unsubscribe(('stream', key), flight):
+                with flight.changed:
+                    flight.cancelled = True
+
+    async def astream(self, key, factory):
+        """Async stream(); factory() returns an async iterator."""
+        if key is None:
+            async for chunk in factory():
+                yield chunk
+            return
+        loop = asyncio.get_running_loop()
+        flight_key = ('astream', id(loop), key)
+        flight, leader = self._join(flight_key, _AsyncStream)
+        if leader:
+            flight.task = loop.create_task(self._apump(flight_key, flight, factory))
+        index = 0
+        try:
+            while True:
+                while index < len(flight.chunks):
+                    chunk = flight.chunks[index]
+                    index += 1
+                    yield chunk
+                if flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            if self._unsubscribe(flight_key, flight):
+                flight.task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'in_flight': len(self._calls), 'leaders': self.leaders, 'joined': self.joined}
+
+    def _join(self, flight_key, factory) -> tuple:
+        with self._lock:
+            flight = self._calls.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = factory()
+                self._calls[flight_key] = flight
+                self.leaders += 1
+            else:
+                self.joined += 1
+            if hasattr(flight, 'subscribers'):
+                flight.subscribers += 1
+            return flight, leader
+
+    def _unsubscribe(self, flight_key, flight) -> bool:
+        """Drop a caller; True when it was the last one of an unfinished flight."""
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers > 0 or flight.finished:
+                return False
+            # Nobody is listening: new callers must not join the abandoned flight
+            if self._calls.get(flight_key) is flight:
+                del self._calls[flight_key]
+            return True
+
+    def _leave(self, flight_key, flight):
+        # Later callers start a new flight instead of joining a finished one
+        with self._lock:
+            if self._calls.get(flight_key) is flight:
+                del self._calls[flight_key]
+
+    def _pump(self, flight_key, flight: _ThreadStream, factory):
+        chunks = factory()
+        try:
+            for chunk in chunks:
+                with flight.changed:
+                    if flight.cancelled:
+                        break
+                    flight.chunks.append(chunk)
+                    flight.changed.notify_all()
+        except Exception as exc:
+            flight.error = exc
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            self._leave(flight_key, flight)
+            with flight.changed:
+                flight.finished = True
+                flight.changed.notify_all()
+
+    async def _apump(self, flight_key, flight: _AsyncStream, factory):
+        chunks = factory()
+        try:
+            async for chunk in chunks:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except Exception as exc:
+            flight.error = exc
+        finally:
+            if hasattr(chunks, 'aclose'):
+                await chunks.aclose()
+            self._leave(flight_key, flight)
+            flight.finished = True
+            flight.notify()
+
+
+single_flight = SingleFlight()
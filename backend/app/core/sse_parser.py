@@ -0,0 +1,78 @@
+# Incremental parser for the server-sent event streams of the model APIs.
+# Works on raw byte chunks as they come off the socket: partial lines carry
+# over to the next chunk, multi-line data fields are joined, and only the
+# data of complete events is returned, still as bytes, so nothing is decoded
+# before the JSON parser sees it.
+import json
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Parses event data straight from bytes
+loads = orjson.loads if orjson is not None else json.loads
+
+
+class SSEParser:
+    def __init__(self):
+        self._partial = []  # pieces of a line not terminated yet
+        self._data = []  # data lines of the event being read
+
+    def feed(self, chunk: bytes) -> list:
+        """Consume a chunk; return the data of the events it completed."""
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            if chunk:
+                self._partial.append(chunk)
+            return []
+        if self._partial:
+            self._partial.append(chunk[:end])
+            lines = b''.join(self._partial).split(b'\n')
+            self._partial = []
+        else:
+            lines = chunk[:end].split(b'\n')
+        if end + 1 < len(chunk):
+            self._partial.append(chunk[end + 1:])
+        return self._lines(lines)
+
+    def close(self) -> list:
+        """End of stream: the data of a last event that was not terminated."""
+        lines = [b''.join(self._partial)] if self._partial else []
+        self._partial = []
+        lines.append(b'')
+        return self._lines(lines)
+
+    def _lines(self, lines: list) -> list:
+        events = []
+        data = self._data
+        for line in lines:
+            if line.endswith(b'\r'):
+                line = line[:-1]
+            if not line:
+                # A blank line ends the event
+                if data:
+                    events.append(data[0] if len(data) == 1 else b'\n'.join(data))
+                    data = self._data = []
+            elif line.startswith(b'data:'):
+                data.append(line[6:] if line.startswith(b'data: ') else line[5:])
+            # Comments and the event, id and retry fields are not used by the providers
+        return events
+
+
+def iter_sse_data(chunks):
+    """Data of each event in an iterable of byte chunks."""
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+async def aiter_sse_data(chunks):
+    """iter_sse_data for an async iterable of byte chunks."""
+    parser = SSEParser()
+    async for chunk in chunks:
+        for data in parser.feed(chunk):
+            yield data
+    for data in parser.close():
+        yield data
@@ -0,0 +1,100 @@
+# Shared HTTP transport for model provider calls.
+# Keeps one pooled keep-alive session (and one async client) per provider so
+# chat turns reuse TCP/TLS connections instead of paying a fresh handshake.
+import asyncio
+import os
+import threading
+
+POOL_CONNECTIONS = int(os.environ.get('PROVIDER_POOL_CONNECTIONS', '10'))
+POOL_MAXSIZE = int(os.environ.get('PROVIDER_POOL_MAXSIZE', '50'))
+# Open connections per async client; a stream holds one for its whole reply,
+# so this bounds concurrent streams per provider and worker (0 = no limit).
+# Only POOL_MAXSIZE idle connections are kept alive.
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('PROVIDER_ASYNC_MAX_CONNECTIONS', '0'))
+CONNECT_TIMEOUT = float(os.environ.get('PROVIDER_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.environ.get('PROVIDER_READ_TIMEOUT', '60'))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_async_clients = {}
+
+
+def get_requests_module():
+    try:
+        import requests  # type: ignore
+    except ImportError as exc:  # pragma: no cover
+        raise RuntimeError('The "requests" package is not available in the backend environment.') from exc
+    return requests
+
+
+def get_session(provider: str):
+    """Return the shared pooled session for a provider, creating it on first use."""
+    key = (provider or 'openai').lower()
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _create_session()
+            _sessions[key] = session
+    return session
+
+
+def get_async_client(provider: str):
+    """Return the shared pooled async client for a provider, creating it on first use."""
+    # Clients are bound to the event loop they were first used on
+    key = ((provider or 'openai').lower(), id(asyncio.get_running_loop()))
+    client = _async_clients.get(key)
+    if client is None or client.is_closed:
+        httpx = get_httpx_module()
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_MAX_CONNECTIONS or None,
+                max_keepalive_connections=POOL_MAXSIZE
+            ),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+        )
+        _async_clients[key] = client
+    return client
+
+
+def get_httpx_module():
+    try:
+        import httpx  # type: ignore
+    except ImportError as exc:  # pragma: no cover
+        raise RuntimeError('The "httpx" package is not available in the backend environment.') from exc
+    return httpx
+
+
+def request_timeout():
+    """(connect, read) timeout tuple passed to every provider request."""
+    return (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+
+def close_sessions():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+async def aclose_clients():
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def _create_session():
+    requests = get_requests_module()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=0
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
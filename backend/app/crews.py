@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from . import database, models, schemas
+from .runtime import runtime_agents
+from .security import get_user_from_auth
+from .sse import encode_event
+from .core.crew import CREW_MAX_CONCURRENCY, Crew, CrewError, CrewTask
+import os
+
+router = APIRouter(tags=['crews'])
+
+CREW_MAX_TASKS = int(os.environ.get('CREW_MAX_TASKS', '50'))
+
+def _build_crew(payload: schemas.CrewRunRequest, authorization: str, db: Session) -> Crew:
+    """Authenticate, load every agent of the crew in one query and check the task graph."""
+    user = get_user_from_auth(authorization, db)
+    if not user:
+        raise HTTPException(status_code=401, detail='Invalid token')
+    agent_ids = {task.agent_id for task in payload.tasks}
+    agents = {
+        agent.id: agent
+        for agent in db.query(models.Agent).filter(models.Agent.id.in_(agent_ids), models.Agent.owner_id == user.id).all()
+    }
+
+    tasks = []
+    for task in payload.tasks:
+        agent = agents.get(task.agent_id)
+        if agent is None:
+            raise HTTPException(status_code=404, detail=f'Agent not found for task "{task.id}"')
+        runtime = runtime_agents.get_or_create(agent)
+        api_key = (task.api_key or agent.api_key or '').strip()
+        if not api_key and runtime.requires_api_key:
+            raise HTTPException(status_code=400, detail=f'No API key configured for the agent of task "{task.id}".')
+        tasks.append(CrewTask(task.id, runtime, task.prompt, task.depends_on, api_key))
+
+    # Hand the pooled connection back; the session otherwise keeps it while the crew runs
+    db.close()
+    concurrency = max(1, min(payload.concurrency or CREW_MAX_CONCURRENCY, CREW_MAX_CONCURRENCY))
+    try:
+        return Crew(tasks, max_concurrency=concurrency)
+    except CrewError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+@router.post('/run', response_model=schemas.CrewRunResponse)
+async def run_crew(payload: schemas.CrewRunRequest, authorization: str = Header(None), db: Session = Depends(database.get_db)):
+    """Run a DAG of agent tasks; independent tasks run concurrently and each sees its dependencies' outputs."""
+    if not payload.tasks:
+        raise HTTPException(status_code=400, detail='Crew has no tasks')
+    if len(payload.tasks) > CREW_MAX_TASKS:
+        raise HTTPException(status_code=400, detail=f'Crews are limited to {CREW_MAX_TASKS} tasks')
+    crew = await run_in_threadpool(_build_crew, payload, authorization, db)
+
+    if payload.stream:
+        async def generate():
+            events = crew.run(stream=True)
+            try:
+                async for event in events:
+                    yield encode_event(event)
+                yield encode_event({'type': 'done', 'count': len(crew.tasks)})
+            finally:
+                # Client went away: stop the agent calls that are still running
+                await events.aclose()
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    finished = await crew.execute()
+    results = []
+    for task in payload.tasks:
+        event = finished[task.id]
+        result = {'id': task.id, 'agent_id': task.agent_id, 'status': event['type'][len('task_'):]}
+        if event['type'] == 'task_done':
+            result['output'] = event['output']
+        else:
+            result['error'] = event.get('message') or event.get('reason')
+        results.append(result)
+    return {'results': results}
@@ -1,11 +1,13 @@
 import os
-from typing import Optional
-from sqlalchemy import create_engine, inspect, text
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from .db_profiles import configure_engine, engine_options
+
 DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///./data/ai_agent_builder.db')
 
-engine = create_engine(DATABASE_URL, connect_args={'check_same_thread': False} if DATABASE_URL.startswith('sqlite') else {})
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+configure_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -17,34 +19,6 @@ def get_db():
         db.close()
 
 def init_db():
-    from . import models
-    Base.metadata.create_all(bind=engine)
-    _ensure_agent_column(
-        'api_key',
-        'ALTER TABLE agents ADD COLUMN api_key VARCHAR'
-    )
-    _ensure_agent_column(
-        'provider',
-        "ALTER TABLE agents ADD COLUMN provider VARCHAR DEFAULT 'openai'",
-        "UPDATE agents SET provider='openai' WHERE provider IS NULL"
-    )
-    _ensure_agent_column(
-        'top_p',
-        'ALTER TABLE agents ADD COLUMN top_p FLOAT DEFAULT 1.0',
-        "UPDATE agents SET top_p=1.0 WHERE top_p IS NULL"
-    )
-    _ensure_agent_column(
-        'top_k',
-        'ALTER TABLE agents ADD COLUMN top_k INTEGER DEFAULT 50',
-        "UPDATE agents SET top_k=50 WHERE top_k IS NULL"
-    )
-
-def _ensure_agent_column(column_name: str, alter_sql: str, post_sql: Optional[str] = None):
-    inspector = inspect(engine)
-    columns = {col['name'] for col in inspector.get_columns('agents')}
-    if column_name in columns:
-        return
-    with engine.begin() as conn:
-        conn.execute(text(alter_sql))
-        if post_sql:
-            conn.execute(text(post_sql))
+    from . import models  # noqa: F401 (registers the tables on Base.metadata)
+    from .migrations import run_migrations
+    run_migrations(engine, Base.metadata)
@@ -0,0 +1,87 @@
+# Engine profiles per database backend.
+# SQLite gets WAL journaling and connection pragmas applied on every connect,
+# so concurrent chats neither block on the rollback journal nor fsync on each
+# commit; Postgres gets a pre-pinged, recycled connection pool.
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+
+# SQLite
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+# Page cache per connection in KiB (passed to SQLite as a negative cache_size)
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '65536'))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+# Connection pool (both backends)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+
+# Postgres
+POSTGRES_CONNECT_TIMEOUT = int(os.environ.get('POSTGRES_CONNECT_TIMEOUT', '5'))
+POSTGRES_STATEMENT_TIMEOUT_MS = int(os.environ.get('POSTGRES_STATEMENT_TIMEOUT_MS', '0'))
+
+
+def engine_options(url: str) -> dict:
+    """Keyword arguments for create_engine suited to the backend of url."""
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        return _sqlite_options(url)
+    if backend == 'postgresql':
+        return _postgres_options()
+    return {}
+
+
+def configure_engine(engine):
+    """Install per-connection setup (SQLite pragmas) on an engine."""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _apply_sqlite_pragmas)
+
+
+def _sqlite_options(url: str) -> dict:
+    options = {'connect_args': {'check_same_thread': False}}
+    database = make_url(url).database
+    if not database or database == ':memory:':
+        # Every connection to :memory: is a separate database; share one
+        options['poolclass'] = StaticPool
+        return options
+    options.update(
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT
+    )
+    return options
+
+
+def _postgres_options() -> dict:
+    connect_args = {'connect_timeout': POSTGRES_CONNECT_TIMEOUT}
+    if POSTGRES_STATEMENT_TIMEOUT_MS > 0:
+        connect_args['options'] = f'-c statement_timeout={POSTGRES_STATEMENT_TIMEOUT_MS}'
+    return {
+        'connect_args': connect_args,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        # Drop connections closed by the server or a proxy while idle
+        'pool_pre_ping': True
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout first, so switching the journal mode can wait for a lock
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.execute(f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}')
+        cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+        cursor.execute(f'PRAGMA cache_size={-SQLITE_CACHE_SIZE_KB}')
+        cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    finally:
+        cursor.close()
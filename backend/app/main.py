@@ -1,18 +1,44 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+from typing import Optional
 from .database import init_db
+from .core.metrics import registry
+from .core.response_cache import response_cache
+from .core.scheduler import provider_scheduler
+from .core.single_flight import single_flight
+from .core.transport import aclose_clients, close_sessions
+from .persistence import message_writer
+from .runtime import runtime_agents
+from .security import token_cache
+from .stream_sessions import stream_sessions
+from .shared_state import shared_state
+from .utils import shutdown_password_executor
 from .auth import router as auth_router
 from .agents import router as agents_router
 from .chat import router as chat_router
+from .crews import router as crews_router
+import hmac
+import os
+
+# When set, GET /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     init_db()
+    message_writer.start()
+    shared_state.start()
     yield
-    # Shutdown (if needed)
-    
+    # Shutdown
+    shared_state.stop()
+    message_writer.stop()
+    shutdown_password_executor()
+    close_sessions()
+    await aclose_clients()
+
 print("===================================================")
 print("Frontend is running on ====> http://0.0.0.0:3000")
 print("Backend is running  on ====> http://0.0.0.0:8000")
@@ -32,3 +58,19 @@ app.add_middleware(
 app.include_router(auth_router, prefix="/auth")
 app.include_router(agents_router, prefix="/agents")
 app.include_router(chat_router, prefix="/chat")
+app.include_router(crews_router, prefix="/crews")
+
+
+registry.register_stats('token_cache', 'Auth token cache', token_cache.stats)
+registry.register_stats('runtime_agents', 'Runtime agent cache', runtime_agents.stats)
+registry.register_stats('response_cache', 'Model response cache', response_cache.stats)
+registry.register_stats('provider_scheduler', 'Provider call scheduler', provider_scheduler.stats, labelname='provider')
+registry.register_stats('single_flight', 'Coalesced provider calls', single_flight.stats)
+registry.register_stats('stream_sessions', 'Resumable chat streams', lambda: {'active': len(stream_sessions)})
+registry.register_stats('shared_state', 'Shared state events', shared_state.stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or '', f'Bearer {METRICS_TOKEN}'):
+        raise HTTPException(status_code=401, detail='Invalid metrics token')
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
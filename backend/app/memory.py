@@ -0,0 +1,212 @@
+# Conversation memory for chat turns (per process).
+# Recent messages of each agent live in a ring buffer so the context for the
+# next provider call is assembled without re-reading chat_messages. The
+# history table is only queried once, when an agent is first seen.
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+
+from . import models
+from .persistence import message_writer
+from .shared_state import RESYNC_EVENT, shared_state
+
+# 'window' sends the most recent turns that fit the budget, 'summary' also
+# folds older turns into a rolling summary, 'off' sends no history at all.
+MEMORY_MODE = os.environ.get('MEMORY_MODE', 'window').lower()
+MEMORY_TURNS = int(os.environ.get('MEMORY_TURNS', '50'))
+MEMORY_MAX_AGENTS = int(os.environ.get('MEMORY_MAX_AGENTS', '1024'))
+# Upper bound on history tokens per call, whatever the model could accept
+MEMORY_MAX_TOKENS = int(os.environ.get('MEMORY_MAX_TOKENS', '4096'))
+MEMORY_SUMMARY_TOKENS = int(os.environ.get('MEMORY_SUMMARY_TOKENS', '512'))
+
+# Context window sizes by model name prefix, longest prefix wins
+MODEL_CONTEXT_TOKENS = {
+    'gpt-4o': 128000,
+    'gpt-4-turbo': 128000,
+    'gpt-4-1106': 128000,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'gemini-1.5': 1000000,
+    'gemini-2': 1000000,
+    'gemini': 32768,
+    'accounts/fireworks': 32768,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budgeting."""
+    return len(text or '') // 4 + 1
+
+
+def context_window(model: str) -> int:
+    name = (model or '').strip().lower()
+    best = None
+    for prefix in MODEL_CONTEXT_TOKENS:
+        if name.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return MODEL_CONTEXT_TOKENS[best] if best else DEFAULT_CONTEXT_TOKENS
+
+
+def history_budget(runtime, prompt: str) -> int:
+    """Tokens left for history once the system prompt, prompt and reply are reserved."""
+    max_tokens = runtime.max_tokens if runtime.max_tokens and runtime.max_tokens > 0 else 1024
+    reserved = max_tokens + estimate_tokens(runtime._build_system_prompt()) + estimate_tokens(prompt)
+    return max(0, min(MEMORY_MAX_TOKENS, context_window(runtime.model) - reserved))
+
+
+class _AgentMemory:
+    __slots__ = ('turns', 'summary')
+
+    def __init__(self):
+        self.turns = deque(maxlen=MEMORY_TURNS)  # (role, content)
+        self.summary = deque()  # one extractive line per turn that left the buffer
+
+
+class ConversationMemory:
+    def __init__(self, mode: str = MEMORY_MODE, max_agents: int = MEMORY_MAX_AGENTS):
+        self.mode = mode
+        self.max_agents = max_agents
+        self._agents = OrderedDict()  # agent_id -> _AgentMemory
+        self._lock = threading.Lock()
+
+    def context(self, agent_id: int, runtime, prompt: str, db) -> list:
+        """Prior turns for the next call to runtime, oldest first, within the token budget."""
+        if self.mode == 'off':
+            return []
+        memory = self._get(agent_id, db)
+        budget = history_budget(runtime, prompt)
+        # In summary mode part of the budget is held back for the summary
+        summary_budget = min(MEMORY_SUMMARY_TOKENS, budget // 4) if self.mode == 'summary' else 0
+        turn_budget = budget - summary_budget
+
+        with self._lock:
+            turns = list(memory.turns)
+            summary_lines = list(memory.summary)
+
+        selected = []
+        used = 0
+        index = len(turns)
+        while index > 0:
+            role, content = turns[index - 1]
+            cost = estimate_tokens(content)
+            if used + cost > turn_budget:
+                break
+            selected.append({'role': role, 'content': content})
+            used += cost
+            index -= 1
+        selected.reverse()
+        history = _merge_roles(selected)
+
+        if self.mode == 'summary':
+            # Turns that did not fit the budget join the rolling summary
+            summary_lines.extend(_summary_line(role, content) for role, content in turns[:index])
+            summary = _trim_summary(summary_lines, summary_budget)
+            if summary:
+                history.insert(0, {'role': 'system', 'content': f'Summary of the earlier conversation:\n{summary}'})
+        return history
+
+    def append(self, agent_id: int, sender: str, message: str):
+        if self.mode == 'off':
+            return
+        role = 'user' if sender == 'user' else 'assistant'
+        with self._lock:
+            memory = self._agents.get(agent_id)
+            if memory is None:
+                # Not loaded yet; the next context() call reads it from the table
+                return
+            if self.mode == 'summary' and len(memory.turns) == memory.turns.maxlen:
+                old_role, old_content = memory.turns[0]
+                memory.summary.append(_summary_line(old_role, old_content))
+                while len(memory.summary) > MEMORY_TURNS:
+                    memory.summary.popleft()
+            memory.turns.append((role, message or ''))
+
+    def discard(self, agent_id: int):
+        with self._lock:
+            self._agents.pop(agent_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._agents.clear()
+
+    def _get(self, agent_id: int, db) -> _AgentMemory:
+        with self._lock:
+            memory = self._agents.get(agent_id)
+            if memory is not None:
+                self._agents.move_to_end(agent_id)
+                return memory
+
+        message_writer.flush()
+        rows = (
+            db.query(models.ChatMessage.sender, models.ChatMessage.message)
+            .filter(models.ChatMessage.agent_id == agent_id)
+            .order_by(models.ChatMessage.created_at.desc(), models.ChatMessage.id.desc())
+            .limit(MEMORY_TURNS)
+            .all()
+        )
+        memory = _AgentMemory()
+        for sender, message in reversed(rows):
+            memory.turns.append(('user' if sender == 'user' else 'assistant', message or ''))
+
+        with self._lock:
+            existing = self._agents.get(agent_id)
+            if existing is not None:
+                return existing
+            self._agents[agent_id] = memory
+            while self.max_agents > 0 and len(self._agents) > self.max_agents:
+                self._agents.popitem(last=False)
+        return memory
+
+
+def _merge_roles(turns: list) -> list:
+    # Providers expect user/assistant turns to alternate; a failed generation
+    # can leave two user messages in a row, so consecutive turns are joined.
+    merged = []
+    for turn in turns:
+        if merged and merged[-1]['role'] == turn['role']:
+            merged[-1]['content'] += '\n\n' + turn['content']
+        else:
+            merged.append(turn)
+    # The current prompt is a user turn, so history must not end with one
+    if merged and merged[-1]['role'] == 'user':
+        merged.pop()
+    return merged
+
+
+def _summary_line(role: str, content: str) -> str:
+    text = ' '.join((content or '').split())
+    text = _SENTENCE_END.split(text, 1)[0]
+    if len(text) > 160:
+        text = text[:157] + '...'
+    return f"{'User' if role == 'user' else 'Assistant'}: {text}"
+
+
+def _trim_summary(lines: list, budget: int) -> str:
+    # Keep the most recent lines that fit the budget
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return '\n'.join(reversed(kept))
+
+
+conversation_memory = ConversationMemory()
+
+
+def _discard_written(data: dict):
+    for agent_id in data['agent_ids']:
+        conversation_memory.discard(agent_id)
+
+
+# Turns stored and agents deleted through another worker
+shared_state.subscribe('chat_messages.written', _discard_written)
+shared_state.subscribe('agent.discard', lambda data: conversation_memory.discard(data['agent_id']))
+shared_state.subscribe(RESYNC_EVENT, lambda data: conversation_memory.clear())
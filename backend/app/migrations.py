@@ -0,0 +1,167 @@
+# Versioned schema migrations.
+# The applied version is stored in schema_version, so a startup against a
+# current database costs two small queries. Otherwise the schema is reflected
+# once and only the pending steps run, each skipping work that is already
+# done (databases created before versioning may have any of the columns).
+import logging
+import time
+
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+_version_metadata = MetaData()
+schema_version = Table(
+    'schema_version',
+    _version_metadata,
+    Column('version', Integer, nullable=False)
+)
+
+
+class _Schema:
+    """Reflection of the live schema, read once per table and shared by all steps."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.inspector = inspect(conn)
+        self._columns = {}
+        self._indexes = {}
+
+    def has_table(self, table: str) -> bool:
+        return self.inspector.has_table(table)
+
+    def columns(self, table: str) -> set:
+        if table not in self._columns:
+            self._columns[table] = {col['name'] for col in self.inspector.get_columns(table)}
+        return self._columns[table]
+
+    def indexes(self, table: str) -> set:
+        if table not in self._indexes:
+            self._indexes[table] = {index['name'] for index in self.inspector.get_indexes(table)}
+        return self._indexes[table]
+
+
+def _add_agent_column(column_name: str, alter_sql: str, post_sql: str = None):
+    def step(schema: _Schema):
+        if column_name in schema.columns('agents'):
+            return
+        schema.conn.execute(text(alter_sql))
+        if post_sql:
+            schema.conn.execute(text(post_sql))
+        schema.columns('agents').add(column_name)
+    return step
+
+
+def _create_chat_message_index(name: str, columns: str):
+    def step(schema: _Schema):
+        if name in schema.indexes('chat_messages'):
+            return
+        schema.conn.execute(text(f'CREATE INDEX {name} ON chat_messages ({columns})'))
+        schema.indexes('chat_messages').add(name)
+    return step
+
+
+def _replace_chat_message_index(old_name: str, name: str, columns: str):
+    create = _create_chat_message_index(name, columns)
+
+    def step(schema: _Schema):
+        create(schema)
+        if old_name in schema.indexes('chat_messages'):
+            schema.conn.execute(text(f'DROP INDEX {old_name}'))
+            schema.indexes('chat_messages').discard(old_name)
+    return step
+
+
+# (version, description, step); append new steps, never reorder or edit old ones.
+# A current database skips create_all, so tables added later need a step too.
+MIGRATIONS = [
+    (1, 'agents.api_key', _add_agent_column(
+        'api_key',
+        'ALTER TABLE agents ADD COLUMN api_key VARCHAR'
+    )),
+    (2, 'agents.provider', _add_agent_column(
+        'provider',
+        "ALTER TABLE agents ADD COLUMN provider VARCHAR DEFAULT 'openai'",
+        "UPDATE agents SET provider='openai' WHERE provider IS NULL"
+    )),
+    (3, 'agents.top_p', _add_agent_column(
+        'top_p',
+        'ALTER TABLE agents ADD COLUMN top_p FLOAT DEFAULT 1.0',
+        "UPDATE agents SET top_p=1.0 WHERE top_p IS NULL"
+    )),
+    (4, 'agents.top_k', _add_agent_column(
+        'top_k',
+        'ALTER TABLE agents ADD COLUMN top_k INTEGER DEFAULT 50',
+        "UPDATE agents SET top_k=50 WHERE top_k IS NULL"
+    )),
+    (5, 'chat_messages (agent_id, id) index', _create_chat_message_index(
+        'ix_chat_messages_agent_id_id', 'agent_id, id'
+    )),
+    (6, 'agents.coalesce_requests', _add_agent_column(
+        'coalesce_requests',
+        'ALTER TABLE agents ADD COLUMN coalesce_requests BOOLEAN'
+    )),
+    (7, 'chat_messages (agent_id, created_at, id) index', _replace_chat_message_index(
+        'ix_chat_messages_agent_id_id', 'ix_chat_messages_agent_id_created_at_id', 'agent_id, created_at, id'
+    )),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def run_migrations(engine, metadata, attempts: int = 3):
+    """Bring the database up to SCHEMA_VERSION; returns the version it started from."""
+    for attempt in range(attempts):
+        try:
+            return _migrate(engine, metadata)
+        except (OperationalError, IntegrityError):
+            # SQLite has no advisory lock: another worker migrating at the
+            # same time makes this one fail, after which the schema is current
+            if attempt == attempts - 1:
+                raise
+            logger.info('Schema migration raced with another process; retrying')
+            time.sleep(0.2 * (attempt + 1))
+
+
+def _migrate(engine, metadata):
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Replicas starting together migrate one at a time
+            conn.execute(text('SELECT pg_advisory_xact_lock(7210523)'))
+        current = _read_version(conn)
+        if current is not None and current >= SCHEMA_VERSION:
+            return current
+
+        schema = _Schema(conn)
+        fresh = not schema.has_table('agents')
+        # New tables (and, on a fresh database, the whole current schema)
+        metadata.create_all(bind=conn)
+        if not fresh:
+            for version, description, step in MIGRATIONS:
+                if version > (current or 0):
+                    logger.info('Applying schema migration %d: %s', version, description)
+                    step(schema)
+        _write_version(conn, current)
+
+    logger.info(
+        'Schema migrated from version %s to %d in %.1f ms',
+        current or 0, SCHEMA_VERSION, (time.perf_counter() - started) * 1000
+    )
+    return current or 0
+
+
+def _read_version(conn):
+    # None when the database predates versioning (or is empty)
+    if not inspect(conn).has_table('schema_version'):
+        _version_metadata.create_all(bind=conn)
+        return None
+    return conn.execute(select(schema_version.c.version)).scalar()
+
+
+def _write_version(conn, current):
+    if current is None:
+        conn.execute(schema_version.insert().values(version=SCHEMA_VERSION))
+    else:
+        conn.execute(schema_version.update().values(version=SCHEMA_VERSION))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Text, DateTime, func
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Text, DateTime, Index, func
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -23,6 +23,8 @@ class Agent(Base):
     top_k = Column(Integer, default=3)
     api_key = Column(String)
     provider = Column(String, default='openai')
+    # NULL: coalesce identical concurrent calls only when temperature is 0
+    coalesce_requests = Column(Boolean, nullable=True)
     owner_id = Column(Integer, ForeignKey('users.id'))
     owner = relationship('User', back_populates='agents')
     chats = relationship('ChatMessage', back_populates='agent', cascade='all, delete')
@@ -35,3 +37,13 @@ class ChatMessage(Base):
     message = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     agent = relationship('Agent', back_populates='chats')
+    # History and memory read an agent's messages in (created_at, id) order along
+    # this index. Ids come from per-process blocks (persistence.IdAllocator), so
+    # with several workers they do not follow creation order on their own.
+    __table_args__ = (Index('ix_chat_messages_agent_id_created_at_id', 'agent_id', 'created_at', 'id'),)
+
+class IdSequence(Base):
+    # Next free id per table, reserved in blocks by persistence.IdAllocator
+    __tablename__ = 'id_sequences'
+    name = Column(String, primary_key=True)
+    next_value = Column(Integer, nullable=False)
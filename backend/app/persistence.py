@@ -0,0 +1,252 @@
+# Write-behind persistence for chat messages.
+# Messages get their id immediately from a block of preallocated ids and are
+# inserted by a background thread that group-commits them in batches, so a
+# chat turn no longer waits on two separate commits.
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+from .core.metrics import message_write_seconds
+from .database import engine
+from .shared_state import shared_state
+
+MESSAGE_BATCH_SIZE = int(os.environ.get('MESSAGE_BATCH_SIZE', '100'))
+# How long the writer waits for more messages before committing a batch (milliseconds)
+MESSAGE_FLUSH_MS = float(os.environ.get('MESSAGE_FLUSH_MS', '20'))
+MESSAGE_ID_BLOCK = int(os.environ.get('MESSAGE_ID_BLOCK', '1000'))
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class IdAllocator:
+    """Hands out ids from blocks reserved in the id_sequences table.
+
+    Reserving a block is one short transaction, so several processes can
+    allocate ids for the same table without colliding.
+    """
+
+    def __init__(self, table, block_size: int = MESSAGE_ID_BLOCK):
+        self.table = table
+        self.block_size = max(1, block_size)
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._reserve()
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve(self) -> int:
+        sequences = models.IdSequence.__table__
+        name = self.table.name
+        for _ in range(2):
+            try:
+                with engine.begin() as conn:
+                    updated = conn.execute(
+                        update(sequences)
+                        .where(sequences.c.name == name)
+                        .values(next_value=sequences.c.next_value + self.block_size)
+                    ).rowcount
+                    if updated:
+                        next_value = conn.execute(select(sequences.c.next_value).where(sequences.c.name == name)).scalar()
+                        return next_value - self.block_size
+                    # First reservation: start above any id already in the table
+                    start = conn.execute(select(func.coalesce(func.max(self.table.c.id), 0) + 1)).scalar()
+                    conn.execute(insert(sequences).values(name=name, next_value=start + self.block_size))
+                    return start
+            except IntegrityError:
+                # Another process created the sequence row first; reserve from it
+                continue
+        raise RuntimeError(f'Could not reserve ids for table "{name}"')
+
+
+class MessageWriter:
+    def __init__(self, batch_size: int = MESSAGE_BATCH_SIZE, flush_ms: float = MESSAGE_FLUSH_MS):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_ms / 1000.0
+        self.ids = IdAllocator(models.ChatMessage.__table__)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        # Held by the writer thread for its whole life: request threads wait in
+        # flush() while holding pooled connections, so the writer must never
+        # need one from the pool itself
+        self._conn = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Write everything still queued, then stop the writer thread."""
+        if self._writer_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._thread = None
+
+    def enqueue(self, agent_id: int, sender: str, message: str) -> int:
+        """Queue a chat message and return the id it will be stored under."""
+        row = {
+            'id': self.ids.next_id(),
+            'agent_id': agent_id,
+            'sender': sender,
+            'message': message,
+            'created_at': datetime.now(timezone.utc)
+        }
+        if not self._writer_alive():
+            # Writer not running (e.g. outside the app lifespan): write through
+            self._write([row])
+        else:
+            self._queue.put(row)
+        return row['id']
+
+    def enqueue_many(self, messages: list) -> list:
+        """Queue (agent_id, sender, message) tuples; returns their ids in order."""
+        now = datetime.now(timezone.utc)
+        rows = [
+            {'id': self.ids.next_id(), 'agent_id': agent_id, 'sender': sender, 'message': message, 'created_at': now}
+            for agent_id, sender, message in messages
+        ]
+        if not self._writer_alive():
+            if rows:
+                self._write(rows)
+        else:
+            for row in rows:
+                self._queue.put(row)
+        return [row['id'] for row in rows]
+
+    def flush(self):
+        """Block until every message queued so far is committed."""
+        if not self._writer_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        while not done.wait(1.0):
+            if not self._writer_alive():
+                break
+
+    def _writer_alive(self) -> bool:
+        """Whether queued messages will be written; takes over from a writer thread that died."""
+        if self._thread is None:
+            return False
+        if self._thread.is_alive():
+            return True
+        with self._thread_lock:
+            if self._thread is None or self._thread.is_alive():
+                return self._thread is not None
+            logger.error('Message writer thread died; writing chat messages synchronously')
+            self._thread = None
+            # Write what it left behind, so ids already handed out are stored
+            rows, waiters = [], []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item is not _STOP:
+                    rows.append(item)
+            if rows:
+                self._write(rows)
+            for waiter in waiters:
+                waiter.set()
+        return False
+
+    def _run(self):
+        self._conn = engine.connect()
+        try:
+            self._loop()
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            rows, waiters, stopping = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    rows.append(item)
+                if stopping or waiters or len(rows) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if stopping:
+                # Drain whatever was queued before the stop marker
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                    elif item is not _STOP:
+                        rows.append(item)
+            if rows:
+                self._write(rows)
+            for waiter in waiters:
+                waiter.set()
+            if stopping:
+                return
+
+    def _write(self, rows: list):
+        self._insert(rows)
+        # Other processes reload these conversations from the table when next used
+        shared_state.publish('chat_messages.written', {'agent_ids': sorted({row['agent_id'] for row in rows})})
+
+    def _insert(self, rows: list):
+        table = models.ChatMessage.__table__
+        try:
+            with message_write_seconds.time(), self._begin() as conn:
+                conn.execute(insert(table), rows)
+            return
+        except Exception:
+            logger.exception('Batch insert of %d chat messages failed; retrying one by one', len(rows))
+        # Isolate the bad rows (e.g. messages of an agent deleted meanwhile)
+        for row in rows:
+            try:
+                with self._begin() as conn:
+                    conn.execute(insert(table), [row])
+            except Exception:
+                logger.exception('Dropping chat message %s for agent %s', row['id'], row['agent_id'])
+
+    @contextmanager
+    def _begin(self):
+        if self._conn is None:
+            with engine.begin() as conn:
+                yield conn
+        else:
+            # An invalidated connection reconnects on its next use
+            with self._conn.begin():
+                yield self._conn
+
+
+message_writer = MessageWriter()
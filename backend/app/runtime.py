@@ -0,0 +1,110 @@
+# Registry of runtime CrewAgent instances (per process).
+# Bounded by size and age; an entry is rebuilt only when the agent's stored
+# settings change, detected through a fingerprint of those settings.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .core.crew_stub import CrewAgent
+from .shared_state import RESYNC_EVENT, shared_state
+
+RUNTIME_AGENT_CACHE_SIZE = int(os.environ.get('RUNTIME_AGENT_CACHE_SIZE', '1024'))
+RUNTIME_AGENT_TTL = float(os.environ.get('RUNTIME_AGENT_TTL', '3600'))
+
+
+def agent_fingerprint(agent) -> tuple:
+    """Settings of an agent row that affect its runtime instance."""
+    return (
+        agent.name,
+        agent.role,
+        agent.goal,
+        agent.model_name,
+        agent.temperature,
+        agent.max_tokens,
+        agent.top_p,
+        agent.top_k,
+        agent.api_key,
+        agent.provider,
+        agent.coalesce_requests,
+        agent.owner_id
+    )
+
+
+def build_runtime(agent) -> CrewAgent:
+    return CrewAgent(
+        agent.name,
+        role=agent.role,
+        goal=agent.goal,
+        model=agent.model_name,
+        temperature=agent.temperature if agent.temperature is not None else 0.7,
+        max_tokens=agent.max_tokens or 1024,
+        top_p=agent.top_p,
+        top_k=agent.top_k,
+        api_key=agent.api_key,
+        provider=agent.provider,
+        coalesce_requests=agent.coalesce_requests,
+        owner_id=agent.owner_id
+    )
+
+
+class AgentRegistry:
+    def __init__(self, max_size: int = RUNTIME_AGENT_CACHE_SIZE, ttl: float = RUNTIME_AGENT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # agent_id -> (fingerprint, runtime, created_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, agent) -> CrewAgent:
+        """Return the runtime for an agent row, rebuilding it if its settings changed."""
+        fingerprint = agent_fingerprint(agent)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(agent.id)
+            if entry is not None:
+                cached_fingerprint, runtime, created_at = entry
+                if cached_fingerprint == fingerprint and (self.ttl <= 0 or now - created_at < self.ttl):
+                    self._entries.move_to_end(agent.id)
+                    self.hits += 1
+                    return runtime
+            self.misses += 1
+
+        runtime = build_runtime(agent)
+        with self._lock:
+            self._entries[agent.id] = (fingerprint, runtime, now)
+            self._entries.move_to_end(agent.id)
+            while self.max_size > 0 and len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return runtime
+
+    def discard(self, agent_id: int):
+        with self._lock:
+            self._entries.pop(agent_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+runtime_agents = AgentRegistry()
+
+# Agents deleted through another worker
+shared_state.subscribe('agent.discard', lambda data: runtime_agents.discard(data['agent_id']))
+shared_state.subscribe(RESYNC_EVENT, lambda data: runtime_agents.clear())
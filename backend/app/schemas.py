@@ -29,6 +29,7 @@ class AgentCreate(BaseModel):
     top_k: Optional[int] = 50
     api_key: Optional[str] = None
     provider: Optional[str] = 'openai'
+    coalesce_requests: Optional[bool] = None
 
 class AgentOut(BaseModel):
     id: int
@@ -41,6 +42,7 @@ class AgentOut(BaseModel):
     top_p: Optional[float]
     top_k: Optional[int]
     provider: Optional[str]
+    coalesce_requests: Optional[bool] = None
     class Config:
         from_attributes = True
 
@@ -55,3 +57,55 @@ class ChatMessageOut(BaseModel):
     created_at: datetime
     class Config:
         from_attributes = True
+
+class ChatHistoryPage(BaseModel):
+    messages: List[ChatMessageOut]
+    next_cursor: Optional[int] = None
+
+class BatchChatItem(BaseModel):
+    agent_id: int
+    message: str
+    api_key: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem]
+    # Maximum provider calls in flight for this batch (capped by the server)
+    concurrency: Optional[int] = None
+    # Send each result as an SSE event as soon as it completes
+    stream: bool = False
+
+class BatchChatResult(BaseModel):
+    index: int
+    agent_id: int
+    response: Optional[str] = None
+    error: Optional[str] = None
+    user_message_id: Optional[int] = None
+    bot_message_id: Optional[int] = None
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatResult]
+
+class CrewTaskIn(BaseModel):
+    id: str
+    agent_id: int
+    # {{task_id}} is replaced by the output of that task
+    prompt: str
+    depends_on: List[str] = []
+    api_key: Optional[str] = None
+
+class CrewRunRequest(BaseModel):
+    tasks: List[CrewTaskIn]
+    # Maximum tasks calling their agent at once (capped by the server)
+    concurrency: Optional[int] = None
+    # Send task events, including reply chunks, as SSE while the crew runs
+    stream: bool = False
+
+class CrewTaskResult(BaseModel):
+    id: str
+    agent_id: int
+    status: str  # 'done', 'error' or 'skipped'
+    output: Optional[str] = None
+    error: Optional[str] = None
+
+class CrewRunResponse(BaseModel):
+    results: List[CrewTaskResult]
@@ -0,0 +1,170 @@
+# Shared request authentication for the agents and chat routers.
+# Verified tokens are cached together with the user they resolve to, so the
+# hot path skips both the JWT signature check and the users lookup. Routes
+# that act on one agent resolve token, user and owned agent together in a
+# single statement (agent_context).
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException
+from sqlalchemy import and_, bindparam, select
+from sqlalchemy.orm import Session
+
+from . import database, models
+from .utils import decode_access_token_claims
+
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '300'))
+
+# Resolved identity of an authenticated request
+AuthUser = namedtuple('AuthUser', ['id', 'email'])
+
+# Read-only projection of an agent row: what the routes and its runtime use
+AgentView = namedtuple('AgentView', [
+    'id', 'name', 'role', 'goal', 'model_name', 'temperature', 'max_tokens',
+    'top_p', 'top_k', 'api_key', 'provider', 'coalesce_requests', 'owner_id'
+])
+RequestContext = namedtuple('RequestContext', ['user', 'agent'])
+
+_AGENT_COLUMNS = tuple(getattr(models.Agent, field) for field in AgentView._fields)
+
+# Built once; SQLAlchemy reuses the compiled form from its statement cache.
+# Token cache hit: only the agent, if the user owns it
+_owned_agent = select(*_AGENT_COLUMNS).where(
+    models.Agent.id == bindparam('agent_id'),
+    models.Agent.owner_id == bindparam('owner_id')
+)
+# Token cache miss: the user and, outer joined, the agent in one round trip
+_user_and_agent = select(
+    models.User.id.label('user_id'), models.User.email, *_AGENT_COLUMNS
+).outerjoin(
+    models.Agent,
+    and_(models.Agent.owner_id == models.User.id, models.Agent.id == bindparam('agent_id'))
+).where(models.User.email == bindparam('email'))
+
+
+class TokenCache:
+    def __init__(self, max_size: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (AuthUser, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[AuthUser]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                user, expires_at = entry
+                if now < expires_at:
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return user
+                del self._entries[token]
+            self.misses += 1
+        return None
+
+    def put(self, token: str, user: AuthUser, token_exp: Optional[float] = None):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        # Never keep a token past its own expiry
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, float(token_exp))
+        with self._lock:
+            self._entries[token] = (user, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+token_cache = TokenCache()
+
+
+def _bearer_token(authorization: str) -> str:
+    return authorization.split(' ',1)[1] if authorization.lower().startswith('bearer ') else authorization
+
+
+def _agent_view(row) -> Optional[AgentView]:
+    values = tuple(row)[-len(AgentView._fields):]
+    # All NULL when the outer join found no agent
+    return AgentView._make(values) if values[0] is not None else None
+
+
+def get_user_from_auth(authorization: Optional[str], db: Session) -> Optional[AuthUser]:
+    if not authorization:
+        return None
+    token = _bearer_token(authorization)
+
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
+    claims = decode_access_token_claims(token)
+    email = claims.get('sub') if claims else None
+    if not email:
+        return None
+    row = db.query(models.User.id, models.User.email).filter(models.User.email == email).first()
+    if not row:
+        return None
+    user = AuthUser(id=row.id, email=row.email)
+    token_cache.put(token, user, claims.get('exp'))
+    return user
+
+
+def get_agent_context(authorization: Optional[str], agent_id: int, db: Session) -> Optional[RequestContext]:
+    """Resolve the caller and their agent with one query.
+
+    None when the token is invalid; the context's agent is None when the
+    agent does not exist or belongs to someone else.
+    """
+    if not authorization:
+        return None
+    token = _bearer_token(authorization)
+
+    user = token_cache.get(token)
+    if user is not None:
+        row = db.execute(_owned_agent, {'agent_id': agent_id, 'owner_id': user.id}).first()
+        return RequestContext(user, _agent_view(row) if row else None)
+
+    claims = decode_access_token_claims(token)
+    email = claims.get('sub') if claims else None
+    if not email:
+        return None
+    row = db.execute(_user_and_agent, {'agent_id': agent_id, 'email': email}).first()
+    if not row:
+        return None
+    user = AuthUser(id=row.user_id, email=row.email)
+    token_cache.put(token, user, claims.get('exp'))
+    return RequestContext(user, _agent_view(row))
+
+
+def agent_context(agent_id: int, authorization: Optional[str] = Header(None), db: Session = Depends(database.get_db)) -> RequestContext:
+    """Route dependency: the authenticated caller and the agent they own, or 401/404."""
+    context = get_agent_context(authorization, agent_id, db)
+    if context is None:
+        raise HTTPException(status_code=401, detail='Invalid token')
+    if context.agent is None:
+        raise HTTPException(status_code=404, detail='Agent not found')
+    return context
@@ -0,0 +1,289 @@
+# State shared between backend processes.
+# Runtime agents and conversation memory are cached per process; when the
+# app runs with several workers (or on several nodes) those caches are kept
+# consistent through invalidation events sent over a shared-state backend.
+# The in-memory backend serves a single process and sends nothing; the
+# Redis backend speaks RESP over a plain socket to any Redis-compatible server.
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from urllib.parse import unquote, urlparse
+
+# memory:// (single process) or redis://[:password@]host[:port][/db]
+SHARED_STATE_URL = os.environ.get('SHARED_STATE_URL', 'memory://')
+SHARED_STATE_CHANNEL = os.environ.get('SHARED_STATE_CHANNEL', 'ai-agent-builder:events')
+SHARED_STATE_TIMEOUT = float(os.environ.get('SHARED_STATE_TIMEOUT', '2'))
+# Events waiting to be published; further events are dropped while it is full
+SHARED_STATE_QUEUE_SIZE = int(os.environ.get('SHARED_STATE_QUEUE_SIZE', '10000'))
+
+# Sent when events may have been missed: dispatched locally after the subscriber
+# reconnects, and published after this process had to drop events
+RESYNC_EVENT = 'state.resync'
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    def __init__(self):
+        self._handlers = {}  # event -> [handler]
+
+    def subscribe(self, event: str, handler):
+        """Call handler(data) whenever another process publishes event."""
+        self._handlers.setdefault(event, []).append(handler)
+
+    def publish(self, event: str, data: dict):
+        """Notify the other processes; the caller updates its own state itself.
+
+        Never blocks: events are delivered in the background, and dropped if
+        the backend cannot keep up or is unreachable.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def _dispatch(self, event: str, data: dict):
+        for handler in self._handlers.get(event, ()):
+            try:
+                handler(data)
+            except Exception:
+                logger.exception('Handler for shared state event "%s" failed', event)
+
+
+class InMemoryStateBackend(StateBackend):
+    """Single process deployment: there is nobody to notify."""
+
+    def publish(self, event: str, data: dict):
+        pass
+
+    def start(self):
+        # uvicorn reads the same variable for its worker count
+        if int(os.environ.get('WEB_CONCURRENCY') or 1) > 1:
+            logger.warning('WEB_CONCURRENCY is above 1 but SHARED_STATE_URL is memory://; worker caches will not stay in sync')
+
+
+class RespError(RuntimeError):
+    pass
+
+
+class _RespConnection:
+    """Minimal RESP client for the handful of commands used here."""
+
+    def __init__(self, host: str, port: int, password=None, db: int = 0, timeout=SHARED_STATE_TIMEOUT):
+        self.sock = socket.create_connection((host, port), timeout=SHARED_STATE_TIMEOUT)
+        self.sock.settimeout(timeout)
+        self._reader = self.sock.makefile('rb')
+        if password:
+            self.command('AUTH', password)
+        if db:
+            self.command('SELECT', db)
+
+    def send(self, *args):
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            value = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(value), value))
+        self.sock.sendall(b''.join(parts))
+
+    def command(self, *args):
+        self.send(*args)
+        return self.read_reply()
+
+    def read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError('Shared state server closed the connection')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RespError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            return self._reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise ConnectionError(f'Unexpected reply from shared state server: {line!r}')
+
+    def interrupt(self):
+        # Unblocks a reader waiting in read_reply from another thread
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        try:
+            self._reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisStateBackend(StateBackend):
+    def __init__(self, url: str, channel: str = SHARED_STATE_CHANNEL):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.channel = channel
+        # Events carry their origin so a process ignores its own
+        self.origin = uuid.uuid4().hex
+        self._publisher = None
+        self._publish_queue = queue.Queue(maxsize=max(1, SHARED_STATE_QUEUE_SIZE))
+        self._publish_thread = None
+        self._published = 0
+        self._dropped = 0
+        # Set when events were dropped: the other processes must resync
+        self._missed = False
+        self._subscriber = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def publish(self, event: str, data: dict):
+        try:
+            self._publish_queue.put_nowait((event, data))
+        except queue.Full:
+            self._dropped += 1
+            self._missed = True
+
+    def stats(self) -> dict:
+        return {'published': self._published, 'dropped': self._dropped, 'queued': self._publish_queue.qsize()}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._listen, name='shared-state', daemon=True)
+            self._thread.start()
+        if self._publish_thread is None or not self._publish_thread.is_alive():
+            self._publish_thread = threading.Thread(target=self._publish_loop, name='shared-state-publisher', daemon=True)
+            self._publish_thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        subscriber = self._subscriber
+        if subscriber is not None:
+            subscriber.interrupt()
+        if self._publish_thread is not None:
+            # Ends the publisher once the events queued before it are sent
+            try:
+                self._publish_queue.put_nowait(None)
+            except queue.Full:
+                pass
+            self._publish_thread.join(timeout=SHARED_STATE_TIMEOUT)
+        if self._thread is not None:
+            self._thread.join(timeout=SHARED_STATE_TIMEOUT)
+        self._thread = None
+        self._publish_thread = None
+
+    def _publish_loop(self):
+        delay = 0.5
+        retry_at = 0.0
+        try:
+            while True:
+                item = self._publish_queue.get()
+                if item is None:
+                    break
+                if time.monotonic() < retry_at:
+                    # Backend unreachable; do not wait on a connect per event
+                    self._dropped += 1
+                    self._missed = True
+                    continue
+                event, data = item
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect()
+                    if self._missed:
+                        self._send(RESYNC_EVENT, {})
+                        self._missed = False
+                    self._send(event, data)
+                    self._published += 1
+                    delay = 0.5
+                except (OSError, ConnectionError, RespError) as exc:
+                    logger.warning('Could not publish shared state event "%s" (%s); dropping events for %.1fs', event, exc, delay)
+                    self._dropped += 1
+                    self._missed = True
+                    if self._publisher is not None:
+                        self._publisher.close()
+                        self._publisher = None
+                    retry_at = time.monotonic() + delay
+                    delay = min(delay * 2, 30.0)
+        finally:
+            if self._publisher is not None:
+                self._publisher.close()
+                self._publisher = None
+
+    def _send(self, event: str, data: dict):
+        self._publisher.command('PUBLISH', self.channel, json.dumps({'origin': self.origin, 'event': event, 'data': data}))
+
+    def _connect(self, timeout=SHARED_STATE_TIMEOUT) -> _RespConnection:
+        return _RespConnection(self.host, self.port, self.password, self.db, timeout=timeout)
+
+    def _listen(self):
+        delay = 0.5
+        connected_before = False
+        while not self._stopping.is_set():
+            try:
+                # No read timeout: the subscriber blocks until a message arrives
+                self._subscriber = self._connect(timeout=None)
+                self._subscriber.command('SUBSCRIBE', self.channel)
+                if connected_before:
+                    self._dispatch(RESYNC_EVENT, {})
+                connected_before = True
+                delay = 0.5
+                while not self._stopping.is_set():
+                    reply = self._subscriber.read_reply()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b'message':
+                        self._handle(reply[2])
+            except (OSError, ConnectionError, RespError) as exc:
+                if self._stopping.is_set():
+                    break
+                logger.warning('Shared state subscriber disconnected (%s); retrying in %.1fs', exc, delay)
+            finally:
+                if self._subscriber is not None:
+                    self._subscriber.close()
+                    self._subscriber = None
+            self._stopping.wait(delay)
+            delay = min(delay * 2, 30.0)
+
+    def _handle(self, payload: bytes):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning('Ignoring malformed shared state event: %r', payload[:200])
+            return
+        if message.get('origin') == self.origin:
+            return
+        self._dispatch(message.get('event'), message.get('data') or {})
+
+
+def create_state_backend(url: str = SHARED_STATE_URL) -> StateBackend:
+    scheme = urlparse(url).scheme.lower()
+    if scheme in ('', 'memory'):
+        return InMemoryStateBackend()
+    if scheme in ('redis', 'resp', 'tcp'):
+        return RedisStateBackend(url)
+    raise RuntimeError(f'Unsupported SHARED_STATE_URL scheme: "{scheme}"')
+
+
+shared_state = create_state_backend()
@@ -0,0 +1,58 @@
+# Server-sent event encoding for the chat streams.
+# Events are encoded straight to bytes with orjson when it is installed (the
+# stdlib json module otherwise). The framing is pre-encoded, and chunk events,
+# by far the most frequent, only need their content encoded.
+import json
+import os
+from typing import Optional
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Repeat the whole reply in the final 'done' event, for clients that do not
+# assemble it from the chunks
+SSE_DONE_FULL_RESPONSE = os.environ.get('SSE_DONE_FULL_RESPONSE', 'false').lower() in ('1', 'true', 'yes', 'on')
+
+_ID = b'id: '
+_DATA = b'data: '
+_LINE_END = b'\n'
+_EVENT_END = b'\n\n'
+_CHUNK_PREFIX = b'data: {"type":"chunk","content":'
+_CHUNK_SUFFIX = b'}\n\n'
+
+
+if orjson is not None:
+    dumps = orjson.dumps
+else:
+    def dumps(value) -> bytes:
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def encode_event(payload: dict, event_id: Optional[str] = None) -> bytes:
+    """One SSE event carrying payload as JSON, with an optional id line."""
+    if event_id is None:
+        return b''.join((_DATA, dumps(payload), _EVENT_END))
+    return b''.join((_ID, event_id.encode('utf-8'), _LINE_END, _DATA, dumps(payload), _EVENT_END))
+
+
+def encode_chunk(content: str, event_id: Optional[str] = None) -> bytes:
+    """encode_event({'type': 'chunk', 'content': content}) without building the dict."""
+    if event_id is None:
+        return b''.join((_CHUNK_PREFIX, dumps(content), _CHUNK_SUFFIX))
+    return b''.join((_ID, event_id.encode('utf-8'), _LINE_END, _CHUNK_PREFIX, dumps(content), _CHUNK_SUFFIX))
+
+
+def encode_payload(payload: dict, event_id: Optional[str] = None) -> bytes:
+    """encode_event, taking the chunk fast path for chunk payloads."""
+    if payload.get('type') == 'chunk' and len(payload) == 2:
+        return encode_chunk(payload['content'], event_id)
+    return encode_event(payload, event_id)
+
+
+def done_payload(bot_message_id: int, full_response: str) -> dict:
+    payload = {'type': 'done', 'bot_message_id': bot_message_id}
+    if SSE_DONE_FULL_RESPONSE:
+        payload['full_response'] = full_response
+    return payload
@@ -0,0 +1,125 @@
+# Resumable chat streams (per process).
+# A streamed reply is generated by a background task that records every SSE
+# event in a bounded replay log, so the reply is finished and stored even if
+# the client goes away. A client that reconnects with the id of the last
+# event it saw gets the events after it replayed, then the live tail; when
+# those events already left the log it first gets a snapshot of the reply
+# up to that point. Sessions live in the process that started them.
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Optional
+
+# Events kept per stream for replay
+STREAM_REPLAY_EVENTS = int(os.environ.get('STREAM_REPLAY_EVENTS', '512'))
+# How long a finished stream can still be resumed (seconds)
+STREAM_REPLAY_TTL = float(os.environ.get('STREAM_REPLAY_TTL', '300'))
+STREAM_MAX_SESSIONS = int(os.environ.get('STREAM_MAX_SESSIONS', '10000'))
+
+
+class StreamSession:
+    def __init__(self, agent_id: int, owner_id: int):
+        self.stream_id = uuid.uuid4().hex
+        self.agent_id = agent_id
+        self.owner_id = owner_id
+        self.events = deque(maxlen=max(1, STREAM_REPLAY_EVENTS))  # (seq, payload, reply length before it)
+        self.next_seq = 0
+        self.reply = []  # chunk contents, for snapshots
+        self.reply_length = 0
+        self.start_payload = None
+        self.finished = False
+        self.finished_at = None
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def emit(self, payload: dict):
+        self.events.append((self.next_seq, payload, self.reply_length))
+        self.next_seq += 1
+        if payload.get('type') == 'start':
+            self.start_payload = payload
+        elif payload.get('type') == 'chunk':
+            self.reply.append(payload['content'])
+            self.reply_length += len(payload['content'])
+        self._notify()
+
+    def finish(self):
+        self.finished = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    async def follow(self, last_seq: Optional[int] = None):
+        """Yield (seq, payload) for the events after last_seq, replayed and then live."""
+        position = -1 if last_seq is None else last_seq
+        while True:
+            changed = self._changed
+            if self.events and position + 1 < self.events[0][0]:
+                # The events after position already left the log; send what they held at once
+                oldest_seq, _, reply_before = self.events[0]
+                snapshot = dict(self.start_payload or {})
+                snapshot.update(type='snapshot', content=''.join(self.reply)[:reply_before])
+                position = oldest_seq - 1
+                yield position, snapshot
+            if self.events:
+                pending = list(islice(self.events, max(0, position + 1 - self.events[0][0]), None))
+                for seq, payload, _ in pending:
+                    position = seq
+                    yield seq, payload
+            if self.finished and position >= self.next_seq - 1:
+                return
+            await changed.wait()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class StreamRegistry:
+    def __init__(self, max_sessions: int = STREAM_MAX_SESSIONS, ttl: float = STREAM_REPLAY_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = {}  # stream_id -> StreamSession
+        self._finished = deque()  # (finished_at, stream_id), oldest first
+
+    def start(self, agent_id: int, owner_id: int, generate) -> StreamSession:
+        """Create a session and run generate(session) for it as a background task."""
+        self._prune()
+        session = StreamSession(agent_id, owner_id)
+        self._sessions[session.stream_id] = session
+        session.task = asyncio.get_running_loop().create_task(self._run(session, generate))
+        return session
+
+    def get(self, stream_id: str) -> Optional[StreamSession]:
+        self._prune()
+        return self._sessions.get(stream_id)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def _run(self, session: StreamSession, generate):
+        try:
+            await generate(session)
+        finally:
+            session.finish()
+            self._finished.append((session.finished_at, session.stream_id))
+
+    def _prune(self):
+        # Only finished sessions go, in the order they finished
+        finished = self._finished
+        now = time.monotonic()
+        while finished and (now - finished[0][0] > self.ttl or len(self._sessions) > self.max_sessions):
+            self._sessions.pop(finished.popleft()[1], None)
+
+
+def parse_last_event_id(value: Optional[str]) -> tuple:
+    """Split an SSE id of the form '<stream_id>:<seq>' into (stream_id, seq)."""
+    stream_id, _, seq = (value or '').strip().rpartition(':')
+    try:
+        return stream_id or None, int(seq)
+    except ValueError:
+        return None, None
+
+
+stream_sessions = StreamRegistry()
@@ -0,0 +1,79 @@
+# Streaming stage between the provider and the SSE response.
+# Deltas are forwarded as soon as they arrive; small ones are merged so the
+# client is not flooded with one event per token.
+import asyncio
+import os
+
+# Flush once this many bytes are buffered ...
+STREAM_COALESCE_BYTES = int(os.environ.get('STREAM_COALESCE_BYTES', '48'))
+# ... or once the oldest buffered delta has waited this long (milliseconds).
+STREAM_COALESCE_MS = float(os.environ.get('STREAM_COALESCE_MS', '25'))
+
+
+async def coalesce(chunks, max_bytes: int = None, max_ms: float = None):
+    """Merge small deltas from an async iterator by size and time window.
+
+    The first delta is always sent immediately so time-to-first-byte is not
+    delayed. Setting both thresholds to 0 disables coalescing.
+    """
+    max_bytes = STREAM_COALESCE_BYTES if max_bytes is None else max_bytes
+    max_ms = STREAM_COALESCE_MS if max_ms is None else max_ms
+
+    if max_bytes <= 0 and max_ms <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    window = max_ms / 1000.0
+    buffer = []
+    buffered_bytes = 0
+    deadline = None
+    first = True
+    pending = None
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None
+            if buffer and max_ms > 0:
+                timeout = max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if not done:
+                # Time window elapsed while waiting for the next delta
+                yield ''.join(buffer)
+                buffer, buffered_bytes = [], 0
+                continue
+
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                break
+            if not chunk:
+                continue
+
+            if first:
+                first = False
+                yield chunk
+                continue
+
+            if not buffer:
+                deadline = loop.time() + window
+            buffer.append(chunk)
+            buffered_bytes += len(chunk.encode('utf-8'))
+            if (max_bytes > 0 and buffered_bytes >= max_bytes) or (max_ms > 0 and loop.time() >= deadline):
+                yield ''.join(buffer)
+                buffer, buffered_bytes = [], 0
+
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        if pending is not None:
+            # Cancelling the in-flight read unwinds the provider stream as well
+            pending.cancel()
+        elif hasattr(iterator, 'aclose'):
+            await iterator.aclose()
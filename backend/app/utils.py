@@ -1,4 +1,6 @@
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
@@ -6,13 +8,27 @@ from datetime import datetime, timedelta
 SECRET_KEY = os.environ.get('SECRET_KEY', 'supersecretjwtkey')
 ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXPIRE_HOURS = 24
+# bcrypt cost factor for new hashes; existing hashes keep the cost they were made with
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+# bcrypt releases the GIL, so a small dedicated thread pool bounds hashing
+# without taking threads from the pool that serves chat requests
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Hashes running or waiting for a worker before more are turned away; 0 means no limit
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', '64'))
+
+_password_executor = None
+_password_jobs = 0  # only touched on the event loop
+
+
+class PasswordHashBusyError(RuntimeError):
+    """The password hashing queue is full."""
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt."""
     # Convert password to bytes
     password_bytes = password.encode('utf-8')
     # Generate salt and hash
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     # Return as string
     return hashed.decode('utf-8')
@@ -28,14 +44,49 @@ def verify_password(plain: str, hashed: str) -> bool:
     except Exception:
         return False
 
+def _get_password_executor() -> ThreadPoolExecutor:
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(max_workers=max(1, PASSWORD_HASH_WORKERS), thread_name_prefix='password-hash')
+    return _password_executor
+
+async def _run_password_job(fn, *args):
+    global _password_jobs
+    if PASSWORD_HASH_QUEUE > 0 and _password_jobs >= PASSWORD_HASH_QUEUE:
+        raise PasswordHashBusyError('Too many logins in progress; try again shortly')
+    _password_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_password_executor(), fn, *args)
+    finally:
+        _password_jobs -= 1
+
+async def ahash_password(password: str) -> str:
+    """hash_password on the password hashing pool; raises PasswordHashBusyError when its queue is full."""
+    return await _run_password_job(hash_password, password)
+
+async def averify_password(plain: str, hashed: str) -> bool:
+    """verify_password on the password hashing pool; raises PasswordHashBusyError when its queue is full."""
+    return await _run_password_job(verify_password, plain, hashed)
+
+def shutdown_password_executor():
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False)
+        _password_executor = None
+
 def create_access_token(subject: str, expires_delta: int = None):
     expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS if expires_delta is None else expires_delta)
     to_encode = {'exp': expire, 'sub': subject}
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def decode_access_token(token: str):
+    payload = decode_access_token_claims(token)
+    return payload.get('sub') if payload else None
+
+def decode_access_token_claims(token: str):
+    """Verify a token and return all of its claims, or None if it is invalid or expired."""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get('sub')
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         return None
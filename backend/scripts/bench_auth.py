@@ -0,0 +1,83 @@
+"""Authentication overhead per request, with and without the token cache.
+
+"jwt + select" is what every request did before the shared dependency:
+verify the token, then look the user up by email and the agent by id.
+The other rows go through app.security, with the token cache emptied
+before each call (miss) or already holding the token (hit).
+
+    cd backend
+    python scripts/bench_auth.py --requests 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-auth-'), 'bench.db'))
+
+from app import models  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.security import get_agent_context, get_user_from_auth, token_cache  # noqa: E402
+from app.utils import create_access_token, decode_access_token  # noqa: E402
+
+
+def seed(db) -> tuple:
+    name = uuid.uuid4().hex[:12]
+    user = models.User(username=name, email=f'{name}@example.com', password='x')
+    db.add(user)
+    db.flush()
+    agent = models.Agent(name='bench', provider='fake', owner_id=user.id)
+    db.add(agent)
+    db.commit()
+    return f'Bearer {create_access_token(user.email)}', agent.id
+
+
+def uncached(db, authorization: str, agent_id: int):
+    email = decode_access_token(authorization.split(' ', 1)[1])
+    user = db.query(models.User).filter(models.User.email == email).first()
+    return db.query(models.Agent).filter(models.Agent.id == agent_id, models.Agent.owner_id == user.id).first()
+
+
+def per_request_us(fn, requests: int, miss: bool) -> float:
+    elapsed = 0.0
+    for _ in range(requests):
+        if miss:
+            token_cache.clear()
+        started = time.perf_counter()
+        fn()
+        elapsed += time.perf_counter() - started
+    return elapsed / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000, help='Calls per row')
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        authorization, agent_id = seed(db)
+        rows = (
+            ('jwt + select', lambda: uncached(db, authorization, agent_id), False),
+            ('user, miss', lambda: get_user_from_auth(authorization, db), True),
+            ('user, hit', lambda: get_user_from_auth(authorization, db), False),
+            ('user+agent, miss', lambda: get_agent_context(authorization, agent_id, db), True),
+            ('user+agent, hit', lambda: get_agent_context(authorization, agent_id, db), False),
+        )
+        print(f"{'auth':<20}{'us/request':>12}")
+        for name, fn, miss in rows:
+            # Warm up statement caches and, for hits, the token cache
+            for _ in range(50):
+                fn()
+            print(f'{name:<20}{per_request_us(fn, args.requests, miss):>12.1f}')
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
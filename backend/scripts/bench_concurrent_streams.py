@@ -0,0 +1,85 @@
+"""Concurrent reply streams one worker holds: threadpool engine vs asyncio engine.
+
+Opens --streams streams at once against a local fake OpenAI-compatible
+server (scripts/fake_openai_server.py) and reports how many were in flight
+upstream at the same time, how long the batch took and the time to the
+first chunk.
+
+- "threadpool" iterates CrewAgent.think_stream in Starlette's threadpool,
+  the way the chat routes ran as sync handlers (40 threads by default).
+- "async" iterates CrewAgent.athink_stream on the event loop, the way the
+  chat routes run now.
+
+    cd backend
+    python scripts/bench_concurrent_streams.py --streams 1000 --ttft-ms 500 --tokens-per-second 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from starlette.concurrency import iterate_in_threadpool  # noqa: E402
+
+from app.core import crew_stub  # noqa: E402
+from app.core.crew_stub import CrewAgent  # noqa: E402
+from app.core.transport import aclose_clients  # noqa: E402
+from fake_openai_server import FakeOpenAIServer  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+
+async def one_stream(agent, mode: str, number: int) -> float:
+    prompt = f'Request {number}: stream the plan'
+    if mode == 'threadpool':
+        chunks = iterate_in_threadpool(agent.think_stream(prompt, 'sk-bench'))
+    else:
+        chunks = agent.athink_stream(prompt, 'sk-bench')
+    started = time.perf_counter()
+    first = None
+    async for _ in chunks:
+        if first is None:
+            first = time.perf_counter() - started
+    return first
+
+
+async def run(mode: str, streams: int) -> tuple:
+    # Above the response cache temperature limit, so every stream reaches the server
+    agent = CrewAgent('bench', provider='openai', model='gpt-4o', temperature=1.0)
+    started = time.perf_counter()
+    try:
+        firsts = await asyncio.gather(*(one_stream(agent, mode, number) for number in range(streams)), return_exceptions=True)
+    finally:
+        await aclose_clients()
+    elapsed = time.perf_counter() - started
+    errors = [first for first in firsts if isinstance(first, BaseException)]
+    return elapsed, sorted(first for first in firsts if isinstance(first, float)), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=1000, help='Streams opened at once')
+    parser.add_argument('--modes', default='threadpool,async', help='Engines to measure, comma separated')
+    parser.add_argument('--ttft-ms', type=float, default=500)
+    parser.add_argument('--tokens-per-second', type=float, default=20)
+    parser.add_argument('--reply-tokens', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'engine':<12}{'streams':>9}{'errors':>8}{'peak':>7}{'seconds':>9}{'first p50':>11}{'first p99':>11}")
+    with FakeOpenAIServer(ttft_ms=args.ttft_ms, tokens_per_second=args.tokens_per_second, reply_tokens=args.reply_tokens) as server:
+        crew_stub.OPENAI_CHAT_COMPLETIONS_URL = server.url
+        for mode in args.modes.split(','):
+            server.reset()
+            elapsed, firsts, errors = asyncio.run(run(mode, args.streams))
+            print(
+                f'{mode:<12}{args.streams:>9}{len(errors):>8}{server.peak_in_flight:>7}{elapsed:>9.1f}'
+                f'{percentile(firsts, 0.5) * 1000:>9.0f}ms{percentile(firsts, 0.99) * 1000:>9.0f}ms'
+            )
+            if errors:
+                print(f'  first error: {errors[0]!r}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Crew wall-clock time: independent tasks run in parallel vs one after another.
+
+Runs a research crew through app.core.crew: --researchers tasks that do
+not depend on each other, a writer that depends on all of them and a
+reviewer that depends on the writer. Concurrency 1 is sequential
+execution, one agent call per hop.
+
+- "fake" agents answer through the fake provider, offline but paced like a
+  model API (--ttft-ms, --tokens-per-second, --reply-tokens), so the rows
+  show the speedup from running the researchers concurrently.
+- "echo" agents have no API key and take the offline echo path in think,
+  which answers at once, so the rows show what the engine itself costs.
+
+    cd backend
+    python scripts/bench_crew.py --researchers 4 --concurrency 1,2,4,8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core import fake_provider  # noqa: E402
+from app.core.crew import Crew, CrewTask  # noqa: E402
+from app.core.crew_stub import CrewAgent  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+
+def build_crew(provider: str, researchers: int, concurrency: int, run: int) -> Crew:
+    researcher = CrewAgent('researcher', role='Researcher', provider=provider, model='bench')
+    writer = CrewAgent('writer', role='Writer', provider=provider, model='bench')
+    reviewer = CrewAgent('reviewer', role='Reviewer', provider=provider, model='bench')
+    # The run number keeps every prompt distinct, so no reply comes from the response cache
+    tasks = [CrewTask(f'research-{index}', researcher, f'Run {run}: research topic {index}.') for index in range(researchers)]
+    tasks.append(CrewTask('write', writer, f'Run {run}: write a report from the research.', [task.task_id for task in tasks]))
+    tasks.append(CrewTask('review', reviewer, 'Review this report: {{write}}', ['write']))
+    return Crew(tasks, max_concurrency=concurrency)
+
+
+async def run_crew(crew: Crew) -> float:
+    started = time.perf_counter()
+    results = await crew.execute()
+    elapsed = time.perf_counter() - started
+    failed = [task_id for task_id, event in results.items() if event['type'] != 'task_done']
+    assert not failed, f'Tasks did not finish: {failed}'
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--researchers', type=int, default=4, help='Independent tasks before the writer')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='Crew concurrency caps to compare; 1 is sequential')
+    parser.add_argument('--runs', type=int, default=5, help='Crew runs per paced row')
+    parser.add_argument('--echo-runs', type=int, default=500, help='Crew runs per echo row')
+    parser.add_argument('--ttft-ms', type=float, default=100)
+    parser.add_argument('--tokens-per-second', type=float, default=200)
+    parser.add_argument('--reply-tokens', type=int, default=32)
+    args = parser.parse_args()
+    fake_provider.FAKE_TTFT_MS = args.ttft_ms
+    fake_provider.FAKE_TOKENS_PER_SECOND = args.tokens_per_second
+    fake_provider.FAKE_REPLY_TOKENS = args.reply_tokens
+
+    tasks = args.researchers + 2
+    print(f"{'agents':<8}{'concurrency':>12}{'p50 ms':>10}{'ms/task':>10}{'speedup':>9}")
+    for provider, runs in (('fake', args.runs), ('echo', args.echo_runs)):
+        baseline = None
+        for concurrency in (int(value) for value in args.concurrency.split(',')):
+            # Without an API key an OpenAI agent answers with the offline echo
+            agent_provider = 'fake' if provider == 'fake' else 'openai'
+            timings = sorted(
+                asyncio.run(run_crew(build_crew(agent_provider, args.researchers, concurrency, run)))
+                for run in range(runs)
+            )
+            p50 = percentile(timings, 0.5)
+            baseline = baseline or p50
+            print(f'{provider:<8}{concurrency:>12}{p50 * 1000:>10.2f}{p50 / tasks * 1000:>10.3f}{baseline / p50:>8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Chat history latency for an agent with a million messages: paged vs load-all.
+
+Seeds --messages messages for one agent, then times GET /chat/{id}/history
+(the newest page, a page from the middle with before_id, the oldest page
+with after_id) and the old endpoint, which loaded every message of the
+agent ordered by created_at and serialized them all. The old endpoint is
+timed with the (agent_id, created_at, id) index and without it, as it ran
+before.
+
+    cd backend
+    python scripts/bench_history.py --messages 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-history-'), 'bench.db'))
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+from fastapi.testclient import TestClient  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy import insert, text  # noqa: E402
+
+from app import models, schemas  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+INDEX = 'ix_chat_messages_agent_id_created_at_id'
+BATCH = 20000
+
+
+def setup(client: TestClient) -> tuple:
+    name = uuid.uuid4().hex[:12]
+    email = f'{name}@example.com'
+    client.post('/auth/register', json={'username': name, 'email': email, 'password': 'secret'}).raise_for_status()
+    token = client.post('/auth/login', data={'username': email, 'password': 'secret'}).json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    agent = client.post('/agents/create', json={'name': 'bench', 'role': 'r', 'goal': 'g', 'provider': 'fake'}, headers=headers)
+    agent.raise_for_status()
+    return headers, agent.json()['id']
+
+
+def seed(agent_id: int, messages: int):
+    started = datetime.now(timezone.utc) - timedelta(seconds=messages)
+    with engine.begin() as connection:
+        for offset in range(0, messages, BATCH):
+            connection.execute(insert(models.ChatMessage), [
+                {
+                    'agent_id': agent_id,
+                    'sender': 'user' if number % 2 == 0 else 'agent',
+                    'message': f'Message {number}: a chat turn of about the length people usually type.',
+                    'created_at': started + timedelta(seconds=number)
+                }
+                for number in range(offset, min(messages, offset + BATCH))
+            ])
+
+
+def load_all(agent_id: int) -> bytes:
+    db = SessionLocal()
+    try:
+        msgs = db.query(models.ChatMessage).filter(models.ChatMessage.agent_id == agent_id).order_by(models.ChatMessage.created_at).all()
+        return TypeAdapter(List[schemas.ChatMessageOut]).dump_json(msgs)
+    finally:
+        db.close()
+
+
+def timed(fn, repeat: int) -> tuple:
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return percentile(timings, 0.5), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000000, help='Messages seeded for the agent')
+    parser.add_argument('--repeat', type=int, default=50, help='Requests per paged query')
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        headers, agent_id = setup(client)
+        started = time.perf_counter()
+        seed(agent_id, args.messages)
+        print(f'Seeded {args.messages} messages in {time.perf_counter() - started:.1f}s\n')
+
+        db = SessionLocal()
+        ids = [row.id for row in db.query(models.ChatMessage.id).filter(models.ChatMessage.agent_id == agent_id).order_by(models.ChatMessage.id)]
+        db.close()
+        middle = ids[len(ids) // 2]
+
+        def page(**params):
+            def request():
+                response = client.get(f'/chat/{agent_id}/history', params=params, headers=headers)
+                response.raise_for_status()
+                return response.content
+            return request
+
+        print(f"{'query':<28}{'p50 ms':>10}{'bytes':>14}")
+        for name, fn in (
+            ('page, newest', page(limit=50)),
+            ('page, before_id (middle)', page(limit=50, before_id=middle)),
+            ('page, after_id (oldest)', page(limit=50, after_id=ids[0])),
+        ):
+            seconds, body = timed(fn, args.repeat)
+            print(f'{name:<28}{seconds * 1000:>10.2f}{len(body):>14}')
+
+        seconds, body = timed(lambda: load_all(agent_id), 3)
+        print(f"{'old, all, with index':<28}{seconds * 1000:>10.0f}{len(body):>14}")
+        with engine.begin() as connection:
+            connection.execute(text(f'DROP INDEX {INDEX}'))
+        try:
+            seconds, body = timed(lambda: load_all(agent_id), 3)
+            print(f"{'old, all, no index':<28}{seconds * 1000:>10.0f}{len(body):>14}")
+        finally:
+            with engine.begin() as connection:
+                connection.execute(text(f'CREATE INDEX {INDEX} ON chat_messages (agent_id, created_at, id)'))
+
+
+if __name__ == '__main__':
+    main()
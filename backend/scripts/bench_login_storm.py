@@ -0,0 +1,93 @@
+"""Login throughput and chat latency while logins saturate the server.
+
+Starts the backend with the fake provider (see loadtest.py --spawn) for each
+PASSWORD_HASH_WORKERS value, sends chat messages at a fixed rate and
+reports their p50/p99, first alone and then next to --logins clients that
+log in back to back at the default bcrypt cost. 40 hashing workers is as
+many as the threadpool the sync login handler used to hash on.
+
+    cd backend
+    python scripts/bench_login_storm.py --workers 1,4,40 --logins 32 --rps 10 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx  # noqa: E402
+
+from loadtest import CREDENTIALS, Recorder, percentile, send, setup_user, spawn_server  # noqa: E402
+
+
+async def chat_at_rate(client, recorder: Recorder, user: tuple, rps: float, duration: float):
+    headers, agent_id = user
+    tasks = []
+    started = time.perf_counter()
+    number = 0
+    while time.perf_counter() - started < duration:
+        tasks.append(asyncio.create_task(send(client, recorder, headers, agent_id, number)))
+        number += 1
+        await asyncio.sleep(max(0.0, started + number / rps - time.perf_counter()))
+    await asyncio.gather(*tasks)
+
+
+async def login_loop(client, recorder: Recorder, credentials: tuple, stop: float):
+    email, password = credentials
+    while time.perf_counter() < stop:
+        started = time.perf_counter()
+        try:
+            response = await client.post('/auth/login', data={'username': email, 'password': password})
+            response.raise_for_status()
+        except httpx.HTTPError:
+            recorder.fail('login')
+            continue
+        recorder.add('login', time.perf_counter() - started)
+
+
+async def run(url: str, args, logins: int) -> Recorder:
+    recorder = Recorder()
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=httpx.Limits(max_connections=None)) as client:
+        user = await setup_user(client, Recorder())
+        stop = time.perf_counter() + args.duration
+        storm = [asyncio.create_task(login_loop(client, recorder, CREDENTIALS[user[1]], stop)) for _ in range(logins)]
+        await chat_at_rate(client, recorder, user, args.rps, args.duration)
+        await asyncio.gather(*storm)
+    return recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,4,40', help='PASSWORD_HASH_WORKERS values to compare')
+    parser.add_argument('--logins', type=int, default=32, help='Clients logging in back to back')
+    parser.add_argument('--rps', type=float, default=10, help='Chat messages per second')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    args = parser.parse_args()
+    # Settings of the spawned server
+    args.ttft_ms, args.tokens_per_second, args.error_rate, args.reply_tokens = 200, 50, 0, 64
+    os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+
+    print(f"{'hash workers':<14}{'logins':>8}{'logins/s':>10}{'login p99':>11}{'chat p50':>10}{'chat p99':>10}{'errors':>8}")
+    for workers in args.workers.split(','):
+        os.environ['PASSWORD_HASH_WORKERS'] = workers
+        process, url = spawn_server(args)
+        try:
+            for logins in (0, args.logins):
+                recorder = asyncio.run(run(url, args, logins))
+                chat = sorted(recorder.latencies.get('send', []))
+                login = sorted(recorder.latencies.get('login', []))
+                print(
+                    f'{workers:<14}{logins:>8}{len(login) / args.duration:>10.1f}{percentile(login, 0.99) * 1000:>9.0f}ms'
+                    f'{percentile(chat, 0.5) * 1000:>8.0f}ms{percentile(chat, 0.99) * 1000:>8.0f}ms{sum(recorder.errors.values()):>8}'
+                )
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
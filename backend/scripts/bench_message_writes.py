@@ -0,0 +1,89 @@
+"""Chat message inserts per second: one commit per message vs the batching writer.
+
+Threads play request handlers, each storing messages for its own agent. The
+"commit" mode adds and commits every message through an ORM session, as chat
+did before the write-behind writer; "writer" queues them on a MessageWriter
+and waits for the last batch to be committed.
+
+    cd backend
+    python scripts/bench_message_writes.py --threads 16 --messages 500
+    DATABASE_URL=postgresql://... python scripts/bench_message_writes.py
+
+Without DATABASE_URL a throwaway SQLite database is used.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-writes-'), 'bench.db'))
+
+from app import models  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.persistence import MessageWriter  # noqa: E402
+
+
+def create_agents(count: int) -> list:
+    db = SessionLocal()
+    try:
+        user = models.User(username=f'bench-{time.time_ns()}', email=f'bench-{time.time_ns()}@example.com', password='x')
+        db.add(user)
+        db.flush()
+        agents = [models.Agent(name=f'bench-{index}', provider='fake', owner_id=user.id) for index in range(count)]
+        db.add_all(agents)
+        db.commit()
+        return [agent.id for agent in agents]
+    finally:
+        db.close()
+
+
+def commit_each(agent_id: int, messages: int, writer):
+    db = SessionLocal()
+    try:
+        for number in range(messages):
+            db.add(models.ChatMessage(agent_id=agent_id, sender='user', message=f'message {number}'))
+            db.commit()
+    finally:
+        db.close()
+
+
+def write_behind(agent_id: int, messages: int, writer):
+    for number in range(messages):
+        writer.enqueue(agent_id, 'user', f'message {number}')
+
+
+def run(mode, agent_ids: list, messages: int) -> float:
+    writer = MessageWriter()
+    writer.start()
+    threads = [threading.Thread(target=mode, args=(agent_id, messages, writer)) for agent_id in agent_ids]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.flush()
+    elapsed = time.perf_counter() - started
+    writer.stop()
+    return len(agent_ids) * messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent writers')
+    parser.add_argument('--messages', type=int, default=500, help='Messages per writer')
+    parser.add_argument('--rounds', type=int, default=3, help='Runs per mode; the best is reported')
+    args = parser.parse_args()
+
+    init_db()
+    print(f"{'mode':<10}{'inserts/s':>12}")
+    for name, mode in (('commit', commit_each), ('writer', write_behind)):
+        best = max(run(mode, create_agents(args.threads), args.messages) for _ in range(args.rounds))
+        print(f'{name:<10}{best:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
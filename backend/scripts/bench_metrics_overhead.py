@@ -0,0 +1,63 @@
+"""Cost of the provider call instrumentation, per operation and per call.
+
+Times the metric primitives on their own, then a whole non-streaming and
+streamed call to the fake provider (no delays) with metrics enabled and
+disabled; the difference is what /metrics costs each model call.
+
+    cd backend
+    python scripts/bench_metrics_overhead.py --calls 20000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ['FAKE_TTFT_MS'] = '0'
+os.environ['FAKE_TOKENS_PER_SECOND'] = '0'
+
+from app.core import metrics  # noqa: E402
+from app.core.crew_stub import CrewAgent  # noqa: E402
+
+
+def per_op_ns(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000, help='Calls per measurement')
+    args = parser.parse_args()
+
+    agent = CrewAgent('bench', provider='fake', model='fake-model', temperature=1.0)
+    history = [{'role': 'user', 'content': 'earlier question ' * 20}, {'role': 'assistant', 'content': 'earlier answer ' * 40}]
+    labels = agent._metric_labels()
+
+    print(f"{'operation':<28}{'ns/op':>10}")
+    primitives = (
+        ('histogram observe', lambda: metrics.provider_request_seconds.observe(0.42, *labels)),
+        ('counter inc', lambda: metrics.provider_errors_total.inc(*labels)),
+        ('metric labels', agent._metric_labels),
+        ('tokens, reported usage', lambda: agent._record_tokens('prompt', history, None, 500, (120, 125))),
+        ('tokens, estimated', lambda: agent._record_tokens('prompt', history, None, 500)),
+    )
+    for name, fn in primitives:
+        print(f'{name:<28}{per_op_ns(fn, args.calls):>10.0f}')
+
+    calls = (
+        ('request', lambda: agent._request('prompt', '', history)),
+        ('stream', lambda: sum(1 for _ in agent._request_stream('prompt', '', history))),
+    )
+    print(f"\n{'call':<12}{'metrics on':>14}{'metrics off':>14}{'overhead':>12}")
+    for name, fn in calls:
+        metrics.METRICS_ENABLED = True
+        enabled = per_op_ns(fn, args.calls // 10) / 1000
+        metrics.METRICS_ENABLED = False
+        disabled = per_op_ns(fn, args.calls // 10) / 1000
+        metrics.METRICS_ENABLED = True
+        print(f'{name:<12}{enabled:>12.1f}us{disabled:>12.1f}us{enabled - disabled:>10.1f}us')
+
+
+if __name__ == '__main__':
+    main()
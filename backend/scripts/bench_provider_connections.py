@@ -0,0 +1,106 @@
+"""Provider call latency on a cold connection vs a reused keep-alive one.
+
+Sends non-streaming chat completions to a local fake OpenAI-compatible
+server (scripts/fake_openai_server.py), over HTTPS with a throwaway
+self-signed certificate when the openssl command is available, so the cold
+numbers include the TCP and TLS handshakes a real provider call pays.
+
+- "cold" opens a new connection per call (requests.post, a fresh
+  httpx.AsyncClient), as before the shared transport.
+- "pooled" goes through the per-provider session and async client of
+  app.core.transport.
+
+    cd backend
+    python scripts/bench_provider_connections.py --calls 300
+    python scripts/bench_provider_connections.py --plain   # HTTP only
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx  # noqa: E402
+import requests  # noqa: E402
+
+from app.core.transport import aclose_clients, close_sessions, get_async_client, get_session  # noqa: E402
+from fake_openai_server import FakeOpenAIServer  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+PAYLOAD = {'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'ping'}], 'max_tokens': 4}
+
+
+def self_signed_context():
+    """Server SSLContext for 127.0.0.1; clients trust it through SSL_CERT_FILE/REQUESTS_CA_BUNDLE."""
+    directory = tempfile.mkdtemp(prefix='bench-tls-')
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+         '-addext', 'subjectAltName=IP:127.0.0.1', '-keyout', key, '-out', cert],
+        check=True, capture_output=True
+    )
+    os.environ['REQUESTS_CA_BUNDLE'] = os.environ['SSL_CERT_FILE'] = cert
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def sync_calls(url: str, calls: int, pooled: bool) -> list:
+    session = get_session('openai') if pooled else None
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        response = (session or requests).post(url, json=PAYLOAD, timeout=(5, 60))
+        response.raise_for_status()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def async_calls(url: str, calls: int, pooled: bool) -> list:
+    timings = []
+    try:
+        for _ in range(calls):
+            started = time.perf_counter()
+            if pooled:
+                response = await get_async_client('openai').post(url, json=PAYLOAD)
+            else:
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(url, json=PAYLOAD)
+            response.raise_for_status()
+            timings.append(time.perf_counter() - started)
+    finally:
+        await aclose_clients()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=300, help='Calls per client and mode')
+    parser.add_argument('--plain', action='store_true', help='Use HTTP even when openssl is available')
+    args = parser.parse_args()
+
+    context = None if args.plain or not shutil.which('openssl') else self_signed_context()
+    with FakeOpenAIServer(ttft_ms=0, reply_tokens=4, ssl_context=context) as server:
+        print(f'{server.url}\n')
+        print(f"{'client':<10}{'mode':<8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for client in ('requests', 'httpx'):
+            for mode in ('cold', 'pooled'):
+                if client == 'requests':
+                    timings = sync_calls(server.url, args.calls, mode == 'pooled')
+                    close_sessions()
+                else:
+                    timings = asyncio.run(async_calls(server.url, args.calls, mode == 'pooled'))
+                # The first pooled call opens the connection the rest reuse
+                timings = sorted(timings[1:])
+                print(f'{client:<10}{mode:<8}' + ''.join(f'{percentile(timings, fraction) * 1000:>9.2f}' for fraction in (0.5, 0.95, 0.99)))
+
+
+if __name__ == '__main__':
+    main()
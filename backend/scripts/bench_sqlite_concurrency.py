@@ -0,0 +1,126 @@
+"""Concurrent chat writes and history reads on SQLite: default engine vs tuned profile.
+
+Writer threads store chat messages with one commit each, as a chat turn
+without the batching writer does, while reader threads fetch the newest
+history page of their agent. Each profile gets a fresh database file:
+
+- "default" is create_engine with only check_same_thread=False (rollback
+  journal, synchronous=FULL, no busy timeout), as database.py used to build it.
+- "tuned" uses app.db_profiles (WAL, synchronous=NORMAL, busy_timeout,
+  cache and mmap sizes, a sized pool).
+
+    cd backend
+    python scripts/bench_sqlite_concurrency.py --writers 16 --readers 16 --seconds 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.db_profiles import configure_engine, engine_options  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+
+def build_engine(profile: str):
+    url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-sqlite-'), 'bench.db')
+    if profile == 'default':
+        return create_engine(url, connect_args={'check_same_thread': False})
+    engine = create_engine(url, **engine_options(url))
+    configure_engine(engine)
+    return engine
+
+
+def run(profile: str, writers: int, readers: int, seconds: float) -> dict:
+    engine = build_engine(profile)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        user = models.User(username='bench', email='bench@example.com', password='x')
+        db.add(user)
+        db.flush()
+        agents = [models.Agent(name=f'bench-{index}', provider='fake', owner_id=user.id) for index in range(max(writers, readers))]
+        db.add_all(agents)
+        db.commit()
+        agent_ids = [agent.id for agent in agents]
+
+    stop = time.perf_counter() + seconds
+    lock = threading.Lock()
+    results = {'write': [], 'read': [], 'locked': 0, 'errors': 0}
+
+    def record(kind: str, started: float):
+        elapsed = time.perf_counter() - started
+        with lock:
+            results[kind].append(elapsed)
+
+    def fail(exc: Exception):
+        with lock:
+            results['locked' if 'locked' in str(exc) else 'errors'] += 1
+
+    def write(agent_id: int):
+        number = 0
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                with Session() as db:
+                    db.add(models.ChatMessage(agent_id=agent_id, sender='user', message=f'message {number}'))
+                    db.commit()
+            except OperationalError as exc:
+                fail(exc)
+                continue
+            record('write', started)
+            number += 1
+
+    def read(agent_id: int):
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                with Session() as db:
+                    (db.query(models.ChatMessage)
+                        .filter(models.ChatMessage.agent_id == agent_id)
+                        .order_by(models.ChatMessage.created_at.desc(), models.ChatMessage.id.desc())
+                        .limit(50).all())
+            except OperationalError as exc:
+                fail(exc)
+                continue
+            record('read', started)
+
+    threads = [threading.Thread(target=write, args=(agent_ids[index],)) for index in range(writers)]
+    threads += [threading.Thread(target=read, args=(agent_ids[index],)) for index in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10}{'writes/s':>10}{'write p99':>11}{'reads/s':>10}{'read p99':>10}{'locked':>8}{'errors':>8}")
+    for profile in ('default', 'tuned'):
+        results = run(profile, args.writers, args.readers, args.seconds)
+        writes, reads = sorted(results['write']), sorted(results['read'])
+        print(
+            f"{profile:<10}{len(writes) / args.seconds:>10.0f}{percentile(writes, 0.99) * 1000:>9.0f}ms"
+            f"{len(reads) / args.seconds:>10.0f}{percentile(reads, 0.99) * 1000:>8.0f}ms{results['locked']:>8}{results['errors']:>8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
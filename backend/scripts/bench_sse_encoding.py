@@ -0,0 +1,111 @@
+"""SSE encoding cost of a long streamed reply: f-string framing vs app.sse.
+
+Each run frames a --chunks chunk reply the way the chat stream sends it
+(start event, one event per chunk with an id line, done event) and
+assembles the reply to store it:
+
+- "json.dumps + f-string" is the old stream: json.dumps of every event dict
+  into an f-string, encoded to UTF-8 as the response does with str bodies,
+  the reply built with += and repeated in the done event.
+- "app.sse" is the stream now: encode_payload to bytes, the reply joined
+  once from the chunk list and a done event without it, once with the JSON
+  backend app.sse picked (orjson when installed) and once with stdlib json.
+
+    cd backend
+    python scripts/bench_sse_encoding.py --chunks 10000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app import sse  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+STREAM_ID = '3f2b8c1d9e7a4b6c8d0e1f2a3b4c5d6e'
+WORDS = ('The', ' model', ' streams', ' its', ' reply', ' a', ' few', ' tokens', ' at', ' a', ' time,', ' café', ' «quoted»', '\n')
+
+
+def make_chunks(count: int) -> list:
+    return [WORDS[number % len(WORDS)] + (' ' if number % 7 == 0 else '') for number in range(count)]
+
+
+def fstring_stream(chunks: list) -> tuple:
+    seq = 0
+    sent = 0
+    full_response = ''
+
+    def frame(event: dict) -> bytes:
+        return f"id: {STREAM_ID}:{seq}\ndata: {json.dumps(event)}\n\n".encode('utf-8')
+
+    sent += len(frame({'type': 'start', 'user_message_id': 1, 'stream_id': STREAM_ID}))
+    for chunk in chunks:
+        seq += 1
+        full_response += chunk
+        sent += len(frame({'type': 'chunk', 'content': chunk}))
+    seq += 1
+    sent += len(frame({'type': 'done', 'bot_message_id': 2, 'full_response': full_response}))
+    return sent, full_response
+
+
+def sse_stream(chunks: list) -> tuple:
+    seq = 0
+    sent = len(sse.encode_payload({'type': 'start', 'user_message_id': 1, 'stream_id': STREAM_ID}, f'{STREAM_ID}:{seq}'))
+    reply = []
+    for chunk in chunks:
+        seq += 1
+        reply.append(chunk)
+        sent += len(sse.encode_payload({'type': 'chunk', 'content': chunk}, f'{STREAM_ID}:{seq}'))
+    full_response = ''.join(reply)
+    seq += 1
+    sent += len(sse.encode_payload(sse.done_payload(2, full_response), f'{STREAM_ID}:{seq}'))
+    return sent, full_response
+
+
+def stdlib_dumps(value) -> bytes:
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def timed(fn, chunks: list, runs: int) -> tuple:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        sent, reply = fn(chunks)
+        timings.append(time.perf_counter() - started)
+    assert reply == ''.join(chunks)
+    return sorted(timings), sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=10000, help='Chunks per streamed reply')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    backend = 'orjson' if sse.orjson is not None else 'stdlib json'
+    rows = [
+        ('json.dumps + f-string', fstring_stream, None),
+        (f'app.sse, {backend}', sse_stream, sse.dumps),
+    ]
+    if sse.orjson is not None:
+        rows.append(('app.sse, stdlib json', sse_stream, stdlib_dumps))
+
+    print(f"{'encoding':<26}{'p50 ms':>10}{'p95 ms':>10}{'us/chunk':>10}{'KB sent':>10}")
+    default_dumps = sse.dumps
+    for name, fn, dumps in rows:
+        sse.dumps = dumps or default_dumps
+        try:
+            timings, sent = timed(fn, chunks, args.runs)
+        finally:
+            sse.dumps = default_dumps
+        p50 = percentile(timings, 0.5)
+        print(f'{name:<26}{p50 * 1000:>10.2f}{percentile(timings, 0.95) * 1000:>10.2f}{p50 / args.chunks * 1e6:>10.2f}{sent / 1024:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
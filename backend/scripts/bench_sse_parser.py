@@ -0,0 +1,161 @@
+"""Provider stream parsing throughput in MB/s: iter_lines vs app.core.sse_parser.
+
+Parses recorded streams down to their content deltas:
+
+- "openai" is a chat.completion.chunk stream of --events events, finish
+  reason and [DONE] included, as OpenAI and Fireworks send it.
+- "gemini" repeats tests/fixtures/gemini/text.sse to about the same size.
+
+"iter_lines + json.loads" is the old path: requests' iter_lines over
+512-byte reads, then decode, prefix check and json.loads per line.
+"SSEParser" is the path now: iter_sse_data over byte chunks as they come
+off the socket (--chunk-size, and 512 bytes for comparison), then the
+CrewAgent stream event parsers, once with the JSON backend sse_parser
+picked (orjson when installed) and once with stdlib json.
+
+    cd backend
+    python scripts/bench_sse_parser.py --events 20000 --chunk-size 1400
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from requests.models import Response  # noqa: E402
+
+from app.core import crew_stub, sse_parser  # noqa: E402
+from app.core.crew_stub import STREAM_DONE, CrewAgent  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+GEMINI_FIXTURE = os.path.join(BACKEND_DIR, 'tests', 'fixtures', 'gemini', 'text.sse')
+WORDS = ('The', ' model', ' streams', ' its', ' reply', ' a', ' few', ' tokens', ' at', ' a', ' time,', ' café', ' «quoted»', '\n')
+
+
+def openai_stream(events: int) -> bytes:
+    lines = []
+    for number in range(events):
+        finish = 'stop' if number == events - 1 else None
+        chunk = {
+            'id': 'chatcmpl-9bench', 'object': 'chat.completion.chunk', 'created': 1718000000, 'model': 'gpt-4o-2024-05-13',
+            'system_fingerprint': 'fp_bench', 'choices': [{'index': 0, 'delta': {'content': WORDS[number % len(WORDS)]}, 'logprobs': None, 'finish_reason': finish}]
+        }
+        lines.append(b'data: ' + json.dumps(chunk, ensure_ascii=False).encode('utf-8') + b'\n\n')
+    lines.append(b'data: [DONE]\n\n')
+    return b''.join(lines)
+
+
+def gemini_stream(size: int) -> bytes:
+    with open(GEMINI_FIXTURE, 'rb') as fixture:
+        recorded = fixture.read()
+    if not recorded.endswith(b'\n\n'):
+        recorded = recorded.rstrip(b'\n') + b'\n\n'
+    return recorded * max(1, size // len(recorded))
+
+
+def old_openai_delta(data: dict):
+    if 'choices' in data and len(data['choices']) > 0:
+        return (data['choices'][0].get('delta') or {}).get('content') or ''
+    return None
+
+
+def old_gemini_delta(data: dict):
+    candidates = data.get('candidates') or []
+    if not candidates:
+        return None
+    return ''.join(part.get('text', '') for part in (candidates[0].get('content') or {}).get('parts') or [])
+
+
+def old_path(stream: bytes, provider: str) -> list:
+    """What the stream paths did before: iter_lines, decode and json.loads per line."""
+    response = Response()
+    response.raw = io.BytesIO(stream)
+    delta = old_openai_delta if provider == 'openai' else old_gemini_delta
+    deltas = []
+    for line in response.iter_lines():
+        if not line:
+            continue
+        line = line.decode('utf-8')
+        if not line.startswith('data: '):
+            continue
+        if line[6:] == '[DONE]':
+            break
+        try:
+            content = delta(json.loads(line[6:]))
+        except (json.JSONDecodeError, KeyError, AttributeError):
+            continue
+        if content:
+            deltas.append(content)
+    return deltas
+
+
+def new_path(chunks: list, agent: CrewAgent) -> list:
+    deltas = []
+    if agent.provider == 'gemini':
+        for data in sse_parser.iter_sse_data(chunks):
+            event = agent._parse_gemini_stream_event(data)
+            if event and event[0]:
+                deltas.append(event[0])
+        return deltas
+    for data in sse_parser.iter_sse_data(chunks):
+        event = agent._parse_openai_stream_event(data)
+        if event is STREAM_DONE:
+            break
+        if event and event[0]:
+            deltas.append(event[0])
+    return deltas
+
+
+def split(stream: bytes, size: int) -> list:
+    return [stream[offset:offset + size] for offset in range(0, len(stream), size)]
+
+
+def throughput(fn, size: int, runs: int) -> tuple:
+    timings = []
+    deltas = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        deltas = fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return size / percentile(timings, 0.5) / 1e6, deltas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000, help='Events in the OpenAI-style stream')
+    parser.add_argument('--chunk-size', type=int, default=1400, help='Bytes per chunk read off the socket')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    backend = 'orjson' if sse_parser.orjson is not None else 'stdlib json'
+    openai = openai_stream(args.events)
+    streams = (('openai', openai), ('gemini', gemini_stream(len(openai))))
+    print(f"{'stream':<8}{'parser':<34}{'MB/s':>8}{'deltas':>9}")
+    for provider, stream in streams:
+        agent = CrewAgent('bench', provider=provider, model='bench')
+        expected = old_path(stream, provider)
+        rows = [
+            ('iter_lines + json.loads, 512 B', lambda: old_path(stream, provider), None),
+            (f'SSEParser, {backend}, 512 B', lambda chunks=split(stream, 512): new_path(chunks, agent), None),
+            (f'SSEParser, {backend}, {args.chunk_size} B', lambda chunks=split(stream, args.chunk_size): new_path(chunks, agent), None),
+        ]
+        if sse_parser.orjson is not None:
+            rows.append((f'SSEParser, stdlib json, {args.chunk_size} B', lambda chunks=split(stream, args.chunk_size): new_path(chunks, agent), json.loads))
+        default_loads = crew_stub.sse_loads
+        for name, fn, loads in rows:
+            crew_stub.sse_loads = loads or default_loads
+            try:
+                mb_per_second, deltas = throughput(fn, len(stream), args.runs)
+            finally:
+                crew_stub.sse_loads = default_loads
+            assert deltas == expected, name
+            print(f'{provider:<8}{name:<34}{mb_per_second:>8.1f}{len(deltas):>9}')
+
+
+if __name__ == '__main__':
+    main()
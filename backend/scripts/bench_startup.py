@@ -0,0 +1,110 @@
+"""Backend startup time: schema check at boot and a cold process.
+
+Schema rows run against an engine created for each run, as a booting
+worker does:
+
+- "per-boot probing" is the old init_db: create_all, the chat message
+  indexes with checkfirst and a fresh inspector for each of four agent
+  columns.
+- "migrations" is init_db now (app.migrations), on a current database and
+  on an empty one.
+
+"process" starts a new interpreter that imports app.main and runs init_db
+on a current database, next to a bare interpreter for reference.
+
+    cd backend
+    python scripts/bench_startup.py --runs 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from sqlalchemy import create_engine, inspect  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.db_profiles import configure_engine, engine_options  # noqa: E402
+from app.migrations import run_migrations  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+AGENT_COLUMNS = ('api_key', 'provider', 'top_p', 'top_k')
+
+
+def new_engine(path: str):
+    url = f'sqlite:///{path}'
+    engine = create_engine(url, **engine_options(url))
+    configure_engine(engine)
+    return engine
+
+
+def per_boot_probing(engine):
+    Base.metadata.create_all(bind=engine)
+    for index in models.ChatMessage.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    for column in AGENT_COLUMNS:
+        # Each column check built its own inspector and reflected agents again
+        assert column in {col['name'] for col in inspect(engine).get_columns('agents')}
+
+
+def migrations(engine):
+    run_migrations(engine, Base.metadata)
+
+
+def time_boots(fn, runs: int, path_for_run) -> list:
+    timings = []
+    for run in range(runs):
+        engine = new_engine(path_for_run(run))
+        started = time.perf_counter()
+        fn(engine)
+        timings.append(time.perf_counter() - started)
+        engine.dispose()
+    return sorted(timings)
+
+
+def time_processes(code: str, runs: int, env: dict) -> list:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-startup-')
+    current = os.path.join(directory, 'current.db')
+    engine = new_engine(current)
+    migrations(engine)
+    engine.dispose()
+
+    rows = (
+        ('per-boot probing, current', time_boots(per_boot_probing, args.runs, lambda run: current)),
+        ('migrations, current', time_boots(migrations, args.runs, lambda run: current)),
+        ('migrations, empty', time_boots(migrations, args.runs, lambda run: os.path.join(directory, f'empty-{run}.db'))),
+    )
+    print(f"{'startup':<28}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, timings in rows:
+        print(f'{name:<28}{percentile(timings, 0.5) * 1000:>10.2f}{percentile(timings, 0.95) * 1000:>10.2f}')
+
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{current}')
+    runs = max(1, args.runs // 4)
+    for name, code in (
+        ('process, bare python', 'pass'),
+        ('process, app + init_db', 'import app.main; from app.database import init_db; init_db()'),
+    ):
+        timings = time_processes(code, runs, env)
+        print(f'{name:<28}{percentile(timings, 0.5) * 1000:>10.0f}{percentile(timings, 0.95) * 1000:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Time to first byte and total duration of a streamed chat reply.
+
+Starts the backend with the fake provider (see loadtest.py --spawn) once per
+coalescing setting and reads --streams replies from /chat/{id}/send-stream
+one after another. "first byte" is the start event, "first chunk" the first
+reply text, "done" the whole stream.
+
+The "fixed sleep" row replays the same fake provider stream in process with
+the 100 ms sleep the SSE pipeline used to take after every chunk, for
+comparison with the current pipeline.
+
+    cd backend
+    python scripts/bench_stream_latency.py --streams 20 --reply-tokens 200 --tokens-per-second 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx  # noqa: E402
+
+from loadtest import Recorder, percentile, setup_user, spawn_server  # noqa: E402
+
+# (label, STREAM_COALESCE_BYTES, STREAM_COALESCE_MS)
+SETTINGS = (('per token', 0, 0), ('coalesced', 48, 25))
+FIXED_SLEEP = 0.1
+
+
+async def read_streams(url: str, streams: int) -> tuple:
+    timings = {'first byte': [], 'first chunk': [], 'done': []}
+    events = 0
+    async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+        headers, agent_id = await setup_user(client, Recorder())
+        for number in range(streams):
+            started = time.perf_counter()
+            first_chunk = None
+            async with client.stream('POST', f'/chat/{agent_id}/send-stream', json={'message': f'Request {number}'}, headers=headers) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith('data: '):
+                        continue
+                    event = json.loads(line[6:])
+                    if event['type'] == 'start':
+                        timings['first byte'].append(time.perf_counter() - started)
+                    elif event['type'] == 'chunk':
+                        events += 1
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter() - started
+                    elif event['type'] == 'error':
+                        raise SystemExit(f"Stream failed: {event['message']}")
+            timings['first chunk'].append(first_chunk)
+            timings['done'].append(time.perf_counter() - started)
+    return timings, events / streams
+
+
+async def fixed_sleep_streams(streams: int) -> tuple:
+    from app.core import fake_provider
+    from app.core.crew_stub import CrewAgent
+
+    agent = CrewAgent('bench', provider='fake', model='fake', temperature=0.7)
+    timings = {'first chunk': [], 'done': []}
+    for number in range(streams):
+        started = time.perf_counter()
+        first_chunk = None
+        async for _ in fake_provider.astream(agent, f'Request {number}'):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            await asyncio.sleep(FIXED_SLEEP)
+        timings['first chunk'].append(first_chunk)
+        timings['done'].append(time.perf_counter() - started)
+    return timings, fake_provider.FAKE_REPLY_TOKENS
+
+
+def row(label: str, timings: dict, events: float) -> str:
+    cells = ''.join(
+        f"{percentile(sorted(timings[name]), 0.5) * 1000:>12.0f}" if name in timings else f"{'-':>12}"
+        for name in ('first byte', 'first chunk', 'done')
+    )
+    return f'{label:<14}{cells}{events:>10.0f}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=20, help='Replies read per setting')
+    parser.add_argument('--ttft-ms', type=float, default=200)
+    parser.add_argument('--tokens-per-second', type=float, default=100)
+    parser.add_argument('--reply-tokens', type=int, default=200)
+    args = parser.parse_args()
+    args.error_rate = 0
+
+    print(f"{'pipeline':<14}{'first byte':>12}{'first chunk':>12}{'done':>12}{'events':>10}   (p50 ms)")
+    for label, max_bytes, max_ms in SETTINGS:
+        os.environ['STREAM_COALESCE_BYTES'] = str(max_bytes)
+        os.environ['STREAM_COALESCE_MS'] = str(max_ms)
+        process, url = spawn_server(args)
+        try:
+            print(row(label, *asyncio.run(read_streams(url, args.streams))))
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    os.environ['FAKE_TTFT_MS'] = str(args.ttft_ms)
+    os.environ['FAKE_TOKENS_PER_SECOND'] = str(args.tokens_per_second)
+    os.environ['FAKE_REPLY_TOKENS'] = str(args.reply_tokens)
+    # A few are enough: each takes reply_tokens * 100 ms
+    print(row('fixed sleep', *asyncio.run(fixed_sleep_streams(min(args.streams, 3)))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Local OpenAI-compatible chat completions server for tests and load tests.
+
+Answers POST /v1/chat/completions (streaming or not) with a fixed number of
+tokens, paced like a real model, and can answer 429 while more than a given
+number of requests are in flight, the way a provider enforces a concurrency
+limit. Standard library only.
+
+    cd backend
+    python scripts/fake_openai_server.py --port 9100 --ttft-ms 200 --tokens-per-second 50
+    OPENAI_CHAT_COMPLETIONS_URL=http://127.0.0.1:9100/v1/chat/completions uvicorn app.main:app
+
+From Python, FakeOpenAIServer runs on an event loop of its own thread:
+
+    with FakeOpenAIServer(max_concurrency=8) as server:
+        ...  # server.url, server.peak_in_flight, server.rate_limited
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+
+class FakeOpenAIServer:
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        ttft_ms: float = 200,
+        tokens_per_second: float = 0,
+        reply_tokens: int = 16,
+        max_concurrency: int = 0,
+        retry_after: float = None,
+        ssl_context=None
+    ):
+        self.host = host
+        self.port = port
+        self.ttft = ttft_ms / 1000.0
+        self.token_gap = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.reply_tokens = reply_tokens
+        # Above this many requests in flight, answer 429 (0 = never)
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        # Serve HTTPS with this ssl.SSLContext, for benchmarks that include the TLS handshake
+        self.ssl_context = ssl_context
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._server = None
+        self._connections = set()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        scheme = 'https' if self.ssl_context is not None else 'http'
+        return f'{scheme}://{self.host}:{self.port}/v1/chat/completions'
+
+    async def start(self):
+        """Serve on the running event loop."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        # Kept-alive client connections would otherwise outlive the server
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def __enter__(self):
+        """Serve from a background thread with its own event loop."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='fake-openai-server', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def reset(self):
+        self.requests = self.rate_limited = self.peak_in_flight = 0
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length') or 0))
+                await self._respond(request_line.split()[1].decode(), body, writer)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _respond(self, path: str, body: bytes, writer):
+        if not path.endswith('/chat/completions'):
+            await self._send_json(writer, 404, {'error': {'message': f'No route for {path}'}})
+            return
+        self.requests += 1
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            self.rate_limited += 1
+            extra = {'Retry-After': str(self.retry_after)} if self.retry_after is not None else {}
+            await self._send_json(writer, 429, {'error': {'message': 'Rate limit reached for requests'}}, extra)
+            return
+        request = json.loads(body or b'{}')
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            tokens = self._tokens(request)
+            await asyncio.sleep(self.ttft)
+            if request.get('stream'):
+                await self._stream(writer, request, tokens)
+            else:
+                await asyncio.sleep(self.token_gap * max(0, len(tokens) - 1))
+                await self._send_json(writer, 200, {
+                    'id': 'chatcmpl-fake',
+                    'object': 'chat.completion',
+                    'model': request.get('model'),
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens)}, 'finish_reason': 'stop'}],
+                    'usage': self._usage(request, tokens)
+                })
+        finally:
+            self.in_flight -= 1
+
+    def _tokens(self, request: dict) -> list:
+        count = self.reply_tokens
+        if request.get('max_tokens'):
+            count = min(count, request['max_tokens'])
+        return [('' if index == 0 else ' ') + f'token{index}' for index in range(count)]
+
+    @staticmethod
+    def _usage(request: dict, tokens: list) -> dict:
+        prompt_tokens = sum(len(str(message.get('content') or '')) for message in request.get('messages', [])) // 4 + 1
+        return {'prompt_tokens': prompt_tokens, 'completion_tokens': len(tokens), 'total_tokens': prompt_tokens + len(tokens)}
+
+    async def _stream(self, writer, request: dict, tokens: list):
+        writer.write(
+            b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+            b'Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n'
+        )
+        for index, token in enumerate(tokens):
+            if index and self.token_gap:
+                await asyncio.sleep(self.token_gap)
+            event = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}
+            self._write_chunk(writer, b'data: ' + json.dumps(event).encode() + b'\n\n')
+            await writer.drain()
+        final = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+        self._write_chunk(writer, b'data: ' + json.dumps(final).encode() + b'\n\ndata: [DONE]\n\n')
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer, data: bytes):
+        writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    @staticmethod
+    async def _send_json(writer, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode()
+        reason = {200: 'OK', 404: 'Not Found', 429: 'Too Many Requests'}.get(status, 'Error')
+        head = f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+        for name, value in (headers or {}).items():
+            head += f'{name}: {value}\r\n'
+        writer.write(head.encode() + b'\r\n' + body)
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--ttft-ms', type=float, default=200, help='Delay before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=50, help='Pacing of the other tokens, 0 for none')
+    parser.add_argument('--reply-tokens', type=int, default=64)
+    parser.add_argument('--max-concurrency', type=int, default=0, help='Answer 429 above this many requests in flight, 0 for never')
+    parser.add_argument('--retry-after', type=float, default=None, help='Retry-After sent with a 429')
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.host, args.port, args.ttft_ms, args.tokens_per_second, args.reply_tokens, args.max_concurrency, args.retry_after)
+
+    async def serve():
+        await server.start()
+        print(f'Serving {server.url}', flush=True)
+        started = time.monotonic()
+        while True:
+            await asyncio.sleep(10)
+            print(f'{time.monotonic() - started:.0f}s: {server.requests} requests, {server.rate_limited} rate limited, peak {server.peak_in_flight} in flight', flush=True)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""End-to-end load test of the backend against the fake provider.
+
+Registers a few users, logs them in and gives each an agent with
+provider='fake', then sends a mix of send, send-stream, history and login
+requests at a fixed rate (open loop: a slow server does not slow the arrivals down).
+Reports p50/p95/p99 latency and throughput per operation; send-stream also
+reports the time to its first chunk.
+
+    cd backend
+    python scripts/loadtest.py --spawn --rps 50 --duration 30
+    python scripts/loadtest.py --url http://localhost:8000 --mix send=1,history=1
+
+--spawn starts uvicorn on a free local port with a throwaway SQLite database
+and the fake provider settings given here, so no network is needed. Against
+a running server, the FAKE_* settings are the server's own.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# agent_id -> (email, password) of the user setup_user created it for
+CREDENTIALS = {}
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}  # operation -> [seconds]
+        self.errors = {}  # operation -> count
+
+    def add(self, operation: str, seconds: float):
+        self.latencies.setdefault(operation, []).append(seconds)
+
+    def fail(self, operation: str):
+        self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def report(self, elapsed: float) -> list:
+        rows = []
+        for operation in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies.get(operation, []))
+            rows.append({
+                'operation': operation,
+                'count': len(values),
+                'errors': self.errors.get(operation, 0),
+                'p50_ms': percentile(values, 0.50) * 1000,
+                'p95_ms': percentile(values, 0.95) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+                'throughput_rps': len(values) / elapsed if elapsed > 0 else 0.0
+            })
+        return rows
+
+
+def parse_mix(value: str) -> list:
+    mix = []
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'Unknown operation "{name}" in --mix')
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+async def timed(recorder: Recorder, operation: str, request):
+    started = time.perf_counter()
+    try:
+        response = await request
+        response.raise_for_status()
+    except httpx.HTTPError:
+        recorder.fail(operation)
+        return None
+    recorder.add(operation, time.perf_counter() - started)
+    return response
+
+
+async def setup_user(client: httpx.AsyncClient, recorder: Recorder) -> tuple:
+    email = f'load-{uuid.uuid4().hex[:12]}@example.com'
+    password = uuid.uuid4().hex
+    await timed(recorder, 'register', client.post('/auth/register', json={'username': email.split('@')[0], 'email': email, 'password': password}))
+    response = await timed(recorder, 'login', client.post('/auth/login', data={'username': email, 'password': password}))
+    if response is None:
+        raise SystemExit('Login failed; is the server up?')
+    headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+    # Above the response cache temperature limit, so every send reaches the provider. The
+    # fake provider ignores the key, but the scheduler tracks calls per key as for real users.
+    agent = {'name': 'load-test', 'role': 'tester', 'goal': 'answer', 'provider': 'fake', 'temperature': 0.7, 'api_key': f'fake-{uuid.uuid4().hex}'}
+    response = await timed(recorder, 'create', client.post('/agents/create', json=agent, headers=headers))
+    if response is None:
+        raise SystemExit('Creating the agent failed')
+    CREDENTIALS[response.json()['id']] = (email, password)
+    return headers, response.json()['id']
+
+
+async def send(client, recorder, headers, agent_id, number: int):
+    await timed(recorder, 'send', client.post(f'/chat/{agent_id}/send', json={'message': f'Request {number}: summarize the plan'}, headers=headers))
+
+
+async def send_stream(client, recorder, headers, agent_id, number: int):
+    started = time.perf_counter()
+    first_chunk = None
+    failed = False
+    try:
+        async with client.stream('POST', f'/chat/{agent_id}/send-stream', json={'message': f'Request {number}: stream the plan'}, headers=headers) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                event = json.loads(line[5:])
+                if event.get('type') == 'chunk' and first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+                elif event.get('type') == 'error':
+                    failed = True
+    except httpx.HTTPError:
+        failed = True
+    if failed:
+        recorder.fail('send-stream')
+        return
+    recorder.add('send-stream', time.perf_counter() - started)
+    if first_chunk is not None:
+        recorder.add('send-stream:first-chunk', first_chunk)
+
+
+async def history(client, recorder, headers, agent_id, number: int):
+    await timed(recorder, 'history', client.get(f'/chat/{agent_id}/history', params={'limit': 50}, headers=headers))
+
+
+async def login(client, recorder, headers, agent_id, number: int):
+    email, password = CREDENTIALS[agent_id]
+    await timed(recorder, 'login', client.post('/auth/login', data={'username': email, 'password': password}))
+
+
+OPERATIONS = {'send': send, 'send-stream': send_stream, 'history': history, 'login': login}
+
+
+async def run(args) -> tuple:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        users = [await setup_user(client, recorder) for _ in range(args.users)]
+
+        rng = random.Random(args.seed)
+        names = [name for name, _ in args.mix]
+        weights = [weight for _, weight in args.mix]
+        interval = 1.0 / args.rps
+        in_flight = set()
+        dropped = 0
+        started = time.perf_counter()
+        number = 0
+        while True:
+            due = started + number * interval
+            if due - started >= args.duration:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= args.max_in_flight:
+                # Server cannot keep up; count it instead of queueing without bound
+                dropped += 1
+            else:
+                headers, agent_id = users[number % len(users)]
+                operation = OPERATIONS[rng.choices(names, weights)[0]]
+                task = asyncio.create_task(operation(client, recorder, headers, agent_id, number))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            number += 1
+        if in_flight:
+            await asyncio.wait(in_flight)
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed, number, dropped
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(args):
+    port = free_port()
+    database = os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'loadtest.db')
+    env = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{database}',
+        FAKE_TTFT_MS=str(args.ttft_ms),
+        FAKE_TOKENS_PER_SECOND=str(args.tokens_per_second),
+        FAKE_ERROR_RATE=str(args.error_rate),
+        FAKE_REPLY_TOKENS=str(args.reply_tokens)
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit('The server exited during startup')
+        try:
+            if httpx.get(url + '/metrics', timeout=1).status_code < 500:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('The server did not start within 30 seconds')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000', help='Server to test (ignored with --spawn)')
+    parser.add_argument('--spawn', action='store_true', help='Start a local server with a throwaway database')
+    parser.add_argument('--rps', type=float, default=20, help='Target requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to send requests for')
+    parser.add_argument('--users', type=int, default=5, help='Users (each with one agent) the requests are spread over')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('send=4,send-stream=4,history=2'), help='Weighted operations, e.g. send=4,send-stream=4,history=2')
+    parser.add_argument('--max-in-flight', type=int, default=500, help='Requests outstanding at once before arrivals are dropped')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the operation mix')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    fake = parser.add_argument_group('fake provider (with --spawn)')
+    fake.add_argument('--ttft-ms', type=float, default=200)
+    fake.add_argument('--tokens-per-second', type=float, default=50)
+    fake.add_argument('--error-rate', type=float, default=0)
+    fake.add_argument('--reply-tokens', type=int, default=64)
+    args = parser.parse_args()
+
+    process = None
+    if args.spawn:
+        process, args.url = spawn_server(args)
+    try:
+        recorder, elapsed, sent, dropped = asyncio.run(run(args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    rows = recorder.report(elapsed)
+    summary = {'target_rps': args.rps, 'sent_rps': (sent - dropped) / args.duration, 'seconds': elapsed, 'dropped': dropped}
+    if args.json:
+        print(json.dumps({'summary': summary, 'operations': rows}, indent=2))
+        return
+    print(f"{'operation':<24}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    for row in rows:
+        print(f"{row['operation']:<24}{row['count']:>8}{row['errors']:>8}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['throughput_rps']:>9.1f}")
+    print(f"\ntarget {summary['target_rps']:.1f} req/s, sent {summary['sent_rps']:.1f} req/s, finished after {elapsed:.1f}s, dropped {dropped}")
+
+
+if __name__ == '__main__':
+    main()
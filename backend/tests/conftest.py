@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# Local provider stand-ins shared with the load test scripts
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'scripts'))
+
+# The app reads its settings at import time: point it at a throwaway database,
+# keep it off any configured shared state backend and make hashing cheap
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='agent-builder-tests-'), 'test.db')
+os.environ['SHARED_STATE_URL'] = 'memory://'
+os.environ['BCRYPT_ROUNDS'] = '4'
+os.environ.setdefault('FAKE_TTFT_MS', '0')
+os.environ.setdefault('FAKE_TOKENS_PER_SECOND', '0')
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import models  # noqa: E402
+from app.core import crew_stub  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from fake_openai_server import FakeOpenAIServer  # noqa: E402
+
+init_db()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def agent(db):
+    """An agent of a fresh user, using the local fake provider."""
+    name = uuid.uuid4().hex[:12]
+    user = models.User(username=name, email=f'{name}@example.com', password='x')
+    db.add(user)
+    db.flush()
+    row = models.Agent(name='tester', role='tester', goal='answer', provider='fake', model_name='fake', owner_id=user.id)
+    db.add(row)
+    db.commit()
+    return row
+
+
+@pytest.fixture
+def openai_server(monkeypatch):
+    """A local OpenAI-compatible server behind the openai provider; replies at once with 4 tokens."""
+    with FakeOpenAIServer(ttft_ms=0, reply_tokens=4) as server:
+        monkeypatch.setattr(crew_stub, 'OPENAI_CHAT_COMPLETIONS_URL', server.url)
+        yield server
+
+
+@pytest.fixture(scope='session')
+def client():
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def headers(client):
+    """Authorization headers of a freshly registered user."""
+    name = uuid.uuid4().hex[:12]
+    email = f'{name}@example.com'
+    client.post('/auth/register', json={'username': name, 'email': email, 'password': 'secret'}).raise_for_status()
+    response = client.post('/auth/login', data={'username': email, 'password': 'secret'})
+    response.raise_for_status()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,48 @@
+import uuid
+
+from app import utils
+from app.database import engine
+
+
+def register(client, name: str):
+    return client.post('/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'secret'})
+
+
+def test_no_connection_is_held_while_hashing(client, monkeypatch):
+    checked_out = []
+    hash_password, verify_password = utils.hash_password, utils.verify_password
+
+    def recording_hash(password):
+        checked_out.append(engine.pool.checkedout())
+        return hash_password(password)
+
+    def recording_verify(plain, hashed):
+        checked_out.append(engine.pool.checkedout())
+        return verify_password(plain, hashed)
+
+    monkeypatch.setattr(utils, 'hash_password', recording_hash)
+    monkeypatch.setattr(utils, 'verify_password', recording_verify)
+    # The message writer thread keeps a connection of its own
+    idle = engine.pool.checkedout()
+    name = uuid.uuid4().hex[:12]
+    register(client, name).raise_for_status()
+    client.post('/auth/login', data={'username': f'{name}@example.com', 'password': 'secret'}).raise_for_status()
+
+    assert checked_out == [idle, idle]
+
+
+def test_full_hashing_queue_is_rejected(client, monkeypatch):
+    name = uuid.uuid4().hex[:12]
+    register(client, name).raise_for_status()
+    monkeypatch.setattr(utils, 'PASSWORD_HASH_QUEUE', 1)
+    monkeypatch.setattr(utils, '_password_jobs', 1)
+
+    response = client.post('/auth/login', data={'username': f'{name}@example.com', 'password': 'secret'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_duplicate_registration_is_rejected(client):
+    name = uuid.uuid4().hex[:12]
+    register(client, name).raise_for_status()
+    assert register(client, name).status_code == 400
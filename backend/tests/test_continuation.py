@@ -0,0 +1,92 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.core import crew_stub, fake_provider
+from app.core.crew_stub import CrewAgent
+
+MODES = ('think', 'think_stream', 'athink', 'athink_stream')
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """(continuation max_tokens or None, reply text) of every fake provider call."""
+    recorded = []
+    complete, acomplete, stream, astream = fake_provider.complete, fake_provider.acomplete, fake_provider.stream, fake_provider.astream
+
+    def limit(continuation):
+        return continuation[2] if continuation else None
+
+    def recording_complete(agent, prompt, history=None, continuation=None):
+        content, finish_reason = complete(agent, prompt, history, continuation)
+        recorded.append((limit(continuation), content))
+        return content, finish_reason
+
+    async def recording_acomplete(agent, prompt, history=None, continuation=None):
+        content, finish_reason = await acomplete(agent, prompt, history, continuation)
+        recorded.append((limit(continuation), content))
+        return content, finish_reason
+
+    def recording_stream(agent, prompt, history=None, continuation=None, result=None):
+        chunks = list(stream(agent, prompt, history, continuation, result))
+        recorded.append((limit(continuation), ''.join(chunks)))
+        yield from chunks
+
+    async def recording_astream(agent, prompt, history=None, continuation=None, result=None):
+        chunks = [chunk async for chunk in astream(agent, prompt, history, continuation, result)]
+        recorded.append((limit(continuation), ''.join(chunks)))
+        for chunk in chunks:
+            yield chunk
+
+    monkeypatch.setattr(fake_provider, 'complete', recording_complete)
+    monkeypatch.setattr(fake_provider, 'acomplete', recording_acomplete)
+    monkeypatch.setattr(fake_provider, 'stream', recording_stream)
+    monkeypatch.setattr(fake_provider, 'astream', recording_astream)
+    return recorded
+
+
+def ask(mode: str, reply_tokens: int, monkeypatch) -> str:
+    monkeypatch.setattr(fake_provider, 'FAKE_REPLY_TOKENS', reply_tokens)
+    agent = CrewAgent('writer', provider='fake', model='fake', temperature=1.0, max_tokens=100)
+    prompt = f'Write a long answer {uuid.uuid4().hex}'
+    if mode == 'think':
+        return agent.think(prompt)
+    if mode == 'think_stream':
+        return ''.join(agent.think_stream(prompt))
+
+    async def run():
+        if mode == 'athink':
+            return await agent.athink(prompt)
+        return ''.join([chunk async for chunk in agent.athink_stream(prompt)])
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_cut_off_reply_is_stitched_until_it_stops(mode, calls, monkeypatch):
+    reply = ask(mode, 130, monkeypatch)
+
+    # 100 tokens cut off by max_tokens, then the 30 that were missing
+    assert [(limit, len(content.split())) for limit, content in calls] == [(None, 100), (50, 30)]
+    assert reply == ' '.join(content for _, content in calls)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_hop_limit_stops_continuing(mode, calls, monkeypatch):
+    monkeypatch.setattr(crew_stub, 'CONTINUATION_MAX_HOPS', 1)
+    reply = ask(mode, 1000, monkeypatch)
+
+    assert [limit for limit, _ in calls] == [None, 50]
+    assert len(reply.split()) == 150
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_token_budget_stops_continuing(mode, calls, monkeypatch):
+    monkeypatch.setattr(crew_stub, 'CONTINUATION_MAX_HOPS', 5)
+    # Two hops of 50 tokens fit; the 20 left are below CONTINUATION_MIN_TOKENS
+    monkeypatch.setattr(crew_stub, 'CONTINUATION_TOKEN_BUDGET', 120)
+    reply = ask(mode, 1000, monkeypatch)
+
+    assert [limit for limit, _ in calls] == [None, 50, 50]
+    assert len(reply.split()) == 200
+    assert reply == ' '.join(content for _, content in calls)
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app.core import crew_stub
+from app.core.crew_stub import CrewAgent
+from app.core.sse_parser import iter_sse_data
+from app.core.transport import aclose_clients
+
+# streamGenerateContent?alt=sse bodies, one file per model name
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'gemini')
+# Small enough to split events and multi-byte characters across reads
+SLICE_BYTES = 7
+
+
+def fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, f'{name}.sse'), 'rb') as handle:
+        return handle.read()
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        url = urlparse(self.path)
+        self.server.queries.append(parse_qs(url.query))
+        name = re.search(r'/models/([^/:]+):streamGenerateContent$', url.path).group(1)
+        body = fixture(name)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for start in range(0, len(body), SLICE_BYTES):
+                piece = body[start:start + SLICE_BYTES]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except ConnectionError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def replay_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ReplayHandler)
+    server.queries = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}', server.queries
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def agent_for(replay_url, monkeypatch):
+    url, _ = replay_url
+    monkeypatch.setattr(crew_stub, 'GEMINI_STREAM_URL_TEMPLATE', url + '/v1beta/models/{model}:streamGenerateContent')
+    return lambda name: CrewAgent('tester', provider='gemini', model=name, temperature=1.0)
+
+
+def stream_sync(agent, chunks: list):
+    for chunk in agent.think_stream('What is the capital of France?', 'gm-test'):
+        chunks.append(chunk)
+
+
+def stream_async(agent, chunks: list):
+    async def run():
+        try:
+            async for chunk in agent.athink_stream('What is the capital of France?', 'gm-test'):
+                chunks.append(chunk)
+        finally:
+            await aclose_clients()
+
+    asyncio.run(run())
+
+
+def events(name: str) -> list:
+    return list(iter_sse_data([fixture(name)]))
+
+
+def test_fixture_events_parse():
+    agent = CrewAgent('tester', provider='gemini')
+    parsed = [agent._parse_gemini_stream_event(data) for data in events('text')]
+    assert parsed == [
+        ('The capital', ''),
+        (' of France is Paris, which has been the country’s capital since 987 ', ''),
+        ('— cafés included.', 'STOP')
+    ]
+    # A candidate without content carries only the finish reason
+    assert agent._parse_gemini_stream_event(events('safety')[1]) == ('', 'SAFETY')
+    with pytest.raises(RuntimeError, match=r'blocked the prompt \(SAFETY\)'):
+        agent._parse_gemini_stream_event(events('blocked')[0])
+    with pytest.raises(RuntimeError, match='The model is overloaded'):
+        agent._parse_gemini_stream_event(events('error')[1])
+
+
+@pytest.mark.parametrize('stream', [stream_sync, stream_async])
+def test_stream_yields_the_reply(agent_for, replay_url, stream):
+    chunks = []
+    stream(agent_for('text'), chunks)
+    assert ''.join(chunks) == 'The capital of France is Paris, which has been the country’s capital since 987 — cafés included.'
+    query = replay_url[1][-1]
+    assert query['alt'] == ['sse'] and query['key'] == ['gm-test']
+
+
+@pytest.mark.parametrize('stream', [stream_sync, stream_async])
+def test_safety_finish_reason_stops_the_stream(agent_for, stream):
+    chunks = []
+    with pytest.raises(RuntimeError, match=r'stopped the response early \(SAFETY\)'):
+        stream(agent_for('safety'), chunks)
+    # Nothing after the finish reason is read
+    assert chunks == ['Here is how you']
+
+
+@pytest.mark.parametrize('stream', [stream_sync, stream_async])
+def test_blocked_prompt_fails_before_any_text(agent_for, stream):
+    chunks = []
+    with pytest.raises(RuntimeError, match=r'blocked the prompt \(SAFETY\)'):
+        stream(agent_for('blocked'), chunks)
+    assert chunks == []
+
+
+@pytest.mark.parametrize('stream', [stream_sync, stream_async])
+def test_error_event_fails_the_stream(agent_for, stream):
+    chunks = []
+    with pytest.raises(RuntimeError, match='The model is overloaded'):
+        stream(agent_for('error'), chunks)
+    assert chunks == ['Partial']
@@ -0,0 +1,104 @@
+import pytest
+
+from app import memory
+from app.core.crew_stub import CrewAgent
+from app.memory import ConversationMemory, _merge_roles, estimate_tokens, history_budget
+from app.persistence import MessageWriter
+
+
+def turn(label: str) -> str:
+    # 40 characters, so every turn costs estimate_tokens() == 11
+    return f'{label:-<40}'
+
+
+def write(agent_id: int, turns: list):
+    writer = MessageWriter()
+    for sender, label in turns:
+        writer.enqueue(agent_id, sender, turn(label))
+
+
+@pytest.fixture
+def runtime():
+    return CrewAgent('tester', role='tester', goal='answer', provider='fake', model='gpt-4', max_tokens=100)
+
+
+def test_history_budget_reserves_reply_system_prompt_and_prompt(runtime, monkeypatch):
+    monkeypatch.setattr(memory, 'MEMORY_MAX_TOKENS', 100000)
+    reserved = 100 + estimate_tokens(runtime._build_system_prompt()) + estimate_tokens('x' * 400)
+    assert history_budget(runtime, 'x' * 400) == 8192 - reserved
+
+    # An agent without max_tokens is budgeted as if it had 1024
+    runtime.max_tokens = 0
+    assert history_budget(runtime, 'x' * 400) == 8192 - (reserved - 100 + 1024)
+
+    monkeypatch.setattr(memory, 'MEMORY_MAX_TOKENS', 500)
+    assert history_budget(runtime, 'x' * 400) == 500
+    assert history_budget(runtime, 'x' * 40000) == 0
+
+
+def test_window_keeps_the_newest_turns_that_fit(db, agent, runtime, monkeypatch):
+    write(agent.id, [('user', 'u0'), ('agent', 'a0'), ('user', 'u1'), ('agent', 'a1'), ('user', 'u2'), ('agent', 'a2')])
+    # Room for two turns of 11 tokens but not three
+    monkeypatch.setattr(memory, 'MEMORY_MAX_TOKENS', 30)
+
+    history = ConversationMemory(mode='window').context(agent.id, runtime, 'next question', db)
+    assert history == [{'role': 'user', 'content': turn('u2')}, {'role': 'assistant', 'content': turn('a2')}]
+    assert sum(estimate_tokens(message['content']) for message in history) <= 30
+
+
+def test_window_sends_alternating_turns_ending_with_the_assistant(db, agent, runtime):
+    # u1 got no reply (failed generation) and u3 is the turn being answered
+    write(agent.id, [('user', 'u0'), ('agent', 'a0'), ('user', 'u1'), ('user', 'u2'), ('agent', 'a2'), ('user', 'u3')])
+
+    history = ConversationMemory(mode='window').context(agent.id, runtime, 'next question', db)
+    assert [message['role'] for message in history] == ['user', 'assistant', 'user', 'assistant']
+    assert history[2]['content'] == turn('u1') + '\n\n' + turn('u2')
+
+
+def test_appended_turns_join_the_window(db, agent, runtime):
+    write(agent.id, [('user', 'u0'), ('agent', 'a0')])
+    conversation = ConversationMemory(mode='window')
+    assert len(conversation.context(agent.id, runtime, 'next question', db)) == 2
+
+    conversation.append(agent.id, 'user', turn('u1'))
+    conversation.append(agent.id, 'agent', turn('a1'))
+    history = conversation.context(agent.id, runtime, 'next question', db)
+    assert [message['content'] for message in history] == [turn('u0'), turn('a0'), turn('u1'), turn('a1')]
+
+
+def test_summary_folds_turns_that_do_not_fit(db, agent, runtime, monkeypatch):
+    write(agent.id, [('user', 'u0'), ('agent', 'a0'), ('user', 'u1'), ('agent', 'a1'), ('user', 'u2'), ('agent', 'a2')])
+    # A quarter of the budget (25 tokens) goes to the summary, 75 to turns
+    monkeypatch.setattr(memory, 'MEMORY_MAX_TOKENS', 100)
+
+    # Everything fits: no summary
+    history = ConversationMemory(mode='summary').context(agent.id, runtime, 'next question', db)
+    assert [message['content'] for message in history] == [turn(label) for label in ('u0', 'a0', 'u1', 'a1', 'u2', 'a2')]
+
+    monkeypatch.setattr(memory, 'MEMORY_MAX_TOKENS', 60)
+    history = ConversationMemory(mode='summary').context(agent.id, runtime, 'next question', db)
+    summary, turns = history[0], history[1:]
+    # 45 tokens for turns: the newest four; the summary (15 tokens) keeps the newest line left out
+    assert [message['content'] for message in turns] == [turn(label) for label in ('u1', 'a1', 'u2', 'a2')]
+    assert summary == {'role': 'system', 'content': f"Summary of the earlier conversation:\nAssistant: {turn('a0')}"}
+
+
+def test_off_sends_no_history(db, agent, runtime):
+    write(agent.id, [('user', 'u0'), ('agent', 'a0')])
+    assert ConversationMemory(mode='off').context(agent.id, runtime, 'next question', db) == []
+
+
+def test_merge_roles():
+    turns = [
+        {'role': 'assistant', 'content': 'a0'},
+        {'role': 'user', 'content': 'u1'},
+        {'role': 'user', 'content': 'u2'},
+        {'role': 'assistant', 'content': 'a2'},
+        {'role': 'user', 'content': 'u3'},
+    ]
+    assert _merge_roles(turns) == [
+        {'role': 'assistant', 'content': 'a0'},
+        {'role': 'user', 'content': 'u1\n\nu2'},
+        {'role': 'assistant', 'content': 'a2'},
+    ]
+    assert _merge_roles([{'role': 'user', 'content': 'u0'}]) == []
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.core import metrics
+from app.core.crew_stub import CrewAgent
+from app.core.transport import aclose_clients
+
+
+def tokens(model: str) -> tuple:
+    values = metrics.provider_tokens_total._values
+    return values.get(('openai', model, 'in'), 0), values.get(('openai', model, 'out'), 0)
+
+
+@pytest.mark.parametrize('run_async', [False, True])
+def test_tokens_come_from_the_reported_usage(openai_server, run_async):
+    model = f'gpt-usage-{int(run_async)}'
+    agent = CrewAgent('tester', provider='openai', model=model, temperature=1.0)
+    prompt = 'x' * 400
+    if run_async:
+        async def run():
+            try:
+                return await agent.athink(prompt, 'sk-test')
+            finally:
+                await aclose_clients()
+        asyncio.run(run())
+    else:
+        agent.think(prompt, 'sk-test')
+    # The fake server reports characters // 4 + 1 over all messages and one token per word
+    system_prompt = agent._build_system_prompt()
+    assert tokens(model) == ((len(system_prompt) + len(prompt)) // 4 + 1, 4)
+
+
+def test_streamed_tokens_are_estimated(openai_server):
+    model = 'gpt-usage-stream'
+    agent = CrewAgent('tester', provider='openai', model=model, temperature=1.0)
+    reply = ''.join(agent.think_stream('hello', 'sk-test'))
+    assert tokens(model)[1] == len(reply) // 4 + 1
+
+
+def test_usage_parsing():
+    data = {
+        'choices': [{'message': {'content': ' hi '}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 11, 'completion_tokens': 2, 'total_tokens': 13}
+    }
+    assert CrewAgent._parse_openai_response(data) == ('hi', 'stop', (11, 2))
+    del data['usage']
+    assert CrewAgent._parse_openai_response(data) == ('hi', 'stop', None)
+    data = {
+        'candidates': [{'content': {'parts': [{'text': 'hi'}]}, 'finishReason': 'STOP'}],
+        'usageMetadata': {'promptTokenCount': 9, 'candidatesTokenCount': 1, 'totalTokenCount': 10}
+    }
+    assert CrewAgent._parse_gemini_response(data) == ('hi', 'STOP', (9, 1))
+    data['usageMetadata'] = {'promptTokenCount': 9}
+    assert CrewAgent._parse_gemini_response(data) == ('hi', 'STOP', None)
+
+
+def test_model_label_values_are_bounded(monkeypatch):
+    monkeypatch.setattr(metrics, '_model_labels', set())
+    monkeypatch.setattr(metrics, 'METRICS_MAX_MODELS', 3)
+    assert metrics.model_label('m' * 1000) == 'm' * metrics.METRICS_MODEL_LABEL_LENGTH
+    assert [metrics.model_label(f'Model-{index}') for index in range(4)] == ['model-0', 'model-1', 'other', 'other']
+    assert metrics.model_label('MODEL-1 ') == 'model-1'
+    assert metrics.provider_label('openai') == 'openai'
+    assert metrics.provider_label('made-up') == 'other'
@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+from sqlalchemy import create_engine, inspect, text
+
+from app import migrations
+from app.database import Base
+
+# The tables as the baseline release created them, before schema versioning
+BASELINE_SCHEMA = (
+    'CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL UNIQUE, email VARCHAR NOT NULL UNIQUE, password VARCHAR NOT NULL)',
+    'CREATE TABLE agents (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, role VARCHAR, goal TEXT, model_name VARCHAR, '
+    'temperature FLOAT, max_tokens INTEGER, top_p FLOAT, top_k INTEGER, api_key VARCHAR, provider VARCHAR, owner_id INTEGER REFERENCES users (id))',
+    'CREATE TABLE chat_messages (id INTEGER PRIMARY KEY, agent_id INTEGER REFERENCES agents (id), sender VARCHAR, message TEXT, '
+    'created_at DATETIME DEFAULT (CURRENT_TIMESTAMP))',
+    'CREATE INDEX ix_chat_messages_id ON chat_messages (id)',
+)
+
+
+def new_engine():
+    return create_engine('sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='migrations-'), 'test.db'))
+
+
+def create_baseline(engine):
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO users (id, username, email, password) VALUES (1, 'old', 'old@example.com', 'x')"))
+        conn.execute(text("INSERT INTO agents (id, name, owner_id) VALUES (1, 'old', 1)"))
+        conn.execute(text("INSERT INTO chat_messages (agent_id, sender, message) VALUES (1, 'user', 'hello')"))
+
+
+def chat_message_indexes(engine) -> set:
+    return {index['name'] for index in inspect(engine).get_indexes('chat_messages')} - {'ix_chat_messages_id'}
+
+
+def test_baseline_database_upgrades_in_one_pass():
+    engine = new_engine()
+    create_baseline(engine)
+
+    # _migrate, not run_migrations: a failing step must not be hidden by a retry
+    assert migrations._migrate(engine, Base.metadata) == 0
+
+    assert chat_message_indexes(engine) == {'ix_chat_messages_agent_id_created_at_id'}
+    assert 'coalesce_requests' in {column['name'] for column in inspect(engine).get_columns('agents')}
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT version FROM schema_version')).scalar() == migrations.SCHEMA_VERSION
+        assert conn.execute(text('SELECT message FROM chat_messages')).scalar() == 'hello'
+    # Current database: nothing left to do
+    assert migrations._migrate(engine, Base.metadata) == migrations.SCHEMA_VERSION
+
+
+def test_version_5_database_replaces_the_agent_id_index():
+    engine = new_engine()
+    create_baseline(engine)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE schema_version (version INTEGER NOT NULL)'))
+        conn.execute(text('INSERT INTO schema_version (version) VALUES (5)'))
+        conn.execute(text('CREATE INDEX ix_chat_messages_agent_id_id ON chat_messages (agent_id, id)'))
+
+    assert migrations._migrate(engine, Base.metadata) == 5
+    assert chat_message_indexes(engine) == {'ix_chat_messages_agent_id_created_at_id'}
+
+
+def test_fresh_database_gets_the_current_schema():
+    engine = new_engine()
+    assert migrations._migrate(engine, Base.metadata) == 0
+    assert chat_message_indexes(engine) == {'ix_chat_messages_agent_id_created_at_id'}
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from app import models
+from app.memory import ConversationMemory
+from app.persistence import MessageWriter
+
+
+def create_agent(client, headers) -> int:
+    response = client.post('/agents/create', json={'name': 'tester', 'role': 'tester', 'goal': 'answer', 'provider': 'fake'}, headers=headers)
+    response.raise_for_status()
+    return response.json()['id']
+
+
+def write_conversation(agent_id: int, turns: int) -> list:
+    """Write a conversation through two writers, as two worker processes would."""
+    first, second = MessageWriter(), MessageWriter()
+    # Each writer reserves its own block of ids, so ids alternate between blocks
+    for writer in (first, second):
+        writer.ids.block_size = 100
+        writer.start()
+    written = []
+    try:
+        for turn in range(turns):
+            writer, other = (first, second) if turn % 2 else (second, first)
+            for sender, text, target in (('user', f'turn{turn}', writer), ('agent', f'reply{turn}', other)):
+                target.enqueue(agent_id, sender, text)
+                written.append(text)
+                time.sleep(0.002)
+    finally:
+        for writer in (first, second):
+            writer.stop()
+    return written
+
+
+def test_history_follows_creation_order_across_writers(client, headers):
+    agent_id = create_agent(client, headers)
+    written = write_conversation(agent_id, 6)
+
+    page = client.get(f'/chat/{agent_id}/history', headers=headers).json()
+    assert [message['message'] for message in page['messages']] == written
+
+    # Paging in both directions keeps the same order
+    older = []
+    cursor = None
+    while True:
+        params = {'limit': 5} if cursor is None else {'limit': 5, 'before_id': cursor}
+        page = client.get(f'/chat/{agent_id}/history', params=params, headers=headers).json()
+        older = [message['message'] for message in page['messages']] + older
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert older == written
+
+    cursor = client.get(f'/chat/{agent_id}/history', params={'limit': len(written)}, headers=headers).json()['messages'][0]['id']
+    newer = [written[0]]
+    while cursor is not None:
+        page = client.get(f'/chat/{agent_id}/history', params={'limit': 5, 'after_id': cursor}, headers=headers).json()
+        newer += [message['message'] for message in page['messages']]
+        cursor = page['next_cursor']
+    assert newer == written
+
+
+def test_memory_loads_turns_in_creation_order(db, agent):
+    written = write_conversation(agent.id, 4)
+    memory = ConversationMemory(mode='window')
+    loaded = [content for _, content in memory._get(agent.id, db).turns]
+    assert loaded == written
+
+
+def test_writes_through_without_writer_thread(db, agent):
+    writer = MessageWriter()
+    message_id = writer.enqueue(agent.id, 'user', 'direct')
+    assert db.get(models.ChatMessage, message_id).message == 'direct'
+
+
+def test_writes_through_after_writer_thread_died(db, agent):
+    writer = MessageWriter()
+    exit_writer = threading.Event()
+    # A writer thread that stops without writing, as one that failed to connect would
+    writer._run = exit_writer.wait
+    writer.start()
+    queued_id = writer.enqueue(agent.id, 'user', 'queued')
+    exit_writer.set()
+    writer._thread.join()
+
+    direct_id = writer.enqueue(agent.id, 'agent', 'direct')
+    writer.flush()
+    assert db.get(models.ChatMessage, queued_id).message == 'queued'
+    assert db.get(models.ChatMessage, direct_id).message == 'direct'
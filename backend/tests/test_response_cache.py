@@ -0,0 +1,43 @@
+import pytest
+
+from app.core import crew_stub
+from app.core.crew_stub import CrewAgent
+from app.core.response_cache import ResponseCache
+
+
+@pytest.fixture
+def server(openai_server, monkeypatch):
+    monkeypatch.setattr(crew_stub, 'response_cache', ResponseCache(mode='exact'))
+    return openai_server
+
+
+def agent_of(owner_id: int) -> CrewAgent:
+    return CrewAgent('tester', provider='openai', model='gpt-4o', temperature=0, owner_id=owner_id)
+
+
+def test_replies_are_reused_for_the_same_owner_and_key(server):
+    agent = agent_of(1)
+    first = agent.think('What is the capital of France?', 'sk-one')
+    assert agent_of(1).think('what is the capital  of france?', 'sk-one') == first
+    assert server.requests == 1
+
+
+def test_replies_are_not_shared_across_owners(server):
+    agent_of(1).think('What is the capital of France?', 'sk-shared')
+    agent_of(2).think('What is the capital of France?', 'sk-shared')
+    assert server.requests == 2
+
+
+def test_replies_are_not_shared_across_api_keys(server):
+    agent = agent_of(1)
+    agent.think('What is the capital of France?', 'sk-one')
+    agent.think('What is the capital of France?', 'sk-two')
+    assert server.requests == 2
+
+
+def test_scope_does_not_contain_the_api_key():
+    agent = agent_of(1)
+    scope = ResponseCache().scope(agent, 'sk-secret')
+    assert scope is not None
+    assert 'sk-secret' not in scope
+    assert scope != ResponseCache().scope(agent, 'sk-other')
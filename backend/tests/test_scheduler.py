@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core import crew_stub, scheduler
+from app.core.crew_stub import CrewAgent
+from app.core.scheduler import ProviderError, ProviderScheduler
+from app.core.transport import aclose_clients
+
+
+def test_default_limits_do_not_cap_one_key():
+    provider_scheduler = ProviderScheduler()
+
+    async def call():
+        await asyncio.sleep(0.5)
+        return 'ok'
+
+    async def run():
+        return await asyncio.gather(*(provider_scheduler.acall('fake', '', call) for _ in range(300)))
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    assert results == ['ok'] * 300
+    assert time.perf_counter() - started < 1.5
+    assert provider_scheduler.rejected == 0
+
+
+def test_429_caps_the_key_and_the_cap_recovers():
+    provider_scheduler = ProviderScheduler()
+    key_limiter, _ = provider_scheduler._limiters('openai', 'key')
+    key_limiter.in_flight = 40
+    key_limiter.throttled(None)
+    assert key_limiter.concurrency == 20
+    key_limiter.in_flight = 0
+    for _ in range(19):
+        key_limiter.succeeded()
+    assert key_limiter.concurrency == 39
+    key_limiter.succeeded()
+    assert key_limiter.concurrency == 0
+
+
+@pytest.fixture
+def rate_limited_server(openai_server, monkeypatch):
+    openai_server.ttft = 0.05
+    openai_server.max_concurrency = 8
+    monkeypatch.setattr(scheduler, 'PROVIDER_BACKOFF_BASE', 0.02)
+    return openai_server
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_rate_limited_provider_is_throttled_until_calls_succeed(rate_limited_server, monkeypatch, stream):
+    provider_scheduler = ProviderScheduler(max_retries=10)
+    monkeypatch.setattr(crew_stub, 'provider_scheduler', provider_scheduler)
+    agent = CrewAgent('tester', provider='openai', model='gpt-4o', temperature=1.0)
+
+    async def ask(number: int) -> str:
+        if stream:
+            return ''.join([chunk async for chunk in agent.athink_stream(f'question {number}', 'sk-test')])
+        return await agent.athink(f'question {number}', 'sk-test')
+
+    async def run():
+        try:
+            return await asyncio.gather(*(ask(number) for number in range(60)))
+        finally:
+            await aclose_clients()
+
+    replies = asyncio.run(run())
+    assert replies == ['token0 token1 token2 token3'] * 60
+    assert rate_limited_server.rate_limited > 0
+    # The first 429 put a cap on the key
+    key_limiter, _ = provider_scheduler._limiters('openai', 'sk-test')
+    assert 0 < key_limiter.recover_at
+    assert provider_scheduler.rejected == 0
+
+
+def test_rate_limit_without_retries_left_fails_the_call(rate_limited_server, monkeypatch):
+    provider_scheduler = ProviderScheduler(max_retries=0)
+    monkeypatch.setattr(crew_stub, 'provider_scheduler', provider_scheduler)
+    rate_limited_server.max_concurrency = 1
+    agent = CrewAgent('tester', provider='openai', model='gpt-4o', temperature=1.0)
+
+    async def run():
+        try:
+            return await asyncio.gather(*(agent.athink(f'question {number}', 'sk-test') for number in range(4)), return_exceptions=True)
+        finally:
+            await aclose_clients()
+
+    results = asyncio.run(run())
+    errors = [result for result in results if isinstance(result, Exception)]
+    assert errors and all(isinstance(error, ProviderError) and error.status_code == 429 for error in errors)
@@ -0,0 +1,83 @@
+import json
+import socket
+import socketserver
+import threading
+import time
+
+from app.shared_state import RESYNC_EVENT, RedisStateBackend
+
+
+class _RecordingRespServer(socketserver.ThreadingTCPServer):
+    """Accepts PUBLISH commands and records their payloads."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _RespHandler)
+        self.published = []
+
+    @property
+    def url(self) -> str:
+        return 'redis://127.0.0.1:%d' % self.server_address[1]
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            header = self.rfile.readline()
+            if not header:
+                return
+            args = []
+            for _ in range(int(header[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            if args[0].upper() == b'PUBLISH':
+                self.server.published.append(json.loads(args[2]))
+            self.wfile.write(b':1\r\n')
+
+
+def _unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_publish_does_not_wait_for_an_unreachable_server():
+    backend = RedisStateBackend(f'redis://127.0.0.1:{_unused_port()}')
+    backend.start()
+    try:
+        started = time.perf_counter()
+        for agent_id in range(1000):
+            backend.publish('chat_messages.written', {'agent_ids': [agent_id]})
+        assert time.perf_counter() - started < 0.5
+        assert _wait_for(lambda: backend.stats()['queued'] == 0)
+        assert backend.stats()['dropped'] == 1000
+    finally:
+        backend.stop()
+
+
+def test_dropped_events_are_followed_by_a_resync():
+    server = _RecordingRespServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    backend = RedisStateBackend(server.url)
+    try:
+        # Fill the queue before the publisher runs: the overflow is dropped
+        backend._publish_queue.maxsize = 2
+        for agent_id in range(3):
+            backend.publish('chat_messages.written', {'agent_ids': [agent_id]})
+        backend.start()
+        assert _wait_for(lambda: len(server.published) == 3)
+        assert [message['event'] for message in server.published] == [RESYNC_EVENT, 'chat_messages.written', 'chat_messages.written']
+        assert all(message['origin'] == backend.origin for message in server.published)
+        assert backend.stats()['dropped'] == 1
+    finally:
+        backend.stop()
+        server.shutdown()
+        server.server_close()
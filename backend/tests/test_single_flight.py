@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.single_flight import SingleFlight
+
+
+def test_concurrent_ado_callers_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'reply'
+
+    async def run():
+        return await asyncio.gather(*(flights.ado('key', upstream) for _ in range(2)))
+
+    assert asyncio.run(run()) == ['reply', 'reply']
+    assert len(calls) == 1
+    assert flights.stats() == {'in_flight': 0, 'leaders': 1, 'joined': 1}
+
+
+def test_late_astream_joiner_replays_earlier_chunks():
+    flights = SingleFlight()
+    calls = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def upstream():
+            calls.append(1)
+            yield 'a'
+            yield 'b'
+            await gate.wait()
+            yield 'c'
+
+        first = flights.astream('key', upstream)
+        received = [await first.__anext__(), await first.__anext__()]
+
+        async def late():
+            return [chunk async for chunk in flights.astream('key', upstream)]
+
+        late_task = asyncio.create_task(late())
+        await asyncio.sleep(0.01)
+        gate.set()
+        received += [chunk async for chunk in first]
+        return received, await late_task
+
+    first, late = asyncio.run(run())
+    assert first == late == ['a', 'b', 'c']
+    assert len(calls) == 1
+
+
+def test_astream_upstream_is_cancelled_after_the_last_subscriber_leaves():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def upstream():
+        try:
+            yield 'a'
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def run():
+        first, second = flights.astream('key', upstream), flights.astream('key', upstream)
+        assert await first.__anext__() == 'a'
+        assert await second.__anext__() == 'a'
+
+        await first.aclose()
+        await asyncio.sleep(0.01)
+        assert not cancelled
+
+        await second.aclose()
+        await asyncio.sleep(0.01)
+        assert cancelled == [1]
+
+    asyncio.run(run())
+    # The abandoned flight is gone: the next caller starts a new one
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_stream_upstream_is_closed_after_the_last_subscriber_leaves():
+    flights = SingleFlight()
+    produced, closed = [], threading.Event()
+    steps = [threading.Event(), threading.Event()]
+
+    def upstream():
+        try:
+            for chunk, step in zip('abc', steps + [None]):
+                produced.append(chunk)
+                yield chunk
+                if step is not None:
+                    step.wait(5)
+            produced.append('d')
+            yield 'd'
+        finally:
+            closed.set()
+
+    first, second = flights.stream('key', upstream), flights.stream('key', upstream)
+    assert next(first) == next(second) == 'a'
+
+    first.close()
+    steps[0].set()
+    # The remaining subscriber keeps the stream going
+    assert next(second) == 'b'
+    assert not closed.is_set()
+
+    second.close()
+    steps[1].set()
+    assert closed.wait(5)
+    assert produced == ['a', 'b', 'c']
+
+
+def test_do_error_reaches_every_waiter():
+    flights = SingleFlight()
+    calls = []
+    errors = []
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.1)
+        raise RuntimeError('provider failed')
+
+    def call():
+        try:
+            flights.do('key', upstream)
+        except RuntimeError as exc:
+            errors.append(str(exc))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == ['provider failed'] * 3
+    assert len(calls) == 1
+
+
+def test_ado_and_astream_errors_reach_every_waiter():
+    flights = SingleFlight()
+
+    async def failing_call():
+        await asyncio.sleep(0.05)
+        raise RuntimeError('provider failed')
+
+    async def failing_stream():
+        yield 'a'
+        await asyncio.sleep(0.05)
+        raise RuntimeError('stream failed')
+
+    async def consume():
+        received = []
+        with pytest.raises(RuntimeError, match='stream failed'):
+            async for chunk in flights.astream('stream', failing_stream):
+                received.append(chunk)
+        return received
+
+    async def run():
+        calls = await asyncio.gather(*(flights.ado('call', failing_call) for _ in range(2)), return_exceptions=True)
+        streams = await asyncio.gather(consume(), consume())
+        return calls, streams
+
+    calls, streams = asyncio.run(run())
+    assert [str(error) for error in calls] == ['provider failed'] * 2
+    assert streams == [['a'], ['a']]
+    assert flights.stats() == {'in_flight': 0, 'leaders': 2, 'joined': 2}
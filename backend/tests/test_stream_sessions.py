@@ -0,0 +1,187 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+import uuid
+
+import httpx
+import pytest
+import uvicorn
+
+from app import stream_sessions as stream_sessions_module
+from app.core import fake_provider
+from app.main import app
+from app.stream_sessions import StreamRegistry, parse_last_event_id
+
+REPLY_TOKENS = 40
+
+
+@pytest.fixture(scope='module')
+def server_url():
+    """The app behind a real HTTP server, so clients can drop mid-stream."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, lifespan='off', log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f'http://127.0.0.1:{port}'
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def slow_replies(monkeypatch):
+    # About 0.4 s per reply, so there is time to drop out in the middle
+    monkeypatch.setattr(fake_provider, 'FAKE_TTFT_MS', 20)
+    monkeypatch.setattr(fake_provider, 'FAKE_TOKENS_PER_SECOND', 100)
+    monkeypatch.setattr(fake_provider, 'FAKE_REPLY_TOKENS', REPLY_TOKENS)
+
+
+@pytest.fixture
+def chat(server_url, slow_replies):
+    """(client, agent_id) of a fresh user with a fake provider agent."""
+    with httpx.Client(base_url=server_url, timeout=10) as client:
+        name = uuid.uuid4().hex[:12]
+        client.post('/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'secret'}).raise_for_status()
+        token = client.post('/auth/login', data={'username': f'{name}@example.com', 'password': 'secret'}).json()['access_token']
+        client.headers['Authorization'] = f'Bearer {token}'
+        agent = client.post('/agents/create', json={'name': 'streamer', 'role': 'tester', 'goal': 'answer', 'provider': 'fake', 'temperature': 0.7})
+        agent.raise_for_status()
+        yield client, agent.json()['id']
+
+
+def read_events(lines, stop_after=None) -> list:
+    """(id, payload) of the SSE events in lines; stop_after(payload) ends the read early."""
+    events = []
+    event_id = None
+    for line in lines:
+        if line.startswith('id: '):
+            event_id = line[4:]
+        elif line.startswith('data: '):
+            payload = json.loads(line[6:])
+            events.append((event_id, payload))
+            event_id = None
+            if stop_after is not None and stop_after(payload):
+                break
+    return events
+
+
+def start_and_drop(client, agent_id: int, chunks: int) -> list:
+    """Send a message and disconnect after the given number of chunk events."""
+    seen = []
+
+    def enough(payload):
+        seen.append(payload)
+        return sum(event.get('type') == 'chunk' for event in seen) >= chunks
+
+    with client.stream('POST', f'/chat/{agent_id}/send-stream', json={'message': 'tell me a story'}) as response:
+        response.raise_for_status()
+        events = read_events(response.iter_lines(), stop_after=enough)
+    return events
+
+
+def resume(client, agent_id: int, stream_id: str, last_event_id: str = None) -> list:
+    headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+    with client.stream('GET', f'/chat/{agent_id}/stream/{stream_id}', headers=headers) as response:
+        response.raise_for_status()
+        return read_events(response.iter_lines())
+
+
+def reply_of(events: list) -> str:
+    return ''.join(payload.get('content', '') for _, payload in events if payload['type'] in ('snapshot', 'chunk'))
+
+
+def wait_for_reply(client, agent_id: int, timeout: float = 10) -> str:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        messages = client.get(f'/chat/{agent_id}/history').json()['messages']
+        replies = [message['message'] for message in messages if message['sender'] == 'agent']
+        if replies:
+            return replies[-1]
+        time.sleep(0.05)
+    raise AssertionError('The reply was not stored')
+
+
+def test_reply_is_stored_after_the_client_leaves(chat):
+    client, agent_id = chat
+    events = start_and_drop(client, agent_id, chunks=1)
+    assert events[0][1]['type'] == 'start'
+    assert not any(payload['type'] == 'done' for _, payload in events)
+
+    stored = wait_for_reply(client, agent_id)
+    assert len(stored.split()) == REPLY_TOKENS
+    assert stored.startswith(reply_of(events))
+
+
+def test_resume_with_last_event_id_continues_where_the_client_left(chat):
+    client, agent_id = chat
+    events = start_and_drop(client, agent_id, chunks=2)
+    stream_id = events[0][1]['stream_id']
+    last_id = events[-1][0]
+    assert parse_last_event_id(last_id)[0] == stream_id
+
+    resumed = resume(client, agent_id, stream_id, last_id)
+    # Nothing is sent twice and nothing is missing
+    seqs = [parse_last_event_id(event_id)[1] for event_id, _ in events + resumed]
+    assert seqs == list(range(len(seqs)))
+    assert resumed[-1][1]['type'] == 'done'
+    assert reply_of(events) + reply_of(resumed) == wait_for_reply(client, agent_id)
+
+    # Without Last-Event-ID the whole stream is replayed
+    assert reply_of(resume(client, agent_id, stream_id)) == wait_for_reply(client, agent_id)
+
+
+def test_resume_after_the_log_moved_on_starts_with_a_snapshot(chat, monkeypatch):
+    client, agent_id = chat
+    monkeypatch.setattr(stream_sessions_module, 'STREAM_REPLAY_EVENTS', 3)
+    events = start_and_drop(client, agent_id, chunks=1)
+    stream_id = events[0][1]['stream_id']
+    stored = wait_for_reply(client, agent_id)
+
+    resumed = resume(client, agent_id, stream_id, events[-1][0])
+    first = resumed[0][1]
+    assert first['type'] == 'snapshot'
+    assert first['stream_id'] == stream_id
+    assert stored.startswith(first['content'])
+    assert reply_of(resumed) == stored
+    assert len(resumed) <= 4
+
+
+def test_resume_checks_owner_and_stream(chat, server_url):
+    client, agent_id = chat
+    events = start_and_drop(client, agent_id, chunks=1)
+    stream_id = events[0][1]['stream_id']
+
+    assert client.get(f'/chat/{agent_id}/stream/{uuid.uuid4().hex}').status_code == 404
+    assert client.get(f'/chat/{agent_id + 1}/stream/{stream_id}').status_code == 404
+    other = client.get(f'/chat/{agent_id}/stream/{stream_id}', headers={'Last-Event-ID': f'{uuid.uuid4().hex}:3'})
+    assert other.status_code == 400
+    with httpx.Client(base_url=server_url) as stranger:
+        assert stranger.get(f'/chat/{agent_id}/stream/{stream_id}').status_code == 401
+
+
+def test_registry_expires_finished_sessions_oldest_first():
+    registry = StreamRegistry(max_sessions=3, ttl=60)
+
+    async def generate(session):
+        session.emit({'type': 'start'})
+
+    async def run():
+        sessions = [registry.start(1, 1, generate) for _ in range(5)]
+        await asyncio.gather(*(session.task for session in sessions))
+        return sessions
+
+    sessions = asyncio.run(run())
+    assert len(registry) == 5
+    assert registry.get(sessions[0].stream_id) is None
+    assert len(registry) == 3
+    assert [registry.get(session.stream_id) is not None for session in sessions] == [False, False, True, True, True]
+
+    registry.ttl = 0
+    time.sleep(0.01)
+    assert registry.get(sessions[-1].stream_id) is None
+    assert len(registry) == 0
@@ -15,6 +15,7 @@ export default function AgentChat() {
   const [error, setError] = useState('');
   const [agentInfo, setAgentInfo] = useState(null);
   const [waitingForResponse, setWaitingForResponse] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
   const messagesEndRef = useRef(null);
   const { token } = useAuth();
   const navigate = useNavigate();
@@ -46,7 +47,8 @@ export default function AgentChat() {
     try {
       setLoading(true);
       const res = await axios.get(`${API_BASE}/chat/${id}/history`);
-      setMsgs(res.data);
+      setMsgs(res.data.messages);
+      setNextCursor(res.data.next_cursor);
       setError('');
     } catch (err) {
       setError('Failed to load chat history: ' + (err.response?.data?.detail || err.message));
@@ -58,6 +60,17 @@ export default function AgentChat() {
     }
   };
 
+  const loadOlder = async () => {
+    if (!nextCursor) return;
+    try {
+      const res = await axios.get(`${API_BASE}/chat/${id}/history`, { params: { before_id: nextCursor } });
+      setMsgs(prev => [...res.data.messages, ...prev]);
+      setNextCursor(res.data.next_cursor);
+    } catch (err) {
+      setError('Failed to load older messages: ' + (err.response?.data?.detail || err.message));
+    }
+  };
+
   const send = async (e) => {
     e.preventDefault();
     if (!text.trim() || sending) return;
@@ -78,7 +91,7 @@ export default function AgentChat() {
     setMsgs(prev => [...prev, tempUserMsg]);
 
     try {
-      const response = await fetch(`${API_BASE}/chat/${id}/send-stream`, {
+      let response = await fetch(`${API_BASE}/chat/${id}/send-stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -91,74 +104,118 @@ export default function AgentChat() {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder();
       let buffer = '';
       let userMessageId = null;
       let botMessageId = null;
       let accumulatedResponse = '';
       let tempAgentMsgId = null;
       let firstChunk = true;
+      // The server keeps generating if the connection drops; resume from the last event seen
+      let streamId = null;
+      let lastEventId = null;
+      let finished = false;
+      let reconnects = 0;
+
+      const showPartialResponse = () => {
+        setWaitingForResponse(false);
+        // Create agent message on first chunk
+        if (firstChunk) {
+          firstChunk = false;
+          tempAgentMsgId = Date.now();
+          setMsgs(prev => [...prev, {
+            id: tempAgentMsgId,
+            sender: 'agent',
+            message: accumulatedResponse,
+            created_at: new Date().toISOString(),
+            isStreaming: true
+          }]);
+        } else {
+          // Update the streaming message
+          setMsgs(prev => prev.map(msg => 
+            msg.id === tempAgentMsgId 
+              ? { ...msg, message: accumulatedResponse, isStreaming: true }
+              : msg
+          ));
+        }
+      };
+
+      while (!finished) {
+        try {
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          buffer = '';
 
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
 
-        buffer += decoder.decode(value, { stream: true });
-        const lines = buffer.split('\n');
-        buffer = lines.pop() || '';
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop() || '';
 
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            try {
-              const data = JSON.parse(line.slice(6));
-              
-              if (data.type === 'start') {
-                userMessageId = data.user_message_id;
-                // Replace temp user message with real one
-                setMsgs(prev => {
-                  const filtered = prev.filter(m => m.id !== tempUserMsg.id);
-                  return [...filtered, 
-                    { id: userMessageId, sender: 'user', message: userMessage, created_at: new Date().toISOString() }
-                  ];
-                });
-              } else if (data.type === 'chunk') {
-                accumulatedResponse += data.content;
-                setWaitingForResponse(false);
-                // Create agent message on first chunk
-                if (firstChunk) {
-                  firstChunk = false;
-                  tempAgentMsgId = Date.now();
-                  setMsgs(prev => [...prev, {
-                    id: tempAgentMsgId,
-                    sender: 'agent',
-                    message: accumulatedResponse,
-                    created_at: new Date().toISOString(),
-                    isStreaming: true
-                  }]);
-                } else {
-                  // Update the streaming message
-                  setMsgs(prev => prev.map(msg => 
-                    msg.id === tempAgentMsgId 
-                      ? { ...msg, message: accumulatedResponse, isStreaming: true }
-                      : msg
-                  ));
+            for (const line of lines) {
+              if (line.startsWith('id: ')) {
+                lastEventId = line.slice(4);
+              } else if (line.startsWith('data: ')) {
+                try {
+                  const data = JSON.parse(line.slice(6));
+                  
+                  if (data.type === 'start') {
+                    userMessageId = data.user_message_id;
+                    streamId = data.stream_id;
+                    // Replace temp user message with real one
+                    setMsgs(prev => {
+                      const filtered = prev.filter(m => m.id !== tempUserMsg.id);
+                      return [...filtered, 
+                        { id: userMessageId, sender: 'user', message: userMessage, created_at: new Date().toISOString() }
+                      ];
+                    });
+                  } else if (data.type === 'snapshot') {
+                    // Sent on resume when the missed chunks are no longer kept individually
+                    streamId = data.stream_id;
+                    accumulatedResponse = data.content;
+                    showPartialResponse();
+                  } else if (data.type === 'chunk') {
+                    accumulatedResponse += data.content;
+                    showPartialResponse();
+                  } else if (data.type === 'done') {
+                    finished = true;
+                    botMessageId = data.bot_message_id;
+                    // The reply is the accumulated chunks; full_response is only sent if the server is configured to
+                    const finalResponse = data.full_response ?? accumulatedResponse;
+                    // Replace temp agent message with final one (remove isStreaming)
+                    setMsgs(prev => prev.map(msg => 
+                      msg.id === tempAgentMsgId 
+                        ? { id: botMessageId, sender: 'agent', message: finalResponse, created_at: new Date().toISOString() }
+                        : msg
+                    ));
+                  } else if (data.type === 'error') {
+                    finished = true;
+                    throw new Error(data.message);
+                  }
+                } catch (parseErr) {
+                  console.error('Error parsing SSE data:', parseErr);
                 }
-              } else if (data.type === 'done') {
-                botMessageId = data.bot_message_id;
-                // Replace temp agent message with final one (remove isStreaming)
-                setMsgs(prev => prev.map(msg => 
-                  msg.id === tempAgentMsgId 
-                    ? { id: botMessageId, sender: 'agent', message: data.full_response, created_at: new Date().toISOString() }
-                    : msg
-                ));
-              } else if (data.type === 'error') {
-                throw new Error(data.message);
               }
-            } catch (parseErr) {
-              console.error('Error parsing SSE data:', parseErr);
             }
           }
+          if (!finished && streamId) {
+            throw new Error('Stream interrupted');
+          }
+          finished = true;
+        } catch (streamErr) {
+          if (finished || !streamId || reconnects >= 3) throw streamErr;
+          reconnects += 1;
+          await new Promise(resolve => setTimeout(resolve, 500 * reconnects));
+          response = await fetch(`${API_BASE}/chat/${id}/stream/${streamId}`, {
+            headers: {
+              'Authorization': `Bearer ${token}`,
+              ...(lastEventId ? { 'Last-Event-ID': lastEventId } : {})
+            }
+          });
+          if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+          }
         }
       }
     } catch (err) {
@@ -206,6 +263,11 @@ export default function AgentChat() {
       {error && <div className="error-message">{error}</div>}
 
       <div className="chat-messages">
+        {nextCursor && (
+          <button type="button" className="btn-link" onClick={loadOlder}>
+            Load older messages
+          </button>
+        )}
         {msgs.length === 0 ? (
           <div className="empty-chat">
             <p>No messages yet. Start a conversation with your agent!</p>
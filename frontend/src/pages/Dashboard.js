@@ -49,7 +49,8 @@ export default function Dashboard() {
       return;
     }
 
-    if (!form.api_key.trim()) {
+    // The fake provider runs locally and needs no key
+    if (form.provider !== 'fake' && !form.api_key.trim()) {
       setError('An API key is required for the selected model.');
       return;
     }
@@ -171,6 +172,7 @@ export default function Dashboard() {
                   <option value="openai">OpenAI / Azure OpenAI</option>
                   <option value="gemini">Google Gemini</option>
                   <option value="fireworks">Fireworks.ai</option>
+                  <option value="fake">Fake (local testing, no API key)</option>
                 </select>
                 <small>Currently supported providers.</small>
               </div>
@@ -227,14 +229,14 @@ export default function Dashboard() {
             </div>
 
             <div className="form-group">
-              <label>Provider API Key *</label>
+              <label>Provider API Key{form.provider === 'fake' ? '' : ' *'}</label>
               <input
                 type="password"
                 placeholder="sk-***************************"
                 value={form.api_key}
                 onChange={e => setForm({ ...form, api_key: e.target.value })}
                 autoComplete="off"
-                required
+                required={form.provider !== 'fake'}
               />
               <small>Stored securely and sent only to your provider for this agent.</small>
             </div>